@@ -13,6 +13,7 @@ from django.urls import path
 
 from general_models.models import NewValute
 from general_models.utils.endpoints import try_generate_icon_url
+from general_models.utils.cache import bump_directions_version
 
 from .periodic_tasks import (manage_periodic_task_for_create,
                              manage_periodic_task_for_update,
@@ -429,6 +430,8 @@ class NewDirectionAdmin(NewBaseDirectionAdmin):
                 try:
                     NewDirection.objects.bulk_create(create_list,
                                                      ignore_conflicts=True)
+                    # bulk_create не вызывает сигналы
+                    bump_directions_version()
                     self.message_user(request, "Направления успешно созданы")
                 except Exception as ex:
                     print(ex)
@@ -13,6 +13,7 @@ from general_models.utils.endpoints import (get_valute_json,
                                             test_new_get_exchange_direction_list_with_aml,
                                             try_generate_icon_url)
 from general_models.utils.base import annotate_string_field
+from general_models.utils.direction_expiry import get_not_expired_filter
 
 from partners.utils.endpoints import (get_partner_directions_with_location,
                                       test_get_partner_directions_with_aml,
@@ -243,7 +244,8 @@ def cash_valutes(request: Request,
                                                     'direction',
                                                     'direction__valute_from',
                                                     'direction__valute_to')\
-                                    .filter(city__code_name=city,
+                                    .filter(get_not_expired_filter(),
+                                            city__code_name=city,
                                             is_active=True,
                                             exchange__is_active=True)
     partner_queries = NewPartnerDirection.objects\
@@ -323,7 +325,8 @@ def cash_exchange_directions(request: Request,
                                                 #   country_cities_prefetch,
                                                   'country_direction__country__working_days')\
                                 .annotate(direction_marker=annotate_string_field('auto_cash'))\
-                                .filter(city__code_name=city,
+                                .filter(get_not_expired_filter(),
+                                        city__code_name=city,
                                         direction__valute_from=valute_from,
                                         direction__valute_to=valute_to,
                                         is_active=True,
@@ -387,7 +390,8 @@ def test_cash_exchange_directions(request: Request,
                                                 #   country_cities_prefetch,
                                                   'country_direction__country__working_days')\
                                 .annotate(direction_marker=annotate_string_field('auto_cash'))\
-                                .filter(city__code_name=city,
+                                .filter(get_not_expired_filter(),
+                                        city__code_name=city,
                                         direction__valute_from=valute_from,
                                         direction__valute_to=valute_to,
                                         is_active=True,
@@ -447,7 +451,8 @@ def cash_exchange_directions_with_location(request: Request,
                                 .prefetch_related(country_direction_rate_prefetch,
                                                   'country_direction__country__working_days')\
                                 .annotate(direction_marker=annotate_string_field('auto_cash'))\
-                                .filter(direction__valute_from=valute_from,
+                                .filter(get_not_expired_filter(),
+                                        direction__valute_from=valute_from,
                                         direction__valute_to=valute_to,
                                         is_active=True,
                                         exchange__is_active=True)\
@@ -527,7 +532,8 @@ def test_cash_exchange_directions_with_location(request: Request,
                                 .prefetch_related(country_direction_rate_prefetch,
                                                   'country_direction__country__working_days')\
                                 .annotate(direction_marker=annotate_string_field('auto_cash'))\
-                                .filter(direction__valute_from=valute_from,
+                                .filter(get_not_expired_filter(),
+                                        direction__valute_from=valute_from,
                                         direction__valute_to=valute_to,
                                         is_active=True,
                                         exchange__is_active=True)\
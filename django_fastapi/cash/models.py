@@ -298,6 +298,11 @@ class NewExchangeDirection(BaseExchangeDirection):
                                           default=None)
     fromfee = models.FloatField('Процент', blank=True, null=True)
     params = models.CharField('Параметры', max_length=100, blank=True, null=True)
+    expires_at = models.DateTimeField('Активно до',
+                                      blank=True,
+                                      null=True,
+                                      default=None,
+                                      db_index=True)
 
     class Meta:
         # unique_together = (("exchange", "city", "valute_from", "valute_to"), )
@@ -366,10 +371,13 @@ class NewExchangeLinkCount(NewBaseExchangeLinkCount):
                              on_delete=models.CASCADE,
                              verbose_name='Гостевой пользователь',
                              related_name='new_cash_exchange_counts')
+    # без внешнего ключа в БД - таблица направлений может быть
+    # секционирована (partition_exchange_directions), SET_NULL выполняет Django
     exchange_direction = models.ForeignKey(NewExchangeDirection,
                                            on_delete=models.SET_NULL,
                                            verbose_name='Готовое направление',
                                            related_name='exchange_direction_counts',
                                            blank=True,
                                            null=True,
-                                           default=None)
\ No newline at end of file
+                                           default=None,
+                                           db_constraint=False)
\ No newline at end of file
@@ -9,13 +9,15 @@ from django_celery_beat.models import PeriodicTask
 
 from general_models.utils.endpoints import send_review_notifitation_to_exchange_admin
 from general_models.utils.base import get_actual_datetime
+from general_models.utils.cache import bump_directions_version
 
 from general_models.models import ExchangeAdmin
 
 from .models import (Exchange,
                      Direction,
                      ExchangeDirection,
-                     NewDirection)
+                     NewDirection,
+                     City)
 from .periodic_tasks import (manage_periodic_task_for_create,
                              manage_periodic_task_for_update,
                              manage_periodic_task_for_parse_black_list)
@@ -61,6 +63,16 @@ def new_try_create_reverse_direction(sender, instance, **kwargs):
         except Exception:
             pass
 
+#Сигнал для смены версии справочника направлений,
+#по которому парсятся XML файлы обменников
+@receiver(post_save, sender=NewDirection)
+@receiver(post_delete, sender=NewDirection)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def change_directions_version(sender, instance, **kwargs):
+    bump_directions_version()
+
+
 #Сигнал для удаления всех связанных готовых направлений
 #при удалении направления из БД
 # @receiver(post_delete, sender=Direction)
@@ -10,6 +10,7 @@ import partners.models as partner_models
 from cash.models import Country
 from cash.schemas import MultipleName, RuEnCountryModel
 
+from general_models.utils.direction_expiry import get_not_expired_filter
 from general_models.utils.endpoints import try_generate_icon_url
 from general_models.utils.http_exc import http_exception_json
 
@@ -145,6 +146,7 @@ def get_available_countries3(countries):
 def get_available_countries(request: Request):
 
     city_cash_direction_exists = cash_models.NewExchangeDirection.objects.filter(
+        get_not_expired_filter(),
         city=OuterRef('pk'),
         is_active=True,
         exchange__is_active=True
@@ -173,6 +175,7 @@ def get_available_countries(request: Request):
     prefetch_cities = Prefetch('cities', prefetch_cities_queryset)
 
     country_cash_direction_exists = cash_models.NewExchangeDirection.objects.filter(
+        get_not_expired_filter(),
         city__country=OuterRef('pk'),
         is_active=True,
         exchange__is_active=True
@@ -208,6 +211,7 @@ def get_available_countries(request: Request):
 def test_get_available_countries(request: Request):
 
     city_cash_direction_exists = cash_models.NewExchangeDirection.objects.filter(
+        get_not_expired_filter(),
         city=OuterRef('pk'),
         is_active=True,
         exchange__is_active=True
@@ -234,6 +238,7 @@ def test_get_available_countries(request: Request):
     prefetch_cities = Prefetch('cities', prefetch_cities_queryset)
 
     country_cash_direction_exists = cash_models.NewExchangeDirection.objects.filter(
+        get_not_expired_filter(),
         city__country=OuterRef('pk'),
         is_active=True,
         exchange__is_active=True
@@ -16,6 +16,15 @@ CSRF_TOKEN = os.environ.get('CSRF_TOKEN')
 
 # SELENIUM
 SELENIUM_DRIVER = os.environ.get('SELENIUM_DRIVER')
+# сколько сессий браузера одновременно собирают отзывы
+# (не больше SE_NODE_MAX_SESSIONS контейнера selenium)
+REVIEW_SELENIUM_SESSIONS = int(os.environ.get('REVIEW_SELENIUM_SESSIONS', 5))
+
+# EXCHANGE INFO
+# страницы обменников на bestchange: сколько запросов одновременно
+# и сколько секунд хранится собранная информация (повторно не запрашивается)
+EXCHANGE_INFO_CONCURRENCY = int(os.environ.get('EXCHANGE_INFO_CONCURRENCY', 10))
+EXCHANGE_INFO_CACHE_TTL = int(os.environ.get('EXCHANGE_INFO_CACHE_TTL', 60 * 60 * 24))
 
 #PGBOUNCER
 PGBOUNCER_HOST = os.environ.get('PGBOUNCER_HOST')
@@ -37,4 +46,56 @@ SUB_REDIS_URL = f"redis://:{SUB_REDIS_PASSWORD}@{SUB_REDIS_HOST}:{SUB_REDIS_PORT
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
 JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM')
 
-DEV_HANDLER_SECRET = os.environ.get('DEV_HANDLER_SECRET')
\ No newline at end of file
+DEV_HANDLER_SECRET = os.environ.get('DEV_HANDLER_SECRET')
+
+# XML PARSE
+# пакетный парсинг XML файлов, полученных за один цикл get_xml_file_for_exchangers
+XML_PARSE_BATCH_MODE = os.environ.get('XML_PARSE_BATCH_MODE', 'false').lower() == 'true'
+XML_PARSE_BATCH_SIZE = int(os.environ.get('XML_PARSE_BATCH_SIZE', 100))
+XML_PARSE_WORKERS = int(os.environ.get('XML_PARSE_WORKERS', 4))
+XML_PARSE_TRANSACTION_SIZE = int(os.environ.get('XML_PARSE_TRANSACTION_SIZE', 20))
+# сколько обменников с наибольшим числом переходов парсятся в приоритетной полосе (вместе с VIP)
+XML_PRIORITY_TRAFFIC_TOP = int(os.environ.get('XML_PRIORITY_TRAFFIC_TOP', 20))
+
+# FEED REJECTIONS
+# сколько последних циклов с отклонёнными элементами XML хранится по обменнику,
+# сколько примеров ключей хранится по каждой причине
+FEED_REJECTION_KEEP = int(os.environ.get('FEED_REJECTION_KEEP', 50))
+FEED_REJECTION_SAMPLE_SIZE = int(os.environ.get('FEED_REJECTION_SAMPLE_SIZE', 10))
+
+# FEED HEALTH
+# размер кольцевых буферов здоровья XML файлов обменника в кэше:
+# последних опросов и почасовых агрегатов (7 дней)
+FEED_HEALTH_RING_SIZE = int(os.environ.get('FEED_HEALTH_RING_SIZE', 256))
+FEED_HEALTH_HOURS = int(os.environ.get('FEED_HEALTH_HOURS', 24 * 7))
+
+# XML SHARDING
+# имя шарда опроса XML файлов (run_xml_fetcher --shard), пусто - без шардирования,
+# точек шарда на кольце консистентного хеширования,
+# парсинг в очередях шарда (cpu_queue.<шард>, cpu_priority_queue.<шард>) на воркерах того же узла
+XML_SHARD_NAME = os.environ.get('XML_SHARD_NAME') or None
+XML_SHARD_VNODES = int(os.environ.get('XML_SHARD_VNODES', 64))
+XML_SHARD_PARSE_AFFINITY = os.environ.get('XML_SHARD_PARSE_AFFINITY', 'false').lower() == 'true'
+
+# XML LIMITS
+# общие ограничения XML файла обменника (0 - без ограничения),
+# у обменника могут быть свои (xml_max_size, xml_max_items в админке)
+XML_MAX_SIZE = int(os.environ.get('XML_MAX_SIZE', 50 * 1024 * 1024))
+XML_MAX_ITEMS = int(os.environ.get('XML_MAX_ITEMS', 200_000))
+
+# XML SNAPSHOTS
+# сжатые версии XML файлов обменников (каталог, сколько версий и сколько секунд хранить)
+XML_SNAPSHOT_DIR = os.environ.get('XML_SNAPSHOT_DIR', './xml_files')
+XML_SNAPSHOT_KEEP = int(os.environ.get('XML_SNAPSHOT_KEEP', 10))
+XML_SNAPSHOT_MAX_AGE = int(os.environ.get('XML_SNAPSHOT_MAX_AGE', 60 * 60 * 24 * 7))
+
+# DIRECTION EXPIRY
+# срок жизни готовых направлений из XML файлов (сек),
+# размер пачки и пауза (сек) между пачками при деактивации истёкших направлений
+DIRECTION_TTL = int(os.environ.get('DIRECTION_TTL', 60 * 60))
+DIRECTION_COMPACT_CHUNK_SIZE = int(os.environ.get('DIRECTION_COMPACT_CHUNK_SIZE', 500))
+DIRECTION_COMPACT_PAUSE = float(os.environ.get('DIRECTION_COMPACT_PAUSE', 0.2))
+
+# PROMETHEUS
+# общий том с каталогами метрик всех сервисов (PROMETHEUS_MULTIPROC_DIR - каталог сервиса)
+PROMETHEUS_METRICS_DIR = os.environ.get('PROMETHEUS_METRICS_DIR')
@@ -11,6 +11,8 @@ from django.http.request import HttpRequest
 from django.contrib.admin import AdminSite
 from django.contrib.admin.models import LogEntry
 from django.utils import timezone
+from django.urls import path
+from django.shortcuts import render
 from django.db import transaction
 
 from django_celery_beat.models import (SolarSchedule,
@@ -31,6 +33,8 @@ from partners.utils.periodic_tasks import edit_time_for_task_check_directions_on
 from .periodic_tasks import manage_periodic_task_for_parse_directions
 from .utils.admin import NewUTMSourceFilter, ReviewAdminMixin, DateTimeRangeFilter, UTMSourceFilter
 from .utils.endpoints import try_generate_icon_url
+from .utils.exchanger_status import record_exchanger_status, get_exchangers_uptime
+from .utils.feed_health import FEED_HEALTH_WINDOWS, get_feed_health
 from .utils.redis import (EventNotificatonEnum,
                           publish_review_notification_to_exchange_admin,
                           publish_comment_notification_to_exchange_admin,
@@ -53,7 +57,9 @@ from .models import (AdminComment,
                      Comment,
                      NewExchangeAdmin,
                      NewExchangeAdminOrder,
-                     ExchangeLinkCount)
+                     ExchangeLinkCount,
+                     FeedRejectionStat,
+                     ExchangerStatusHistory)
 from .tasks import send_review_notification_to_exchange_admin_task
 
 from no_cash import models as no_cash_models
@@ -726,6 +732,7 @@ class NewBaseExchangeAdmin(admin.ModelAdmin):
         'get_total_direction_count',
         'get_icon',
         'link_count',
+        'get_uptime',
         )
     
     list_editable = (
@@ -744,6 +751,17 @@ class NewBaseExchangeAdmin(admin.ModelAdmin):
             return mark_safe(f"<img src='{icon_url}' width=40")
 
     get_icon.short_description = 'Иконка'
+
+    def get_uptime(self, obj):
+        if obj.pk is None:
+            return None
+
+        uptime = get_exchangers_uptime([obj.pk]).get(obj.pk)
+
+        if uptime is not None:
+            return f'{uptime * 100:.1f}%'
+
+    get_uptime.short_description = 'Доступность за 7 дней'
     
     fieldsets = [
         (
@@ -768,6 +786,8 @@ class NewBaseExchangeAdmin(admin.ModelAdmin):
                     # "period_for_create",
                     "timeout",
                     "is_parse",
+                    "xml_max_size",
+                    "xml_max_items",
                 ],
                 'classes': [
                     'collapse',
@@ -800,6 +820,7 @@ class NewBaseExchangeAdmin(admin.ModelAdmin):
                 'fields': [
                     "get_total_direction_count",
                     "link_count",
+                    "get_uptime",
                 ],
             },
         ),
@@ -1424,6 +1445,51 @@ class ExchangerAdmin(NewBaseExchangeAdmin):
         LinkedUrlStacked,
         ]
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                'feed-health/',
+                self.admin_site.admin_view(self.feed_health_view),
+                name='exchanger_feed_health',
+            ),
+        ]
+        return custom_urls + urls
+
+    def feed_health_view(self, request):
+        # здоровье XML файлов обменников из кольцевых буферов в кэше
+        exchanger_names = dict(Exchanger.objects.filter(xml_url__isnull=False)\
+                                                .values_list('pk', 'name'))
+
+        window = request.GET.get('window', '24h')
+
+        if window not in FEED_HEALTH_WINDOWS:
+            window = '24h'
+
+        rows = [
+            {
+                'exchange_id': exchange_id,
+                'name': exchanger_names[exchange_id],
+                'status': health['status'],
+                **health['windows'][window],
+            }
+            for exchange_id, health in get_feed_health(list(exchanger_names)).items()
+        ]
+
+        # сначала медленные и нестабильные
+        rows.sort(key=lambda row: (row['uptime'] if row['uptime'] is not None else 100,
+                                   -(row['p95'] or 0)))
+
+        context = dict(
+            self.admin_site.each_context(request),
+            rows=rows,
+            window=window,
+            windows=FEED_HEALTH_WINDOWS.keys(),
+            title='Здоровье XML файлов обменников',
+        )
+
+        return render(request, "admin/feed_health.html", context)
+
     def get_total_direction_count(self, obj):
         direction_count = 0
 
@@ -1456,6 +1522,10 @@ class ExchangerAdmin(NewBaseExchangeAdmin):
         # print(obj.__dict__)
         update_fields = set()
 
+        # статус до изменения - для истории статусов обменника
+        prev_status = (form.initial.get('is_active', obj.is_active),
+                       form.initial.get('active_status', obj.active_status))
+
         if change: 
             # print(form.cleaned_data.items())
             for key, value in form.cleaned_data.items():
@@ -1495,6 +1565,11 @@ class ExchangerAdmin(NewBaseExchangeAdmin):
                     update_fields.add(key)
 
             obj.save(update_fields=list(update_fields))
+
+            if prev_status != (obj.is_active, obj.active_status):
+                record_exchanger_status(obj,
+                                        *prev_status,
+                                        source='admin')
         else:
             if obj.active_status in ('disabled', 'scam', 'skip'):
                 obj.is_active = False
@@ -1606,4 +1681,90 @@ class ExchangeLinkCountAdmin(admin.ModelAdmin):
                                                             'city')
     
     def has_add_permission(self, request):
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(FeedRejectionStat)
+class FeedRejectionStatAdmin(admin.ModelAdmin):
+    list_display = (
+        'exchange',
+        'time_create',
+        'item_count',
+        'get_rejected_count',
+        'unknown_pair',
+        'unknown_city',
+        'missing_fields',
+        'invalid_min_max',
+        'normalize_error',
+        'duble',
+    )
+    readonly_fields = (
+        'exchange',
+        'time_create',
+        'item_count',
+        'missing_pair',
+        'unknown_pair',
+        'unknown_city',
+        'missing_fields',
+        'invalid_min_max',
+        'normalize_error',
+        'duble',
+        'item_error',
+        'samples',
+    )
+
+    list_filter = (
+        'exchange',
+        CustomDateTimeFilter,
+    )
+
+    @admin.display(description='Отклонено')
+    def get_rejected_count(self, obj):
+        return obj.rejected_count
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('exchange')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ExchangerStatusHistory)
+class ExchangerStatusHistoryAdmin(admin.ModelAdmin):
+    list_display = (
+        'exchange',
+        'prev_active_status',
+        'active_status',
+        'is_active',
+        'source',
+        'time_create',
+    )
+    readonly_fields = (
+        'exchange',
+        'time_create',
+        'is_active',
+        'active_status',
+        'prev_is_active',
+        'prev_active_status',
+        'source',
+    )
+
+    list_filter = (
+        'exchange',
+        'source',
+        'active_status',
+        CustomDateTimeFilter,
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('exchange')
+
+    # история только дополняется
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
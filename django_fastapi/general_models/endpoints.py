@@ -1,5 +1,4 @@
 import json
-import re
 
 from time import time
 from typing import List, Union, Literal
@@ -22,6 +21,7 @@ from django.utils import timezone
 from fastapi import APIRouter, Request, Depends, HTTPException
 
 from .utils.endpoints import get_valute_json
+from .utils.parse_exchange_info.queries import parse_relative_date
 from general_models.models import (ExchangeAdmin,
                                    NewBaseAdminComment,
                                    NewBaseComment,
@@ -40,6 +40,7 @@ from general_models.models import (ExchangeAdmin,
                                    NewExchangeAdminOrder,
                                    ExchangeLinkCount,
                                    en_type_valute_dict)
+from general_models.utils.direction_expiry import get_not_expired_filter
 from general_models.utils.endpoints import (availabale_active_status_list,
                                             get_exchange,
                                             get_review_count_dict)
@@ -97,6 +98,8 @@ from .utils.endpoints import (check_exchage_by_name,
                               generate_image_icon2,
                               generate_coin_for_schema,
                               send_review_notifitation)
+from .utils.feed_rejections import get_feed_rejections
+from .utils.feed_health import get_feed_health
 
 from .schemas import (NewAddCommentSchema,
                       NewAddReviewSchema,
@@ -220,26 +223,6 @@ def recreate_directions_records(secret: str):
 
 
 
-def parse_relative_date(text: str):
-    """
-    Преобразует строку вроде '1 год 3 месяца', '3 месяца', '2 года'
-    в datetime.
-    """
-    years, months = 0, 0
-
-    # ищем годы
-    match_years = re.search(r"(\d+)\s*(год|года|лет)", text)
-    if match_years:
-        years = int(match_years.group(1))
-
-    # ищем месяцы
-    match_months = re.search(r"(\d+)\s*(месяц|месяца|месяцев)", text)
-    if match_months:
-        months = int(match_months.group(1))
-
-    return timezone.now() - relativedelta(years=years, months=months)
-
-
 def format_relative_date(dt: datetime) -> str:
     """
     Преобразует datetime в строку вроде '1 год 3 месяца', '3 месяца', '2 года'.
@@ -1346,6 +1329,48 @@ def increase_popular_count(data: IncreasePopularCountSchema):
                 'detail': 'increase popular count successfully'}
 
 
+@test_router.get('/feed_rejections')
+def feed_rejections(secret: str,
+                    exchange_id: int = None,
+                    limit: int = 100):
+    '''
+    Отклонённые элементы XML файлов обменников по циклам парсинга
+    (счётчики по причинам и примеры ключей)
+    '''
+    if secret != DEV_HANDLER_SECRET:
+        raise HTTPException(status_code=400)
+
+    return get_feed_rejections(exchange_id,
+                               limit=min(limit, 1000))
+
+
+@test_router.get('/feed_health')
+def feed_health(secret: str,
+                exchange_id: int = None):
+    '''
+    Здоровье XML файлов обменников по окнам 1h/24h/7d: перцентили
+    времени получения, доступность и частота смены статуса
+    '''
+    if secret != DEV_HANDLER_SECRET:
+        raise HTTPException(status_code=400)
+
+    exchangers = Exchanger.objects.filter(xml_url__isnull=False)
+
+    if exchange_id is not None:
+        exchangers = exchangers.filter(pk=exchange_id)
+
+    exchanger_names = dict(exchangers.values_list('pk', 'name'))
+
+    return [
+        {
+            'exchange_id': _exchange_id,
+            'exchange_name': exchanger_names[_exchange_id],
+            **health,
+        }
+        for _exchange_id, health in get_feed_health(list(exchanger_names)).items()
+    ]
+
+
 @test_router.post('/increase_link_count')
 def increase_link_count(data: IncreaseExchangeLinkCountSchema):
     valute_from, valute_to = data.valute_from.upper(), data.valute_to.upper()
@@ -1795,7 +1820,8 @@ def new_get_random_directions(segment_marker: Literal['cash',
         case 'no_cash':
             exchange_direction_pks = no_cash_models.NewExchangeDirection.objects\
                                                 .select_related('exchange')\
-                                                .filter(exchange__is_active=True,
+                                                .filter(get_not_expired_filter(),
+                                                        exchange__is_active=True,
                                                         is_active=True)\
                                                 .order_by('direction_id')\
                                                 .distinct('direction_id')\
@@ -1810,7 +1836,8 @@ def new_get_random_directions(segment_marker: Literal['cash',
         case 'cash':
             exchange_direction_pks = cash_models.NewExchangeDirection.objects\
                                                 .select_related('exchange')\
-                                                .filter(exchange__is_active=True,
+                                                .filter(get_not_expired_filter(),
+                                                        exchange__is_active=True,
                                                         is_active=True)\
                                                 .order_by('direction_id')\
                                                 .distinct('direction_id')\
@@ -1825,7 +1852,8 @@ def new_get_random_directions(segment_marker: Literal['cash',
         case 'both':
             no_cash_exchange_direction_pks = no_cash_models.NewExchangeDirection.objects\
                                                 .select_related('exchange')\
-                                                .filter(exchange__is_active=True,
+                                                .filter(get_not_expired_filter(),
+                                                        exchange__is_active=True,
                                                         is_active=True)\
                                                 .order_by('direction_id')\
                                                 .distinct('direction_id')\
@@ -1840,7 +1868,8 @@ def new_get_random_directions(segment_marker: Literal['cash',
             
             cash_exchange_direction_pks = cash_models.NewExchangeDirection.objects\
                                                 .select_related('exchange')\
-                                                .filter(exchange__is_active=True,
+                                                .filter(get_not_expired_filter(),
+                                                        exchange__is_active=True,
                                                         is_active=True)\
                                                 .order_by('direction_id')\
                                                 .distinct('direction_id')\
@@ -2000,7 +2029,8 @@ def new_get_similar_directions(segment_marker: Literal['no_cash',
                                                                     'exchange')\
                                                     .exclude(direction__valute_from_id=valute_from,
                                                              direction__valute_to_id=valute_to)\
-                                                    .filter(similar_direction_filter)\
+                                                    .filter(similar_direction_filter,
+                                                            get_not_expired_filter())\
                                                     .values_list('direction__pk',
                                                                  flat=True)
 
@@ -2057,7 +2087,8 @@ def new_get_similar_directions(segment_marker: Literal['no_cash',
                                                     .exclude(city__code_name=city,
                                                              direction__valute_from=valute_from,
                                                              direction__valute_to=valute_to)\
-                                                    .filter(similar_direction_filter)\
+                                                    .filter(similar_direction_filter,
+                                                            get_not_expired_filter())\
                                                     .values_list('direction__pk',
                                                                  flat=True)\
                                                     .all()
@@ -2252,7 +2283,8 @@ def new_get_similar_cities_by_direction(valute_from: str,
                                                                 'exchange',
                                                                 'city')\
                                                     .exclude(city__code_name=city)\
-                                                    .filter(direction__valute_from_id=valute_from,
+                                                    .filter(get_not_expired_filter(),
+                                                            direction__valute_from_id=valute_from,
                                                             direction__valute_to_id=valute_to,
                                                             is_active=True,
                                                             exchange__is_active=True)\
@@ -2299,7 +2331,8 @@ def new_get_similar_cities_by_direction(valute_from: str,
 
         exchange_count_filter = Q(new_cash_directions__direction_id=direction_id,
                                 new_cash_directions__exchange__is_active=True,
-                                new_cash_directions__is_active=True)
+                                new_cash_directions__is_active=True)\
+                                & get_not_expired_filter('new_cash_directions__')
         partner_city_exchange_count_filter = Q(new_partner_cities__partner_directions__direction_id=direction_id,
                                         new_partner_cities__partner_directions__is_active=True)
         partner_country_exchange_count_filter = Q(country__new_partner_countries__partner_directions__direction_id=direction_id,
@@ -2360,7 +2393,8 @@ def new_get_extended_similar_cities_by_direction(valute_from: str,
                                                                 'exchange',
                                                                 'city')\
                                                     .exclude(city__code_name=city)\
-                                                    .filter(direction__valute_from_id=valute_from,
+                                                    .filter(get_not_expired_filter(),
+                                                            direction__valute_from_id=valute_from,
                                                             direction__valute_to_id=valute_to,
                                                             is_active=True,
                                                             exchange__is_active=True)\
@@ -2407,7 +2441,8 @@ def new_get_extended_similar_cities_by_direction(valute_from: str,
 
         exchange_count_filter = Q(new_cash_directions__direction_id=direction_id,
                                 new_cash_directions__exchange__is_active=True,
-                                new_cash_directions__is_active=True)
+                                new_cash_directions__is_active=True)\
+                                & get_not_expired_filter('new_cash_directions__')
         partner_city_exchange_count_filter = Q(new_partner_cities__partner_directions__direction_id=direction_id,
                                         new_partner_cities__partner_directions__is_active=True)
         partner_country_exchange_count_filter = Q(country__new_partner_countries__partner_directions__direction_id=direction_id,
@@ -3154,7 +3189,8 @@ def new_get_all_directions_by_exchange(exchange_id: int):
     no_cash_exchange_directions = no_cash_models.NewExchangeDirection.objects.select_related('exchange',
                                                                                        'direction__valute_from',
                                                                                        'direction__valute_to')\
-                                                                        .filter(exchange_id=exchange_id,
+                                                                        .filter(get_not_expired_filter(),
+                                                                                exchange_id=exchange_id,
                                                                                 is_active=True,
                                                                                 exchange__is_active=True)\
                                                                         .values_list('direction_id', flat=True)\
@@ -3174,7 +3210,8 @@ def new_get_all_directions_by_exchange(exchange_id: int):
     cash_exchange_directions = cash_models.NewExchangeDirection.objects.select_related('exchange',
                                                                                        'direction__valute_from',
                                                                                        'direction__valute_to')\
-                                                                        .filter(exchange_id=exchange_id,
+                                                                        .filter(get_not_expired_filter(),
+                                                                                exchange_id=exchange_id,
                                                                                 is_active=True,
                                                                                 exchange__is_active=True)\
                                                                         .values_list('direction_id', flat=True)\
@@ -3203,6 +3240,7 @@ def new_get_all_directions_by_exchange(exchange_id: int):
 
     no_cash_exchange_direction_subquery = no_cash_models.NewExchangeDirection.objects.select_related('exchange')\
         .filter(
+            get_not_expired_filter(),
             direction_id=OuterRef('pk'),
             is_active=True,
             exchange__is_active=True,
@@ -3225,7 +3263,7 @@ def new_get_all_directions_by_exchange(exchange_id: int):
 
     auto_pairs = (
         cash_models.NewExchangeDirection.objects
-        .filter(is_active=True, exchange__is_active=True)
+        .filter(get_not_expired_filter(), is_active=True, exchange__is_active=True)
         .values('direction_id')
         .annotate(auto_pair_count=Count('id'))
     )
@@ -4278,7 +4316,8 @@ def get_directions_for_sitemap(page: int,
     no_cash_directions = no_cash_models.NewExchangeDirection.objects\
                                 .select_related('exchange',
                                                 'direction')\
-                                .filter(is_active=True,
+                                .filter(get_not_expired_filter(),
+                                        is_active=True,
                                         exchange__is_active=True)\
                                 .annotate(direction_marker=annotate_string_field('no_cash'))\
                                 .values_list('direction__valute_from',
@@ -4292,7 +4331,8 @@ def get_directions_for_sitemap(page: int,
                                 .select_related('exchange',
                                                 'direction',
                                                 'city')\
-                                .filter(is_active=True,
+                                .filter(get_not_expired_filter(),
+                                        is_active=True,
                                         exchange__is_active=True)\
                                 .annotate(direction_marker=annotate_string_field('cash'))\
                                 .values_list('direction__valute_from',
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from config import XML_SNAPSHOT_DIR
+
+from general_models.utils.ingest_benchmark import (run_ingest_benchmark,
+                                                   format_benchmark_results,
+                                                   compare_with_baseline,
+                                                   save_benchmark_results,
+                                                   load_benchmark_results)
+
+
+# python manage.py benchmark_xml_ingest --save-baseline baseline.json
+# python manage.py benchmark_xml_ingest xml_files --baseline baseline.json
+# Прогон последних сохранённых версий XML файлов обменников (по умолчанию хранилище
+# XML_SNAPSHOT_DIR) через парсинг и запись в локальную БД
+# на синтетическом справочнике (транзакция откатывается).
+# Выводит items/sec, время парсинга и записи, peak RSS и изменённые строки по обменникам,
+# с --baseline сравнивает с сохранённым прогоном и завершается с ошибкой при регрессии
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('xml_dir', nargs='?', default=XML_SNAPSHOT_DIR)
+        parser.add_argument('--rounds', type=int, default=2)
+        parser.add_argument('--save-baseline', dest='save_baseline')
+        parser.add_argument('--baseline')
+        parser.add_argument('--threshold', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        print('Starting XML ingest benchmark')
+
+        try:
+            results = run_ingest_benchmark(options['xml_dir'],
+                                           rounds=options['rounds'],
+                                           verbose=options['verbosity'] > 1)
+        except ValueError as ex:
+            raise CommandError(ex)
+
+        for line in format_benchmark_results(results):
+            print(line)
+
+        if options['save_baseline']:
+            save_benchmark_results(results, options['save_baseline'])
+            print(f'результаты сохранены в {options["save_baseline"]}')
+
+        if options['baseline']:
+            lines, regressions = compare_with_baseline(results,
+                                                       load_benchmark_results(options['baseline']),
+                                                       options['threshold'])
+            print(f'СРАВНЕНИЕ С {options["baseline"]} (допуск {options["threshold"]}%)')
+
+            for line in lines:
+                print(line)
+
+            if regressions:
+                raise CommandError(f'регрессия: {", ".join(regressions)}')
@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django_celery_beat.models import PeriodicTask, IntervalSchedule
 
 from general_models.utils.periodic_tasks import get_or_create_schedule
+from general_models.utils.poll_scheduler import POLL_SWEEP_INTERVAL
 
 
 # python manage.py create_periodic_task_for_delete_reviews в docker-compose файле
@@ -15,11 +16,14 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         try:
-            schedule = get_or_create_schedule(90, IntervalSchedule.SECONDS)
-            PeriodicTask.objects.create(
-                interval=schedule,
+            # обход частый, обменники опрашиваются по своему расписанию (poll_scheduler)
+            schedule = get_or_create_schedule(POLL_SWEEP_INTERVAL, IntervalSchedule.SECONDS)
+            PeriodicTask.objects.update_or_create(
                 name='task for get xml files',
-                task='get_xml_file_for_exchangers',
+                defaults={
+                    'interval': schedule,
+                    'task': 'get_xml_file_for_exchangers',
+                },
             )
             pass
         except Exception as ex:
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_celery_beat.models import PeriodicTask, IntervalSchedule
+
+from general_models.utils.periodic_tasks import get_or_create_schedule
+
+
+# python manage.py create_periodic_task_for_compact_expired_directions в docker-compose файле
+# Команда для создания периодической задачи, которая деактивирует
+# готовые направления с истёкшим сроком жизни небольшими пачками
+
+
+class Command(BaseCommand):
+    print('Creating Task for compact expired directions...')
+
+    def handle(self, *args, **kwargs):
+        try:
+            schedule = get_or_create_schedule(5, IntervalSchedule.MINUTES) # for prod
+            # schedule = get_or_create_schedule(60, IntervalSchedule.SECONDS) # for test
+            PeriodicTask.objects.create(
+                interval=schedule,
+                name='task for compact expired directions',
+                task='compact_expired_directions',
+            )
+        except Exception as ex:
+            print(ex)
+            raise CommandError('Initalization failed.')
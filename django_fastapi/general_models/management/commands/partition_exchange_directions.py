@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from general_models.utils.partitioning import (PARTITIONED_DIRECTION_MODELS,
+                                               DEFAULT_PARTITION_COUNT,
+                                               partition_table,
+                                               unpartition_table,
+                                               drop_backup_table,
+                                               get_table_partitions,
+                                               compare_exchange_queries)
+
+
+# python manage.py partition_exchange_directions --status
+# python manage.py partition_exchange_directions --partitions 16
+# python manage.py partition_exchange_directions --explain 42
+# python manage.py partition_exchange_directions --rollback
+# python manage.py partition_exchange_directions --drop-backup
+# Секционирование таблиц готовых направлений (cash, no_cash) по exchange_id (PostgreSQL).
+# Перед запуском должны быть применены миграции (внешние ключи счётчиков переходов
+# без ограничения в БД). На время переноса запись в таблицу блокируется,
+# чтение продолжает работать - лучше запускать при остановленном run_xml_fetcher.
+# --explain EXCHANGE_ID - какие секции затрагивают запросы записи направлений обменника
+# и их среднее время; после секционирования те же запросы замеряются и на резервной
+# (обычной) таблице для сравнения. Время записи целиком - benchmark_xml_ingest
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=PARTITIONED_DIRECTION_MODELS.keys())
+        parser.add_argument('--partitions', type=int, default=DEFAULT_PARTITION_COUNT)
+        parser.add_argument('--status', action='store_true')
+        parser.add_argument('--explain', type=int, metavar='EXCHANGE_ID')
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--rollback', action='store_true')
+        parser.add_argument('--drop-backup', dest='drop_backup', action='store_true')
+
+    def handle(self, *args, **options):
+        print('Starting exchange directions partitioning')
+
+        models = [model for marker, model in PARTITIONED_DIRECTION_MODELS.items()
+                  if options['only'] in (None, marker)]
+
+        try:
+            for model in models:
+                table = model._meta.db_table
+
+                if options['status']:
+                    self.print_status(table)
+                elif options['explain'] is not None:
+                    comparison = compare_exchange_queries(model,
+                                                          options['explain'],
+                                                          rounds=options['rounds'])
+
+                    for _table, results in comparison.items():
+                        for result in results:
+                            print(f'{_table} {result["query"]}: {len(result["relations"])} '
+                                  f'таблиц ({", ".join(result["relations"])}), '
+                                  f'{result["avg_ms"]:.2f} ms')
+                elif options['rollback']:
+                    result = unpartition_table(model)
+                    print(f'{table}: возвращена обычная таблица, '
+                          f'перенесено {result["rows"]} строк за {result["time"]:.1f} sec')
+                elif options['drop_backup']:
+                    if drop_backup_table(model):
+                        print(f'{table}: резервная таблица удалена')
+                else:
+                    result = partition_table(model, options['partitions'])
+                    print(f'{table}: {options["partitions"]} секций, '
+                          f'перенесено {result["rows"]} строк за {result["time"]:.1f} sec')
+        except ValueError as ex:
+            raise CommandError(ex)
+
+    def print_status(self, table: str):
+        partitions = get_table_partitions(table)
+
+        if partitions is None:
+            print(f'{table}: не секционирована')
+            return
+
+        print(f'{table}: {len(partitions)} секций')
+
+        for partition in partitions:
+            print(f'  {partition["name"]:<40} {partition["rows"]:>10} строк '
+                  f'{partition["size"] / 1024 / 1024:>8.1f} MB  {partition["bound"]}')
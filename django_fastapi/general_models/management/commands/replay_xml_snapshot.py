@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from general_models.models import Exchanger
+from general_models.utils.direction_index import get_direction_index
+from general_models.utils.exc import TechServiceWork, InvalidXmlFile
+from general_models.utils.parsers import (parse_xml_directions,
+                                          parse_xml_and_create_or_update_directions)
+from general_models.utils.xml_snapshots import (list_xml_snapshots,
+                                                find_xml_snapshot,
+                                                open_xml_file)
+
+
+# python manage.py replay_xml_snapshot <exchange_id> --list
+# python manage.py replay_xml_snapshot <exchange_id> [--digest <digest>] [--write]
+# Повторный парсинг сохранённой версии XML файла обменника (по умолчанию последней).
+# Без --write направления только парсятся, в БД ничего не пишется
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('exchange_id', type=int)
+        parser.add_argument('--digest')
+        parser.add_argument('--list', action='store_true')
+        parser.add_argument('--write', action='store_true')
+
+    def handle(self, *args, **options):
+        exchange_id = options['exchange_id']
+
+        if options['list']:
+            for snapshot in list_xml_snapshots(exchange_id):
+                print(snapshot['digest'],
+                      datetime.fromtimestamp(snapshot['saved_at']).isoformat(sep=' ', timespec='seconds'),
+                      f'{snapshot["size"] / 1024:.1f} KB')
+            return
+
+        try:
+            exchange = Exchanger.objects.get(pk=exchange_id)
+        except Exchanger.DoesNotExist:
+            raise CommandError(f'обменник {exchange_id} не найден')
+
+        if (snapshot := find_xml_snapshot(exchange_id, options['digest'])) is None:
+            raise CommandError(f'версия XML файла обменника {exchange.name} не найдена')
+
+        print(f'Replay XML snapshot {snapshot["digest"]} for {exchange.name}')
+
+        direction_index = get_direction_index()
+
+        try:
+            with open_xml_file(snapshot['path']) as xml_file:
+                if options['write']:
+                    stats = {}
+                    is_success = parse_xml_and_create_or_update_directions(exchange,
+                                                                           xml_file,
+                                                                           direction_index,
+                                                                           stats)
+                    print('успешно' if is_success else 'ошибка записи', stats)
+                else:
+                    parsed = parse_xml_directions(exchange,
+                                                  xml_file,
+                                                  direction_index)
+                    print(f'items {parsed["item_count"]}, '
+                          f'cash {len(parsed["cash"])} (дублей {len(parsed["cash_dubles"])}), '
+                          f'no cash {len(parsed["no_cash"])} (дублей {len(parsed["no_cash_dubles"])}), '
+                          f'парсинг {parsed["parse_time"]:.3f} sec')
+        except (TechServiceWork, InvalidXmlFile) as ex:
+            print(ex)
@@ -0,0 +1,67 @@
+import asyncio
+
+from time import time
+
+from asgiref.sync import sync_to_async
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from config import XML_SHARD_NAME
+
+from general_models.tasks import _get_xml_file_for_exchangers
+from general_models.utils.cache import set_xml_fetcher_heartbeat
+from general_models.utils.poll_scheduler import POLL_SWEEP_INTERVAL
+from general_models.utils.sharding import set_shard_heartbeat
+from general_models.utils.xml_fetcher import XmlFetcher
+
+
+# python manage.py run_xml_fetcher в docker-compose файле
+# python manage.py run_xml_fetcher --shard node1
+# Долгоживущий сервис опроса XML файлов обменников: соединения, DNS кэш,
+# SSL контекст и HTTP/2 хосты переиспользуются между циклами.
+# Пока сервис работает, задача get_xml_file_for_exchangers пропускается.
+# --shard (или XML_SHARD_NAME) - несколько сервисов на разных узлах делят
+# обменники консистентным хешированием exchange_id (utils/sharding.py),
+# с XML_SHARD_PARSE_AFFINITY=true парсинг идёт в очередях шарда
+# (celery worker -Q cpu_queue.node1,cpu_priority_queue.node1 на том же узле)
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', default=XML_SHARD_NAME)
+
+    def handle(self, *args, **options):
+        print('Starting XML fetcher')
+
+        if options['shard']:
+            print(f'XML fetcher shard {options["shard"]}')
+
+        asyncio.run(self.run(options['shard']))
+
+    async def run(self, shard: str | None = None):
+        async with XmlFetcher() as fetcher:
+            while True:
+                start_time = time()
+
+                await sync_to_async(self.set_heartbeat,
+                                    thread_sensitive=True)(shard)
+                try:
+                    await _get_xml_file_for_exchangers(fetcher, shard)
+                except Exception as ex:
+                    print('XML FETCHER ERROR', ex)
+                finally:
+                    # долгоживущий процесс - соединения с БД закрываются сами только в запросах
+                    await sync_to_async(close_old_connections,
+                                        thread_sensitive=True)()
+
+                await sync_to_async(self.set_heartbeat,
+                                    thread_sensitive=True)(shard)
+
+                await asyncio.sleep(max(0, POLL_SWEEP_INTERVAL - (time() - start_time)))
+
+    def set_heartbeat(self, shard: str | None):
+        set_xml_fetcher_heartbeat()
+
+        if shard is not None:
+            set_shard_heartbeat(shard)
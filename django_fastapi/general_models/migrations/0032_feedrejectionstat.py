@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general_models', '0031_exchangelinkcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedRejectionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_create', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время парсинга')),
+                ('item_count', models.PositiveIntegerField(default=0, verbose_name='Элементов в XML')),
+                ('missing_pair', models.PositiveIntegerField(default=0, verbose_name='Нет пары валют')),
+                ('unknown_pair', models.PositiveIntegerField(default=0, verbose_name='Неизвестная пара валют')),
+                ('unknown_city', models.PositiveIntegerField(default=0, verbose_name='Неизвестные города')),
+                ('missing_fields', models.PositiveIntegerField(default=0, verbose_name='Нет курса или лимитов')),
+                ('invalid_min_max', models.PositiveIntegerField(default=0, verbose_name='Некорректные лимиты')),
+                ('normalize_error', models.PositiveIntegerField(default=0, verbose_name='Ошибка нормализации курса')),
+                ('duble', models.PositiveIntegerField(default=0, verbose_name='Дубли')),
+                ('item_error', models.PositiveIntegerField(default=0, verbose_name='Ошибка разбора элемента')),
+                ('samples', models.JSONField(blank=True, default=dict, verbose_name='Примеры ключей')),
+                ('exchange', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_rejections', to='general_models.exchanger', verbose_name='Обменник')),
+            ],
+            options={
+                'verbose_name': 'Отклонённые элементы XML',
+                'verbose_name_plural': 'Отклонённые элементы XML',
+                'ordering': ('-time_create',),
+                'indexes': [models.Index(fields=['exchange', '-time_create'], name='general_mod_exchang_262fad_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general_models', '0032_feedrejectionstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangerStatusHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_create', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время перехода')),
+                ('is_active', models.BooleanField(verbose_name='Статус обменника')),
+                ('active_status', models.CharField(choices=[('Cостояния для изменения', [('active', 'Активный'), ('disabled', 'Отключен'), ('scam', 'Скам'), ('skip', 'Не попадает ни в одну выдачу')]), ('Служебные состояния', [('inactive', 'Неактивный'), ('timeout error', 'Ошибка по таймауту'), ('robot check error', 'Ошибка проверки на робота')])], max_length=255, verbose_name='Новый статус обменника')),
+                ('prev_is_active', models.BooleanField(verbose_name='Предыдущий статус обменника')),
+                ('prev_active_status', models.CharField(choices=[('Cостояния для изменения', [('active', 'Активный'), ('disabled', 'Отключен'), ('scam', 'Скам'), ('skip', 'Не попадает ни в одну выдачу')]), ('Служебные состояния', [('inactive', 'Неактивный'), ('timeout error', 'Ошибка по таймауту'), ('robot check error', 'Ошибка проверки на робота')])], max_length=255, verbose_name='Предыдущий новый статус обменника')),
+                ('source', models.CharField(max_length=50, verbose_name='Источник')),
+                ('exchange', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='general_models.exchanger', verbose_name='Обменник')),
+            ],
+            options={
+                'verbose_name': 'Переход статуса обменника',
+                'verbose_name_plural': 'История статусов обменников',
+                'ordering': ('-time_create',),
+                'indexes': [models.Index(fields=['exchange', 'time_create'], name='general_mod_exchang_b1d701_idx')],
+            },
+        ),
+    ]
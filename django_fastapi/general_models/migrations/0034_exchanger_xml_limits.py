@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general_models', '0033_exchangerstatushistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchanger',
+            name='xml_max_items',
+            field=models.PositiveIntegerField(blank=True, default=None, help_text='Пусто - общий лимит (XML_MAX_ITEMS), 0 - без ограничения', null=True, verbose_name='Лимит элементов XML файла'),
+        ),
+        migrations.AddField(
+            model_name='exchanger',
+            name='xml_max_size',
+            field=models.PositiveIntegerField(blank=True, default=None, help_text='Пусто - общий лимит (XML_MAX_SIZE), 0 - без ограничения', null=True, verbose_name='Лимит размера XML файла (МБ)'),
+        ),
+        migrations.AlterField(
+            model_name='exchanger',
+            name='active_status',
+            field=models.CharField(choices=[('Cостояния для изменения', [('active', 'Активный'), ('disabled', 'Отключен'), ('scam', 'Скам'), ('skip', 'Не попадает ни в одну выдачу')]), ('Служебные состояния', [('inactive', 'Неактивный'), ('timeout error', 'Ошибка по таймауту'), ('robot check error', 'Ошибка проверки на робота'), ('too large', 'Превышен лимит XML файла')])], default='active', max_length=255, verbose_name='Новый статус обменника'),
+        ),
+        migrations.AlterField(
+            model_name='exchangerstatushistory',
+            name='active_status',
+            field=models.CharField(choices=[('Cостояния для изменения', [('active', 'Активный'), ('disabled', 'Отключен'), ('scam', 'Скам'), ('skip', 'Не попадает ни в одну выдачу')]), ('Служебные состояния', [('inactive', 'Неактивный'), ('timeout error', 'Ошибка по таймауту'), ('robot check error', 'Ошибка проверки на робота'), ('too large', 'Превышен лимит XML файла')])], max_length=255, verbose_name='Новый статус обменника'),
+        ),
+        migrations.AlterField(
+            model_name='exchangerstatushistory',
+            name='prev_active_status',
+            field=models.CharField(choices=[('Cостояния для изменения', [('active', 'Активный'), ('disabled', 'Отключен'), ('scam', 'Скам'), ('skip', 'Не попадает ни в одну выдачу')]), ('Служебные состояния', [('inactive', 'Неактивный'), ('timeout error', 'Ошибка по таймауту'), ('robot check error', 'Ошибка проверки на робота'), ('too large', 'Превышен лимит XML файла')])], max_length=255, verbose_name='Предыдущий новый статус обменника'),
+        ),
+    ]
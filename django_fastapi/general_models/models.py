@@ -123,6 +123,7 @@ class Exchanger(models.Model):
             ('inactive', 'Неактивный'),
             ('timeout error', 'Ошибка по таймауту'),
             ('robot check error', 'Ошибка проверки на робота'),
+            ('too large', 'Превышен лимит XML файла'),
         ])
     ]
 
@@ -205,6 +206,16 @@ class Exchanger(models.Model):
                                   default=None,
                                   help_text='Значение должно быть больше 0 и не больше 15 (по умолчанию используется значение 5)',
                                   validators=[custom_timeout_validate])
+    xml_max_size = models.PositiveIntegerField('Лимит размера XML файла (МБ)',
+                                               null=True,
+                                               blank=True,
+                                               default=None,
+                                               help_text='Пусто - общий лимит (XML_MAX_SIZE), 0 - без ограничения')
+    xml_max_items = models.PositiveIntegerField('Лимит элементов XML файла',
+                                                null=True,
+                                                blank=True,
+                                                default=None,
+                                                help_text='Пусто - общий лимит (XML_MAX_ITEMS), 0 - без ограничения')
     
     class Meta:
         verbose_name = 'Обменник (новый)'
@@ -1179,4 +1190,73 @@ class ExchangeLinkCount(models.Model):
         # unique_together = [('exchange', 'user', 'direction_display', 'city')]
 
     def __str__(self):
-        return f'{self.user} {self.exchange} {self.direction_display}'
\ No newline at end of file
+        return f'{self.user} {self.exchange} {self.direction_display}'
+
+class FeedRejectionStat(models.Model):
+    exchange = models.ForeignKey(Exchanger,
+                                 on_delete=models.CASCADE,
+                                 verbose_name='Обменник',
+                                 related_name='feed_rejections')
+    time_create = models.DateTimeField('Время парсинга',
+                                       default=timezone.now,
+                                       db_index=True)
+    item_count = models.PositiveIntegerField('Элементов в XML',
+                                             default=0)
+    missing_pair = models.PositiveIntegerField('Нет пары валют', default=0)
+    unknown_pair = models.PositiveIntegerField('Неизвестная пара валют', default=0)
+    unknown_city = models.PositiveIntegerField('Неизвестные города', default=0)
+    missing_fields = models.PositiveIntegerField('Нет курса или лимитов', default=0)
+    invalid_min_max = models.PositiveIntegerField('Некорректные лимиты', default=0)
+    normalize_error = models.PositiveIntegerField('Ошибка нормализации курса', default=0)
+    duble = models.PositiveIntegerField('Дубли', default=0)
+    item_error = models.PositiveIntegerField('Ошибка разбора элемента', default=0)
+    samples = models.JSONField('Примеры ключей',
+                               default=dict,
+                               blank=True)
+
+    class Meta:
+        verbose_name = 'Отклонённые элементы XML'
+        verbose_name_plural = 'Отклонённые элементы XML'
+        ordering = ('-time_create',)
+        indexes = [
+            models.Index(fields=['exchange', '-time_create']),
+        ]
+
+    def __str__(self):
+        return f'{self.exchange} {self.time_create}'
+
+    @property
+    def rejected_count(self):
+        return self.missing_pair + self.unknown_pair + self.unknown_city +\
+            self.missing_fields + self.invalid_min_max + self.normalize_error +\
+            self.duble + self.item_error
+
+
+class ExchangerStatusHistory(models.Model):
+    exchange = models.ForeignKey(Exchanger,
+                                 on_delete=models.CASCADE,
+                                 verbose_name='Обменник',
+                                 related_name='status_history')
+    time_create = models.DateTimeField('Время перехода',
+                                       default=timezone.now)
+    is_active = models.BooleanField('Статус обменника')
+    active_status = models.CharField('Новый статус обменника',
+                                     max_length=255,
+                                     choices=Exchanger.active_status_choice)
+    prev_is_active = models.BooleanField('Предыдущий статус обменника')
+    prev_active_status = models.CharField('Предыдущий новый статус обменника',
+                                          max_length=255,
+                                          choices=Exchanger.active_status_choice)
+    source = models.CharField('Источник',
+                              max_length=50)
+
+    class Meta:
+        verbose_name = 'Переход статуса обменника'
+        verbose_name_plural = 'История статусов обменников'
+        ordering = ('-time_create',)
+        indexes = [
+            models.Index(fields=['exchange', 'time_create']),
+        ]
+
+    def __str__(self):
+        return f'{self.exchange} {self.prev_active_status} -> {self.active_status}'
@@ -1,11 +1,9 @@
 import asyncio
 
 import aiohttp
-import aiofiles
 import httpx
 
 from time import time
-from collections import defaultdict
 
 from celery import shared_task
 from celery_once import QueueOnce
@@ -23,24 +21,59 @@ from cash import models as cash_models
 from no_cash import models as no_cash_models
 from partners import models as partner_models
 
-from cash.utils.cache import get_or_set_cash_directions_cache, new_get_or_set_cash_directions_cache
-from no_cash.utils.cache import get_or_set_no_cash_directions_cache, new_get_or_set_no_cash_directions_cache
 
-from config import SELENIUM_DRIVER
+from config import (SELENIUM_DRIVER,
+                    REVIEW_SELENIUM_SESSIONS,
+                    XML_PARSE_BATCH_MODE,
+                    XML_PARSE_BATCH_SIZE,
+                    XML_PARSE_WORKERS,
+                    XML_PARSE_TRANSACTION_SIZE)
 
 from .models import NewBaseReview, Exchanger, Review
 from .utils.periodic_tasks import try_get_xml_file, new_try_get_xml_file
 
-from .utils.parse_reviews.selenium import parse_reviews
-from .utils.parse_exchange_info.base import parse_exchange_info
+from .utils.parse_reviews.selenium import parse_reviews, parse_reviews_concurrently
+from .utils.parse_reviews.base import get_bestchange_review_cursors
+from .utils.parse_exchange_info.base import parse_exchange_info, new_parse_exchange_info
 from .utils.tasks import (new_try_update_courses,
-                          try_update_courses,
-                          generate_cash_direction_dict,
-                          generate_no_cash_direction_dict)
+                          try_update_courses)
 from .utils.endpoints import (new_send_review_notifitation_to_exchange_admin,
                               new_send_comment_notifitation_to_exchange_admin,
                               new_send_comment_notifitation_to_review_owner)
 from .utils.parsers import parse_xml_and_create_or_update_directions
+from .utils.exc import TechServiceWork, InvalidXmlFile, XmlTooLarge
+from .utils.cache import (get_directions_version,
+                          get_xml_feed_states,
+                          set_xml_feed_state,
+                          get_poll_states,
+                          set_poll_states,
+                          get_circuit_states,
+                          set_circuit_states,
+                          is_xml_fetcher_alive)
+from .utils.direction_index import get_direction_index
+from .utils.batch_parse import ingest_xml_batch
+from .utils.poll_scheduler import is_poll_due, get_next_poll_state
+from .utils.circuit_breaker import get_circuit_mode, get_next_circuit_state
+from .utils.xml_fetcher import XmlFetcher
+from .utils.metrics import (observe_xml_fetch,
+                            observe_xml_ingest_queue,
+                            observe_xml_ingest_lag,
+                            reset_peak_rss,
+                            observe_task_rss)
+from .utils.ingest_lanes import (INGEST_LANE_ORDER,
+                                 get_high_traffic_exchanger_ids,
+                                 get_ingest_lane,
+                                 get_ingest_queue)
+from .utils.sharding import filter_shard_exchangers, get_shard_queue
+from .utils.feed_rejections import save_feed_rejections
+from .utils.exchanger_status import write_exchanger_statuses, set_exchanger_status
+from .utils.feed_health import record_feed_health
+from .utils.direction_expiry import (renew_directions_lease,
+                                     compact_expired_directions)
+from .utils.xml_snapshots import (get_snapshot_dir,
+                                  get_feed_snapshot_path,
+                                  prune_xml_snapshots,
+                                  open_xml_file)
 
 
 #Задача для периодического удаления отзывов и комментариев
@@ -60,25 +93,24 @@ def delete_cancel_reviews():
 #для всех обменников из БД при запуске сервиса
 @shared_task
 def parse_reviews_with_start_service():
-    # driver = webdriver.Remote(f'http://localhost:4444', options=options)
-    # print('DRIVER', driver)
+    # обменники разбираются параллельно пулом сессий браузера,
+    # с каждого обменника собираются только отзывы новее его курсора
     try:
-        # driver = webdriver.Firefox()
-        options = Options()
-        driver = webdriver.Remote(f'http://{SELENIUM_DRIVER}:4444', options=options)
+        exchangers = list(Exchanger.objects.filter(en_name__isnull=False)\
+                                           .only('pk', 'name', 'en_name')\
+                                           .exclude(active_status__in=('disabled', 'scam')))
+
+        cursors = get_bestchange_review_cursors([exchange.pk for exchange in exchangers])
+
+        stats = parse_reviews_concurrently(exchangers,
+                                           cursors,
+                                           REVIEW_SELENIUM_SESSIONS)
 
-        for marker in ('no_cash', 'cash'):
-            model = no_cash_models if marker == 'no_cash' else cash_models
-            exchanges = model.Exchange.objects.values('en_name').all()
-            exchange_name_list = [exchange['en_name'].lower() for exchange in exchanges]
-            for exchange_name in exchange_name_list:
-                parse_reviews(driver,
-                              exchange_name,
-                              marker)
-    except (Exception, BaseException) as ex:
+        print(f'REVIEWS: страниц {stats["pages"]} за {stats["seconds"]} sec '
+              f'({stats["pages_per_minute"]} стр/мин, сессий {stats["sessions"]}), '
+              f'новых отзывов {stats["reviews"]}, ошибок {stats["errors"]}')
+    except Exception as ex:
         print('SELENIUM ERROR', ex)
-    finally:
-        driver.quit()
 
 
 #Фоновая задача парсинга отзывов и комментариев обменника
@@ -167,10 +199,26 @@ def parse_actual_exchanges_info():
     #                                                      'exchange_marker')\
     #                                         .all()
     # exchange_list = no_cash_exchanges.union(cash_exchanges)
-    exchange_list = Exchanger.objects.values_list('pk',
-                                                  'en_name')
-
-    parse_exchange_info(exchange_list)
+    # exchange_list = Exchanger.objects.values_list('pk',
+    #                                               'en_name')
+
+    # parse_exchange_info(exchange_list)
+
+    # страницы запрашиваются по HTTP, Selenium - только для страниц с JS,
+    # результат пишется в Exchanger, а не в new_age.json
+    exchangers = list(Exchanger.objects.filter(en_name__isnull=False)\
+                                       .only('pk',
+                                             'en_name',
+                                             'course_count',
+                                             'reserve_amount',
+                                             'age',
+                                             'country'))
+
+    stats = new_parse_exchange_info(exchangers)
+
+    print(f'EXCHANGE INFO: из кэша {stats["cached"]}, по HTTP {stats["http"]}, '
+          f'через Selenium {stats["selenium"]}, не собрано {stats["failed"]}, '
+          f'обновлено {stats["updated"]} за {stats["seconds"]} sec')
     # for exchange in exchange_list:
     #     parse_exchange_info(exchange)
 
@@ -239,6 +287,21 @@ def periodic_delete_unlinked_exchange_records():
         print(f'end with ELSE {batch_size}')
 
 
+#Фоновая задача деактивации готовых направлений с истёкшим сроком (expires_at).
+#Чтения уже считают такие направления неактивными, задача только
+#приводит is_active в соответствие небольшими пачками
+@shared_task(base=QueueOnce,
+             once={'graceful': True},
+             queue='io_queue',
+             name='compact_expired_directions')
+def compact_expired_directions_task():
+    start_time = time()
+
+    deactivated_counts = compact_expired_directions()
+
+    print(f'деактивировано истёкших направлений {deactivated_counts} за {time() - start_time} sec')
+
+
 #new (одна задача на добавление и обновление направлений)
 @shared_task(base=QueueOnce,
              once={'graceful': True},
@@ -252,13 +315,11 @@ def create_update_directions_for_exchanger(exchange_id: int):
         
         start_cache_time = time()
 
-        all_cash_directions = new_get_or_set_cash_directions_cache()
-
-        all_no_cash_directions = new_get_or_set_no_cash_directions_cache()
+        direction_index = get_direction_index()
 
         print(f'время получения направлений из кэша - {time() - start_cache_time} sec')
 
-        if all_cash_directions or all_no_cash_directions:
+        if direction_index['CASH'] or direction_index['NOCASH']:
             # print(f'request to exchanger {exchange.name}')
             start_time = time()
             xml_file = try_get_xml_file(exchange)
@@ -266,21 +327,22 @@ def create_update_directions_for_exchanger(exchange_id: int):
             # print('get xml file', time() - start_time)
         
             if xml_file is not None and exchange.is_active:
-                start_generate_time = time()
-                direction_dict = defaultdict(dict)
-
-                if all_cash_directions:
-                    generate_cash_direction_dict(direction_dict,
-                                                 all_cash_directions[-1])
-                if all_no_cash_directions:
-                    generate_no_cash_direction_dict(direction_dict,
-                                                    all_no_cash_directions)
-
-                print(f'время генерации словаря направлений - {time() - start_generate_time} sec')
-                if direction_dict:
+                try:
                     parse_xml_and_create_or_update_directions(exchange,
                                                               xml_file,
-                                                              direction_dict)
+                                                              direction_index)
+                except (TechServiceWork, InvalidXmlFile) as ex:
+                    print(ex)
+                    set_exchanger_status(exchange,
+                                         False,
+                                         'inactive',
+                                         source='xml_parse')
+                except XmlTooLarge as ex:
+                    print(ex)
+                    set_exchanger_status(exchange,
+                                         False,
+                                         'too large',
+                                         source='xml_parse')
 
     except Exception as ex:
         print(ex, exchange_id)
@@ -292,11 +354,22 @@ def create_update_directions_for_exchanger(exchange_id: int):
              queue='io_queue',
              name='get_xml_file_for_exchangers')
 def get_xml_file_for_exchangers():
+    # XML файлы опрашивает долгоживущий сервис run_xml_fetcher
+    if is_xml_fetcher_alive():
+        return
+    
     asyncio.run(_get_xml_file_for_exchangers())
 
 
-async def _get_xml_file_for_exchangers():
-    SEM = asyncio.Semaphore(50)
+async def _get_xml_file_for_exchangers(fetcher: XmlFetcher | None = None,
+                                       shard: str | None = None):
+    if fetcher is None:
+        async with XmlFetcher() as fetcher:
+            return await _get_xml_file_for_exchangers(fetcher, shard)
+
+    SEM = asyncio.Semaphore(fetcher.limit)
+
+    start_rss = reset_peak_rss()
     
     exchangers = await sync_to_async(
         lambda: list(
@@ -307,12 +380,63 @@ async def _get_xml_file_for_exchangers():
         thread_sensitive=True
     )()
 
-    conn = aiohttp.TCPConnector(limit=50)
+    # шард опрашивает только закреплённые за ним обменники (utils/sharding.py)
+    if shard is not None:
+        exchangers = await sync_to_async(filter_shard_exchangers,
+                                         thread_sensitive=True)(exchangers, shard)
 
-    async with aiohttp.ClientSession(connector=conn) as session:
-        tasks = [fetch_one(session, e, SEM) for e in exchangers]
-        
-        results = await asyncio.gather(*tasks)
+    # опрашиваются только обменники, у которых подошло время по планировщику,
+    # обменники с открытым предохранителем пропускаются без запроса
+    now = time()
+
+    poll_states = await sync_to_async(get_poll_states,
+                                      thread_sensitive=True)([e.pk for e in exchangers])
+    circuit_states = await sync_to_async(get_circuit_states,
+                                         thread_sensitive=True)([e.pk for e in exchangers])
+
+    circuit_modes = {e.pk: get_circuit_mode(circuit_states.get(e.pk), now) for e in exchangers}
+
+    exchangers = [e for e in exchangers
+                  if circuit_modes[e.pk] != 'open' and is_poll_due(poll_states.get(e.pk), now)]
+
+    if not exchangers:
+        return
+
+    # обменники приоритетной полосы (VIP и с наибольшим числом переходов)
+    # опрашиваются первыми и парсятся в своей очереди
+    high_traffic_ids = await sync_to_async(get_high_traffic_exchanger_ids,
+                                           thread_sensitive=True)()
+
+    lanes = {e.pk: get_ingest_lane(e, high_traffic_ids) for e in exchangers}
+
+    exchangers.sort(key=lambda e: INGEST_LANE_ORDER.index(lanes[e.pk]))
+
+    # digest/ETag/Last-Modified последних обработанных XML файлов
+    feed_states = await sync_to_async(get_xml_feed_states,
+                                      thread_sensitive=True)([e.pk for e in exchangers])
+
+    # изменившиеся XML файлы, которые нужно распарсить
+    parse_feeds = []
+
+    # соединения, DNS и SSL контекст общие для всех запросов (и циклов в run_xml_fetcher)
+    tasks = [fetch_one(fetcher,
+                       e,
+                       SEM,
+                       feed_states.get(e.pk),
+                       parse_feeds,
+                       is_probe=circuit_modes[e.pk] == 'half_open')
+             for e in exchangers]
+    
+    results = await asyncio.gather(*tasks)
+
+    # запросы цикла идут параллельно в одном процессе,
+    # поэтому память считается на весь цикл, а не на обменник
+    peak_rss, rss_growth = observe_task_rss('fetch', start_rss)
+
+    print(f'XML FETCH: обменников {len(exchangers)}, '
+          f'пик памяти цикла {peak_rss / 1024 / 1024:.1f} MB (+{rss_growth / 1024 / 1024:.1f} MB)')
+
+    await fetcher.save_http2_hosts()
     # limits = httpx.Limits(max_connections=50, max_keepalive_connections=50)
 
     # async with httpx.AsyncClient(http2=True,
@@ -322,121 +446,280 @@ async def _get_xml_file_for_exchangers():
     
     exchanger_dict = {e.pk: e for e in exchangers}
 
-    update_list = []
-
-    exchanger_ids_for_skip = await sync_to_async(
-        lambda: list(
-            Exchanger.objects.filter(active_status__in=('disabled', 'scam', 'skip'))\
-            .values_list('pk', flat=True)
-        ),
-        thread_sensitive=True
-    )()
-    
-    for ex_id, _is_active, _active_status in results:
-        obj = exchanger_dict.get(ex_id)
-        
-        if obj.pk in set(exchanger_ids_for_skip):
-            continue
-        
-        obj.is_active = _is_active
-        obj.active_status = _active_status
-        update_list.append(obj)
-
-    await sync_to_async(
-        Exchanger.objects.bulk_update,
-        thread_sensitive=True
-    )(update_list, ["is_active", "active_status"])
-
-
-path_to_xml = './xml_files/{}.xml'
+    now = time()
+
+    new_poll_states = {}
+    new_circuit_states = {}
+
+    for ex_id, _is_active, _active_status, (poll_outcome, fetch_time, _byte_count) in results:
+        new_poll_states[ex_id] = get_next_poll_state(exchanger_dict[ex_id],
+                                                     poll_states.get(ex_id),
+                                                     poll_outcome,
+                                                     _active_status,
+                                                     fetch_time,
+                                                     now)
+        new_circuit_states[ex_id] = get_next_circuit_state(circuit_states.get(ex_id),
+                                                           poll_outcome,
+                                                           _active_status,
+                                                           now)
+
+        if new_circuit_states[ex_id]['state'] != circuit_modes[ex_id]:
+            print(f'CIRCUIT {exchanger_dict[ex_id].name}: '
+                  f'{circuit_modes[ex_id]} -> {new_circuit_states[ex_id]["state"]}')
+
+    # кольцевые буферы здоровья XML файлов (utils/feed_health.py),
+    # число элементов - последней распарсенной версии файла
+    await sync_to_async(record_feed_health,
+                        thread_sensitive=True)([
+        {
+            'exchange_id': ex_id,
+            'ts': now,
+            'latency': fetch_time,
+            'bytes': byte_count,
+            'items': (feed_states.get(ex_id) or {}).get('item_count'),
+            'outcome': poll_outcome,
+            'status': _active_status,
+        }
+        for ex_id, _is_active, _active_status, (poll_outcome, fetch_time, byte_count) in results
+    ])
+
+    await sync_to_async(set_poll_states,
+                        thread_sensitive=True)(new_poll_states)
+    await sync_to_async(set_circuit_states,
+                        thread_sensitive=True)(new_circuit_states)
+
+    # в БД пишутся только переходы статусов одним запросом,
+    # обменники с ручным статусом (disabled, scam, skip) пропускаются.
+    # Статус изменившихся XML файлов записывает задача парсинга,
+    # иначе заглушка тех обслуживания с новым содержимым каждый цикл
+    # переходила бы active -> inactive
+    await sync_to_async(write_exchanger_statuses,
+                        thread_sensitive=True)(exchanger_dict,
+                                               {ex_id: (_is_active, _active_status)
+                                                for ex_id, _is_active, _active_status, (poll_outcome, _fetch_time, _byte_count) in results
+                                                if poll_outcome != 'changed'},
+                                               'xml_fetcher')
+
+    # направления не изменившихся XML файлов не переписываются,
+    # им только продлевается срок жизни
+    renew_exchange_ids = [ex_id for ex_id, _is_active, _active_status, (poll_outcome, _fetch_time, _byte_count) in results
+                          if poll_outcome == 'not_modified' and _active_status == 'active']
+
+    await sync_to_async(renew_directions_lease,
+                        thread_sensitive=True)(renew_exchange_ids)
+
+    # задачи парсинга ставятся после записи статусов,
+    # иначе active из обхода может перетереть inactive,
+    # выставленный парсингом (тех обслуживание, некорректный XML)
+    for lane in INGEST_LANE_ORDER:
+        lane_feeds = [feed for feed in parse_feeds if lanes[feed[0]] == lane]
+        queue = get_shard_queue(get_ingest_queue(lane), shard)
+
+        if XML_PARSE_BATCH_MODE:
+            # полученные за цикл файлы парсятся пачками
+            for i in range(0, len(lane_feeds), XML_PARSE_BATCH_SIZE):
+                parse_xml_batch_for_exchangers.apply_async((lane_feeds[i:i + XML_PARSE_BATCH_SIZE],),
+                                                           queue=queue)
+        else:
+            for exchange_id, new_feed_state in lane_feeds:
+                parse_xml_for_exchanger.apply_async((exchange_id, new_feed_state),
+                                                    queue=queue)
 
 
-async def fetch_one(session, exchange, SEM):
+async def fetch_one(fetcher, exchange, SEM, feed_state=None, parse_feeds=None, is_probe=False):
     async with SEM:
         start_time = time()
-        # xml_file = await new_try_get_xml_file(exchange,
-        #                                     session)
+        # XML пишется на диск потоково (сжатой версией) внутри new_try_get_xml_file
         exchanger_data = await new_try_get_xml_file(exchange,
-                                                    session)
+                                                    fetcher.session,
+                                                    get_snapshot_dir(exchange.pk),
+                                                    feed_state,
+                                                    fetcher.http2_session,
+                                                    fetcher.http2_hosts,
+                                                    is_probe=is_probe)
         
+        byte_count = None
+
         if len(exchanger_data) == 2:
             _is_active, _active_status = exchanger_data
+            poll_outcome = 'error'
         else:
-            _is_active, _active_status, xml_file = exchanger_data
-        # if xml_file:
-            await save_xml_to_disk(exchange_id=exchange.pk,
-                                   xml_data=xml_file)
+            _is_active, _active_status, xml_file, new_feed_state = exchanger_data
+            poll_outcome = 'changed' if xml_file is not None else 'not_modified'
+
+            # не изменившийся XML не парсится и не пишется в БД
+            if xml_file is not None:
+                byte_count = new_feed_state['size']
+
+                prune_xml_snapshots(exchange.pk)
+
+                if parse_feeds is not None:
+                    # время получения - для отставания курсов по полосам (metrics)
+                    parse_feeds.append((exchange.pk, {**new_feed_state, 'fetched_at': time()}))
             
-        print(f'Задача для Exchanger {exchange.name}! время получения xml {time() - start_time} sec')
+        fetch_time = time() - start_time
+
+        print(f'Задача для Exchanger {exchange.name}! время получения xml {fetch_time} sec')
+
+        observe_xml_fetch(exchange.name,
+                          poll_outcome,
+                          fetch_time,
+                          byte_count)
         
         return (
             exchange.pk,
             _is_active,
             _active_status,
+            (poll_outcome, fetch_time, byte_count),
         )
 
-        # if xml_file:
-        #     await save_xml_to_disk(exchange_id=exchange.pk,
-        #                         xml_data=xml_file)
-
-
-async def save_xml_to_disk(exchange_id: int,
-                           xml_data: str):
-    # путь к файлу
-    path = path_to_xml.format(exchange_id)
-    
-    # асинхронное открытие и запись
-    async with aiofiles.open(path, 'w', encoding='utf-8') as f:
-        await f.write(xml_data)
-    
-    parse_xml_for_exchanger.delay(exchange_id)
-
 
 @shared_task(base=QueueOnce,
              once={'graceful': True},
              queue='cpu_queue',
              name='parse_xml_for_exchanger')
-def parse_xml_for_exchanger(exchange_id: int):
+def parse_xml_for_exchanger(exchange_id: int,
+                            feed_state: dict | None = None):
     try:
         exchange = Exchanger.objects.get(pk=exchange_id)
 
-        path = path_to_xml.format(exchange_id)
+        lane = get_ingest_lane(exchange, get_high_traffic_exchanger_ids())
 
-        # start_read_xml_time = time()
-        with open(path, encoding='utf-8') as f:
-            xml_file = f.read()
+        observe_xml_ingest_queue(lane, feed_state, time())
 
-        # print(f'время чтения xml с диска - {time() - start_read_xml_time} sec')
-        
-        # start_cache_time = time()
+        start_rss = reset_peak_rss()
+
+        path = get_feed_snapshot_path(exchange_id, feed_state)
+
+        directions_version = get_directions_version()
+
+        # индекс направлений строится один раз на версию справочника
+        # и переиспользуется всеми задачами процесса
+        direction_index = get_direction_index()
+
+        if direction_index['CASH'] or direction_index['NOCASH']:
+            active_status = 'active'
 
-        all_cash_directions = new_get_or_set_cash_directions_cache()
+            # файл читается и разбирается кусками, целиком в память не попадает,
+            # тех обслуживание и некорректный XML определяются за тот же проход
+            stats = {}
 
-        all_no_cash_directions = new_get_or_set_no_cash_directions_cache()
+            try:
+                with open_xml_file(path) as xml_file:
+                    is_success = parse_xml_and_create_or_update_directions(exchange,
+                                                                           xml_file,
+                                                                           direction_index,
+                                                                           stats)
+            except (TechServiceWork, InvalidXmlFile, XmlTooLarge) as ex:
+                print(ex)
+                is_success = True
+                active_status = 'too large' if isinstance(ex, XmlTooLarge) else 'inactive'
 
-        # print(f'время получения направлений из кэша - {time() - start_cache_time} sec')
+            # статус изменившегося XML файла обход не записывает
+            if is_success:
+                set_exchanger_status(exchange,
+                                     active_status == 'active',
+                                     active_status,
+                                     source='xml_parse')
 
-        if all_cash_directions or all_no_cash_directions:
-            # start_generate_time = time()
-            direction_dict = defaultdict(dict)
+            peak_rss, rss_growth = observe_task_rss('parse', start_rss)
 
-            if all_cash_directions:
-                generate_cash_direction_dict(direction_dict,
-                                                all_cash_directions[-1])
-            if all_no_cash_directions:
-                generate_no_cash_direction_dict(direction_dict,
-                                                all_no_cash_directions)
+            print(f'Задача парсинга Exchanger {exchange.name}! '
+                  f'пик памяти задачи {peak_rss / 1024 / 1024:.1f} MB (+{rss_growth / 1024 / 1024:.1f} MB)')
 
-            # print(f'время генерации словаря направлений - {time() - start_generate_time} sec')
-            if direction_dict:
-                parse_xml_and_create_or_update_directions(exchange,
-                                                            xml_file,
-                                                            direction_dict)
+            # состояние запоминается только после успешной записи в БД,
+            # иначе следующий запрос снова получит файл целиком.
+            # Статус запоминается вместе с ним, чтобы не изменившийся
+            # XML на тех обслуживании не возвращал обменник в active
+            if is_success and feed_state:
+                set_xml_feed_state(exchange_id,
+                                   {**feed_state,
+                                    'active_status': active_status,
+                                    'item_count': stats.get('item_count')},
+                                   directions_version)
+
+                observe_xml_ingest_lag(lane, feed_state, time())
+
+            # элементы XML, не попавшие в направления, по причинам
+            save_feed_rejections(exchange_id,
+                                 stats.get('rejections'),
+                                 stats.get('item_count', 0))
 
     except Exception as ex:
         print(ex, exchange_id)
 
 
+@shared_task(base=QueueOnce,
+             once={'graceful': True},
+             queue='cpu_queue',
+             name='parse_xml_batch_for_exchangers')
+def parse_xml_batch_for_exchangers(feeds: list[tuple[int, dict | None]]):
+    '''
+    Пакетный парсинг XML файлов обменников, полученных за один цикл:
+    общий индекс направлений, параллельный парсинг на пуле процессов,
+    запись в БД группами в общих транзакциях
+    '''
+    try:
+        directions_version = get_directions_version()
+
+        direction_index = get_direction_index()
+
+        if not (direction_index['CASH'] or direction_index['NOCASH']):
+            return
+
+        feed_states = {exchange_id: feed_state for exchange_id, feed_state in feeds}
+
+        exchangers = Exchanger.objects.filter(pk__in=feed_states.keys())
+
+        high_traffic_ids = get_high_traffic_exchanger_ids()
+
+        lanes = {exchange.pk: get_ingest_lane(exchange, high_traffic_ids)
+                 for exchange in exchangers}
+
+        now = time()
+
+        for exchange_id, lane in lanes.items():
+            observe_xml_ingest_queue(lane, feed_states[exchange_id], now)
+
+        item_counts = {}
+
+        start_rss = reset_peak_rss()
+
+        results = ingest_xml_batch([(exchange, get_feed_snapshot_path(exchange.pk, feed_states[exchange.pk]))
+                                    for exchange in exchangers],
+                                   direction_index,
+                                   max_workers=XML_PARSE_WORKERS,
+                                   transaction_size=XML_PARSE_TRANSACTION_SIZE,
+                                   item_counts=item_counts)
+
+        # в пуле процессов пик считается только для текущего процесса
+        observe_task_rss('parse', start_rss)
+
+        # статус изменившихся XML файлов обход не записывает, пишутся
+        # только изменившиеся статусы (utils/exchanger_status.py):
+        # inactive - тех обслуживание или некорректный XML, too large - превышен лимит
+        write_exchanger_statuses({exchange.pk: exchange for exchange in exchangers},
+                                 {exchange_id: (active_status == 'active', active_status)
+                                  for exchange_id, active_status in results.items()},
+                                 source='xml_parse')
+
+        now = time()
+
+        # состояние запоминается только после успешной записи в БД
+        for exchange_id, active_status in results.items():
+            if feed_state := feed_states.get(exchange_id):
+                set_xml_feed_state(exchange_id,
+                                   {**feed_state,
+                                    'active_status': active_status,
+                                    'item_count': item_counts.get(exchange_id)},
+                                   directions_version)
+
+                observe_xml_ingest_lag(lanes[exchange_id], feed_state, now)
+
+    except Exception as ex:
+        print(ex, 'BATCH')
+
+
 # @shared_task
 @shared_task(queue='io_queue')
 def send_review_notification_to_exchange_admin_task(user_id, exchange_id, review_id):
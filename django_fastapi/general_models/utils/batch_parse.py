@@ -0,0 +1,190 @@
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+import billiard.process
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from general_models.models import Exchanger
+
+from .exc import TechServiceWork, InvalidXmlFile, XmlTooLarge
+from .parsers import parse_xml_directions, write_parsed_directions
+from .feed_rejections import save_feed_rejections
+from .xml_snapshots import open_xml_file
+from .metrics import observe_xml_batch_throughput
+
+
+# индекс направлений процесса пула, передаётся один раз через initializer
+_worker_direction_index = None
+
+
+def init_parse_worker(direction_index: dict):
+    global _worker_direction_index
+
+    _worker_direction_index = direction_index
+
+
+def parse_xml_file(exchange: Exchanger,
+                   path: str,
+                   time_action: timezone):
+    '''
+    Парсинг одного XML файла с диска (выполняется в процессе пула).
+    Возвращает (exchange_id, распарсенные направления или None, active_status):
+    active_status - inactive для тех обслуживания и некорректного XML,
+    too large при превышении лимита элементов, None при прочих ошибках
+    '''
+    active_status = 'active'
+
+    try:
+        with open_xml_file(path) as xml_file:
+            parsed = parse_xml_directions(exchange,
+                                          xml_file,
+                                          _worker_direction_index,
+                                          time_action)
+    except (TechServiceWork, InvalidXmlFile) as ex:
+        print(ex)
+        parsed = None
+        active_status = 'inactive'
+    except XmlTooLarge as ex:
+        print(ex)
+        parsed = None
+        active_status = 'too large'
+    except Exception as ex:
+        print('ошибка парсинга xml', exchange.name, ex)
+        parsed = None
+        active_status = None
+
+    return (
+        exchange.pk,
+        parsed,
+        active_status,
+    )
+
+
+def get_parse_workers(max_workers: int,
+                      feed_count: int) -> int:
+    '''
+    Число процессов парсинга пакета.
+    Дочерние процессы воркера Celery prefork - процессы billiard с daemon=True,
+    multiprocessing в них видит унаследованный MainProcess и не мешает
+    создать вложенный пул: процессов стало бы concurrency * XML_PARSE_WORKERS.
+    Поэтому в prefork файлы парсятся последовательно, а параллельный
+    режим - у воркера с -P solo или -P threads
+    '''
+    if billiard.process.current_process().daemon\
+        or multiprocessing.current_process().daemon:
+        return 1
+
+    return max(min(max_workers, feed_count), 1)
+
+
+def parse_xml_files(feeds: list[tuple[Exchanger, str]],
+                    direction_index: dict,
+                    max_workers: int):
+    '''
+    Парсинг XML файлов на ProcessPoolExecutor с общим индексом направлений
+    (число процессов - get_parse_workers, один процесс - без пула)
+    '''
+    time_action = timezone.now()
+
+    workers = get_parse_workers(max_workers, len(feeds))
+
+    if workers <= 1:
+        init_parse_worker(direction_index)
+
+        return [parse_xml_file(exchange, path, time_action)
+                for exchange, path in feeds]
+
+    # соединения с БД не должны наследоваться дочерними процессами
+    connections.close_all()
+
+    # fork: индекс и настроенный Django достаются процессам пула без pickle
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('fork'),
+                             initializer=init_parse_worker,
+                             initargs=(direction_index,)) as executor:
+        futures = [executor.submit(parse_xml_file, exchange, path, time_action)
+                   for exchange, path in feeds]
+
+        return [future.result() for future in futures]
+
+
+def ingest_xml_batch(feeds: list[tuple[Exchanger, str]],
+                     direction_index: dict,
+                     max_workers: int,
+                     transaction_size: int,
+                     item_counts: dict | None = None) -> dict:
+    '''
+    Пакетная обработка XML файлов: параллельный парсинг,
+    затем запись в БД группами обменников в общих транзакциях
+    (каждый обменник - в своей точке сохранения).
+    Возвращает {exchange_id: active_status}: active - направления записаны,
+    inactive - тех обслуживание или некорректный XML, too large - превышен
+    лимит элементов (в обоих случаях в БД ничего не пишется);
+    обменники с ошибкой парсинга или записи в результат не попадают.
+    item_counts - словарь для числа элементов XML распарсенных обменников.
+    Пропускная способность печатается и пишется в метрику xml_batch_items_per_second
+    '''
+    results = {}
+
+    if not feeds:
+        return results
+
+    exchanger_dict = {exchange.pk: exchange for exchange, _path in feeds}
+
+    start_time = time()
+
+    parsed_list = []
+
+    for exchange_id, parsed, active_status in parse_xml_files(feeds,
+                                                              direction_index,
+                                                              max_workers):
+        if parsed is not None:
+            parsed_list.append((exchange_id, parsed))
+
+            if item_counts is not None:
+                item_counts[exchange_id] = parsed['item_count']
+        elif active_status is not None:
+            results[exchange_id] = active_status
+
+    parse_time = time() - start_time
+
+    start_db_time = time()
+
+    for i in range(0, len(parsed_list), transaction_size):
+        with transaction.atomic():
+            for exchange_id, parsed in parsed_list[i:i + transaction_size]:
+                if write_parsed_directions(exchanger_dict[exchange_id],
+                                           parsed):
+                    results[exchange_id] = 'active'
+
+    db_time = time() - start_db_time
+
+    for exchange_id, parsed in parsed_list:
+        save_feed_rejections(exchange_id,
+                             parsed['rejections'],
+                             parsed['item_count'])
+
+    total_time = time() - start_time
+    item_count = sum(parsed['item_count'] for _exchange_id, parsed in parsed_list)
+    direction_count = sum(len(parsed['cash']) + len(parsed['no_cash'])
+                          for _exchange_id, parsed in parsed_list)
+
+    workers = get_parse_workers(max_workers, len(feeds))
+
+    observe_xml_batch_throughput(item_count,
+                                 parse_time,
+                                 total_time,
+                                 workers)
+
+    print(f'BATCH: обменников {len(feeds)} (распарсено {len(parsed_list)}), '
+          f'процессов {workers}, '
+          f'items {item_count}, направлений {direction_count}, '
+          f'парсинг {parse_time:.2f} sec ({item_count / max(parse_time, 1e-6):.0f} items/sec), '
+          f'запись в бд {db_time:.2f} sec, '
+          f'всего {total_time:.2f} sec ({item_count / max(total_time, 1e-6):.0f} items/sec)')
+
+    return results
@@ -0,0 +1,167 @@
+from datetime import datetime
+
+from django.core.cache import cache
+
+
+# время жизни состояния XML файла обменника,
+# по истечении файл будет распарсен заново даже без изменений
+XML_FEED_STATE_TIMEOUT = 60 * 60 * 24
+
+
+def get_directions_version() -> int:
+    '''
+    Текущая версия справочника направлений и городов для парсинга.
+    Увеличивается сигналами при изменении NewDirection/City
+    '''
+    if (version := cache.get('directions_version')) is None:
+        version = 1
+        cache.add('directions_version', version, None)
+
+    return version
+
+
+def bump_directions_version():
+    try:
+        cache.incr('directions_version')
+    except ValueError:
+        cache.set('directions_version', 1, None)
+
+
+def get_xml_feed_state_key(exchange_id: int,
+                           version: int):
+    return f'xml_feed_state_{version}_{exchange_id}'
+
+
+def get_xml_feed_states(exchange_ids: list[int]) -> dict[int, dict]:
+    '''
+    Состояния последних успешно обработанных XML файлов обменников
+    (digest содержимого, ETag, Last-Modified) одним запросом в кэш
+    '''
+    version = get_directions_version()
+
+    keys = {get_xml_feed_state_key(exchange_id, version): exchange_id
+            for exchange_id in exchange_ids}
+
+    return {keys[key]: feed_state
+            for key, feed_state in cache.get_many(keys).items()}
+
+
+def set_xml_feed_state(exchange_id: int,
+                       feed_state: dict,
+                       version: int):
+    cache.set(get_xml_feed_state_key(exchange_id, version),
+              feed_state,
+              XML_FEED_STATE_TIMEOUT)
+
+
+# время жизни состояния планировщика опроса обменника
+POLL_STATE_TIMEOUT = 60 * 60 * 24
+
+
+def get_poll_state_key(exchange_id: int):
+    return f'xml_poll_state_{exchange_id}'
+
+
+def get_poll_states(exchange_ids: list[int]) -> dict[int, dict]:
+    '''
+    Состояния планировщика опроса XML файлов обменников одним запросом в кэш
+    '''
+    keys = {get_poll_state_key(exchange_id): exchange_id
+            for exchange_id in exchange_ids}
+
+    return {keys[key]: poll_state
+            for key, poll_state in cache.get_many(keys).items()}
+
+
+def set_poll_states(poll_states: dict[int, dict]):
+    cache.set_many({get_poll_state_key(exchange_id): poll_state
+                    for exchange_id, poll_state in poll_states.items()},
+                   POLL_STATE_TIMEOUT)
+
+
+# хосты XML файлов, которые отвечают только через httpx (HTTP/2)
+def get_http2_hosts() -> dict[str, float]:
+    return cache.get('xml_http2_hosts', {})
+
+
+def set_http2_hosts(http2_hosts: dict[str, float]):
+    cache.set('xml_http2_hosts', http2_hosts, None)
+
+
+# признак работающего сервиса run_xml_fetcher,
+# пока он жив, периодическая задача get_xml_file_for_exchangers пропускается
+XML_FETCHER_HEARTBEAT_TIMEOUT = 60 * 5
+
+
+def set_xml_fetcher_heartbeat():
+    cache.set('xml_fetcher_heartbeat', True, XML_FETCHER_HEARTBEAT_TIMEOUT)
+
+
+def is_xml_fetcher_alive() -> bool:
+    return cache.get('xml_fetcher_heartbeat', False)
+
+
+# время жизни состояния предохранителя опроса обменника
+CIRCUIT_STATE_TIMEOUT = 60 * 60 * 24
+
+
+def get_circuit_state_key(exchange_id: int):
+    return f'xml_circuit_state_{exchange_id}'
+
+
+def get_circuit_states(exchange_ids: list[int]) -> dict[int, dict]:
+    '''
+    Состояния предохранителей опроса XML файлов обменников одним запросом в кэш
+    '''
+    keys = {get_circuit_state_key(exchange_id): exchange_id
+            for exchange_id in exchange_ids}
+
+    return {keys[key]: circuit_state
+            for key, circuit_state in cache.get_many(keys).items()}
+
+
+def set_circuit_states(circuit_states: dict[int, dict]):
+    cache.set_many({get_circuit_state_key(exchange_id): circuit_state
+                    for exchange_id, circuit_state in circuit_states.items()},
+                   CIRCUIT_STATE_TIMEOUT)
+
+
+# время последнего отзыва обменника, собранного с bestchange:
+# хранится отдельно от отзывов (отклонённые отзывы удаляются из БД,
+# курсор по БД откатился бы назад и они собрались бы снова)
+def get_review_cursor_key(exchange_id: int):
+    return f'review_cursor_{exchange_id}'
+
+
+def get_review_cursors(exchange_ids: list[int]) -> dict[int, datetime]:
+    keys = {get_review_cursor_key(exchange_id): exchange_id
+            for exchange_id in exchange_ids}
+
+    return {keys[key]: cursor
+            for key, cursor in cache.get_many(keys).items()}
+
+
+def set_review_cursors(cursors: dict[int, datetime]):
+    cache.set_many({get_review_cursor_key(exchange_id): cursor
+                    for exchange_id, cursor in cursors.items()},
+                   None)
+
+
+# информация обменника со страницы bestchange (курсы, резерв, возраст, страна)
+def get_exchange_info_key(exchange_id: int):
+    return f'exchange_info_{exchange_id}'
+
+
+def get_exchange_infos(exchange_ids: list[int]) -> dict[int, dict]:
+    keys = {get_exchange_info_key(exchange_id): exchange_id
+            for exchange_id in exchange_ids}
+
+    return {keys[key]: info
+            for key, info in cache.get_many(keys).items()}
+
+
+def set_exchange_infos(infos: dict[int, dict],
+                       timeout: int):
+    cache.set_many({get_exchange_info_key(exchange_id): info
+                    for exchange_id, info in infos.items()},
+                   timeout)
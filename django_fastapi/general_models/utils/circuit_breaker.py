@@ -0,0 +1,112 @@
+import random
+
+
+# Предохранитель опроса XML файла обменника:
+# closed - обычный опрос,
+# open - обменник пропускается без запроса до open_until,
+# half_open - open_until прошёл, делается одна пробная попытка
+# с коротким таймаутом и без повтора через httpx.
+# Удачная проба закрывает предохранитель, неудачная снова открывает
+# на вдвое больший срок
+
+# сколько ошибок подряд открывает предохранитель, по классу ошибки (active_status).
+# inactive - тех обслуживание, некорректный XML и прочие ошибки
+CIRCUIT_FAILURE_THRESHOLDS = {
+    'robot check error': 1,
+    'timeout error': 2,
+    'too large': 1,
+    'inactive': 3,
+}
+
+# на сколько секунд предохранитель открывается в первый раз,
+# проверка на робота ухудшается от частых запросов,
+# слишком большой XML не скачивается каждый цикл
+CIRCUIT_OPEN_INTERVALS = {
+    'robot check error': 10 * 60,
+    'timeout error': 60,
+    'too large': 30 * 60,
+    'inactive': 2 * 60,
+}
+
+# верхняя граница срока открытого предохранителя
+CIRCUIT_MAX_OPEN_INTERVAL = 60 * 60
+
+# таймаут пробного запроса в состоянии half_open
+CIRCUIT_PROBE_TIMEOUT = 5
+
+# разброс срока, чтобы пробы не собирались в один цикл
+CIRCUIT_JITTER = 0.1
+
+
+def get_circuit_mode(circuit_state: dict | None,
+                     now: float) -> str:
+    if circuit_state is None or circuit_state['state'] == 'closed':
+        return 'closed'
+
+    if circuit_state['open_until'] > now:
+        return 'open'
+
+    return 'half_open'
+
+
+def get_failure_class(outcome: str,
+                      active_status: str) -> str | None:
+    '''
+    Класс ошибки опроса или None, если опрос удачный.
+    Не изменившийся XML со статусом не active (тех обслуживание,
+    некорректный XML по результату парсинга) - тоже ошибка
+    '''
+    if outcome == 'error' or active_status != 'active':
+        return active_status if active_status in CIRCUIT_FAILURE_THRESHOLDS else 'inactive'
+
+
+def get_next_circuit_state(circuit_state: dict | None,
+                           outcome: str,
+                           active_status: str,
+                           now: float) -> dict:
+    '''
+    Состояние предохранителя после опроса обменника
+    (outcome и active_status - как в get_next_poll_state)
+    '''
+    if circuit_state is None:
+        circuit_state = {
+            'state': 'closed',
+            'failures': 0,
+            'open_count': 0,
+        }
+
+    failure_class = get_failure_class(outcome, active_status)
+
+    if failure_class is None:
+        return {
+            'state': 'closed',
+            'failures': 0,
+            'open_count': 0,
+        }
+
+    failures = circuit_state['failures'] + 1
+    open_count = circuit_state['open_count']
+
+    # неудачная проба (half_open) сразу открывает предохранитель снова
+    if circuit_state['state'] == 'closed'\
+        and failures < CIRCUIT_FAILURE_THRESHOLDS[failure_class]:
+        return {
+            'state': 'closed',
+            'failures': failures,
+            'open_count': open_count,
+            'failure_class': failure_class,
+        }
+
+    open_count += 1
+
+    open_interval = min(CIRCUIT_MAX_OPEN_INTERVAL,
+                        CIRCUIT_OPEN_INTERVALS[failure_class] * 2 ** (open_count - 1))
+    open_interval *= random.uniform(1 - CIRCUIT_JITTER, 1 + CIRCUIT_JITTER)
+
+    return {
+        'state': 'open',
+        'failures': failures,
+        'open_count': open_count,
+        'failure_class': failure_class,
+        'open_until': now + open_interval,
+    }
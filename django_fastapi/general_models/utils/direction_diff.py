@@ -0,0 +1,316 @@
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Model
+
+
+# поля, по которым сравниваются готовые направления с последним снимком
+BASE_DIFF_VALUE_FIELDS = (
+    'in_count',
+    'out_count',
+    'min_amount',
+    'max_amount',
+    'is_active',
+)
+CASH_DIFF_VALUE_FIELDS = BASE_DIFF_VALUE_FIELDS + (
+    'fromfee',
+    'params',
+)
+
+NO_CASH_DIFF_KEY_FIELDS = (
+    'direction_id',
+)
+CASH_DIFF_KEY_FIELDS = NO_CASH_DIFF_KEY_FIELDS + (
+    'city_id',
+)
+
+
+def get_exchange_directions_snapshot(model: type[Model],
+                                     exchange_id: int,
+                                     key_fields: tuple,
+                                     value_fields: tuple) -> dict[tuple, tuple]:
+    '''
+    Снимок готовых направлений обменника из БД одним запросом
+    в виде {ключ направления: (pk, значения полей)}
+    '''
+    key_len = len(key_fields)
+
+    rows = model.objects.filter(exchange_id=exchange_id)\
+                        .order_by()\
+                        .values_list('pk',
+                                     *key_fields,
+                                     *value_fields)
+
+    return {row[1:key_len + 1]: (row[0], row[key_len + 1:]) for row in rows}
+
+
+def diff_exchange_directions(snapshot: dict[tuple, tuple],
+                             direction_list: list[dict],
+                             key_fields: tuple,
+                             value_fields: tuple,
+                             renew_before: datetime | None = None):
+    '''
+    Сравнивает распарсенные направления со снимком из БД.
+    С renew_before снимок содержит expires_at последним значением,
+    направления со сроком раньше renew_before попадают в обновлённые
+    для продления срока (см. direction_expiry).
+    Возвращает (новые направления,
+                направления с изменившимися значениями,
+                pk активных направлений, которых больше нет в XML)
+    '''
+    create_list = []
+    update_list = []
+    parsed_keys = set()
+
+    value_len = len(value_fields)
+
+    for direction in direction_list:
+        key = tuple(direction[field] for field in key_fields)
+        parsed_keys.add(key)
+
+        if (current := snapshot.get(key)) is None:
+            create_list.append(direction)
+        elif current[1][:value_len] != tuple(direction[field] for field in value_fields):
+            update_list.append(direction)
+        elif renew_before is not None\
+            and ((expires_at := current[1][value_len]) is None or expires_at < renew_before):
+            update_list.append(direction)
+
+    is_active_index = value_fields.index('is_active')
+
+    deactivate_pks = [pk for key, (pk, values) in snapshot.items()
+                      if values[is_active_index] and key not in parsed_keys]
+
+    return (
+        create_list,
+        update_list,
+        deactivate_pks,
+    )
+
+
+def apply_exchange_directions_diff(model: type[Model],
+                                   create_list: list[dict],
+                                   update_list: list[dict],
+                                   deactivate_pks: list[int],
+                                   update_fields: list[str],
+                                   unique_fields: list[str],
+                                   batch_size: int,
+                                   expires_at: datetime | None = None):
+    '''
+    Пишет в БД только изменения: новые и изменившиеся направления
+    через upsert, пропавшие из XML - деактивация по pk
+    '''
+    lease = {} if expires_at is None else {'expires_at': expires_at}
+
+    if upsert_list := create_list + update_list:
+        model.objects.bulk_create([model(**direction, **lease) for direction in upsert_list],
+                                  update_conflicts=True,
+                                  update_fields=update_fields,
+                                  unique_fields=unique_fields,
+                                  batch_size=batch_size)
+
+    for i in range(0, len(deactivate_pks), batch_size):
+        model.objects.filter(pk__in=deactivate_pks[i:i + batch_size])\
+                        .update(is_active=False)
+
+
+class CopyRowsFile:
+    '''
+    Файлоподобный объект для COPY ... FROM STDIN,
+    строки формируются по мере чтения драйвером
+    '''
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+
+    def read(self, size: int = -1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._rows)
+            except StopIteration:
+                break
+
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+
+        return data
+
+    readline = read
+
+
+def get_copy_value(value):
+    '''
+    Значение в текстовом формате COPY
+    '''
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return str(value).replace('\\', '\\\\')\
+                     .replace('\t', '\\t')\
+                     .replace('\n', '\\n')\
+                     .replace('\r', '\\r')
+
+
+def copy_merge_exchange_directions(model: type[Model],
+                                   exchange_id: int,
+                                   direction_list: list[dict],
+                                   key_fields: tuple,
+                                   value_fields: tuple,
+                                   update_fields: list[str],
+                                   unique_fields: list[str],
+                                   expires_at: datetime | None = None,
+                                   renew_before: datetime | None = None):
+    '''
+    Быстрый путь для PostgreSQL: направления потоком через COPY
+    попадают во временную таблицу, затем одним INSERT ... ON CONFLICT
+    применяются только изменившиеся строки (и строки, срок которых
+    раньше renew_before) и одним UPDATE деактивируются
+    пропавшие из XML направления. Экземпляры моделей не создаются.
+    Возвращает (создано, обновлено, деактивировано)
+    '''
+    opts = model._meta
+    qn = connection.ops.quote_name
+
+    table = qn(opts.db_table)
+    staging_table = qn(f'tmp_{opts.db_table}')
+
+    # expires_at одинаковый для всех строк и в распарсенных направлениях не хранится
+    fields = unique_fields + [field for field in update_fields
+                              if field not in unique_fields and field != 'expires_at']
+    row_suffix = '\n'
+
+    if expires_at is not None:
+        row_suffix = f'\t{get_copy_value(expires_at)}\n'
+        fields.append('expires_at')
+
+    columns = [opts.get_field(field).column for field in fields]
+    column_list = ', '.join(qn(column) for column in columns)
+
+    conflict_columns = ', '.join(qn(opts.get_field(field).column)
+                                 for field in unique_fields)
+    update_set = ', '.join(f'{qn(column)} = EXCLUDED.{qn(column)}'
+                           for column in (opts.get_field(field).column
+                                          for field in update_fields))
+    value_columns = [qn(opts.get_field(field).column) for field in value_fields]
+    key_columns = [qn(opts.get_field(field).column) for field in key_fields]
+
+    direction_fields = fields[:-1] if expires_at is not None else fields
+
+    rows = ('\t'.join(get_copy_value(direction[field]) for field in direction_fields) + row_suffix
+            for direction in direction_list)
+
+    renew_condition = ''
+    renew_params = []
+
+    if expires_at is not None and renew_before is not None:
+        expires_at_column = qn(opts.get_field('expires_at').column)
+        renew_condition = f' OR t.{expires_at_column} IS NULL OR t.{expires_at_column} < %s'
+        renew_params = [renew_before]
+
+    with connection.cursor() as cursor:
+        # ON COMMIT DROP - временная таблица живёт только в текущей транзакции,
+        # что безопасно при транзакционном пуле pgbouncer
+        cursor.execute(f'DROP TABLE IF EXISTS pg_temp.{staging_table}')
+        cursor.execute(f'CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS '
+                       f'SELECT {column_list} FROM {table} WITH NO DATA')
+
+        cursor.copy_expert(f'COPY {staging_table} ({column_list}) FROM STDIN',
+                           CopyRowsFile(rows))
+
+        cursor.execute(
+            f'INSERT INTO {table} AS t ({column_list}) '
+            f'SELECT {column_list} FROM {staging_table} '
+            f'ON CONFLICT ({conflict_columns}) DO UPDATE SET {update_set} '
+            f'WHERE ({", ".join(f"t.{column}" for column in value_columns)}) '
+            f'IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in value_columns)})'
+            f'{renew_condition} '
+            f'RETURNING (xmax = 0)',
+            renew_params
+        )
+        is_created_list = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(
+            f'UPDATE {table} AS t SET {qn(opts.get_field("is_active").column)} = false '
+            f'WHERE t.{qn(opts.get_field("exchange_id").column)} = %s '
+            f'AND t.{qn(opts.get_field("is_active").column)} '
+            f'AND NOT EXISTS (SELECT 1 FROM {staging_table} AS s WHERE '
+            + ' AND '.join(f's.{column} = t.{column}' for column in key_columns)
+            + ')',
+            [exchange_id]
+        )
+        deactivate_count = cursor.rowcount
+
+    create_count = sum(is_created_list)
+
+    return (
+        create_count,
+        len(is_created_list) - create_count,
+        deactivate_count,
+    )
+
+
+def write_exchange_directions(model: type[Model],
+                              exchange_id: int,
+                              direction_list: list[dict],
+                              key_fields: tuple,
+                              value_fields: tuple,
+                              update_fields: list[str],
+                              unique_fields: list[str],
+                              batch_size: int,
+                              expires_at: datetime | None = None,
+                              renew_before: datetime | None = None):
+    '''
+    Запись распарсенных направлений обменника в БД.
+    На PostgreSQL - COPY во временную таблицу и слияние одним запросом,
+    на остальных БД (SQLite в тестах) - снимок, сравнение и ORM.
+    expires_at - новый срок записываемых направлений, не изменившимся
+    направлениям он записывается только если их срок раньше renew_before.
+    Возвращает (создано, обновлено, деактивировано)
+    '''
+    if connection.vendor == 'postgresql':
+        return copy_merge_exchange_directions(model,
+                                              exchange_id,
+                                              direction_list,
+                                              key_fields,
+                                              value_fields,
+                                              update_fields,
+                                              unique_fields,
+                                              expires_at=expires_at,
+                                              renew_before=renew_before)
+
+    lease_fields = ('expires_at',) if renew_before is not None else ()
+
+    snapshot = get_exchange_directions_snapshot(model,
+                                                exchange_id,
+                                                key_fields,
+                                                value_fields + lease_fields)
+    
+    create_list, update_list, deactivate_pks = diff_exchange_directions(snapshot,
+                                                                        direction_list,
+                                                                        key_fields,
+                                                                        value_fields,
+                                                                        renew_before=renew_before)
+
+    apply_exchange_directions_diff(model,
+                                   create_list,
+                                   update_list,
+                                   deactivate_pks,
+                                   update_fields=update_fields,
+                                   unique_fields=unique_fields,
+                                   batch_size=batch_size,
+                                   expires_at=expires_at)
+    
+    return (
+        len(create_list),
+        len(update_list),
+        len(deactivate_pks),
+    )
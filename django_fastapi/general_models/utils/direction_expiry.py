@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from time import sleep
+
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from config import (DIRECTION_TTL,
+                    DIRECTION_COMPACT_CHUNK_SIZE,
+                    DIRECTION_COMPACT_PAUSE)
+
+import cash.models as cash_models
+import no_cash.models as no_cash_models
+
+
+# Готовые направления из XML файлов живут до expires_at:
+# каждая запись направления продлевает срок на DIRECTION_TTL секунд,
+# чтения считают направления с истёкшим сроком неактивными.
+# Срок продлевается только у направлений, которым осталось меньше
+# половины DIRECTION_TTL, поэтому не изменившиеся направления
+# переписываются раз в DIRECTION_TTL / 2, а не каждый цикл.
+# is_active истёкших направлений выставляет фоновая задача
+# compact_expired_directions небольшими пачками.
+# expires_at = NULL - направление без срока (партнёрские, старые записи)
+
+EXPIRING_DIRECTION_MODELS = (
+    no_cash_models.NewExchangeDirection,
+    cash_models.NewExchangeDirection,
+)
+
+
+def get_direction_lease(now: datetime | None = None) -> tuple[datetime, datetime]:
+    '''
+    Новый срок жизни направлений и граница продления:
+    направления с expires_at раньше границы получают новый срок
+    '''
+    if now is None:
+        now = timezone.now()
+
+    return (
+        now + timedelta(seconds=DIRECTION_TTL),
+        now + timedelta(seconds=DIRECTION_TTL / 2),
+    )
+
+
+def get_not_expired_filter(prefix: str = '') -> Q:
+    '''
+    Фильтр не истёкших направлений для чтения
+    (prefix - путь до модели направления, например "exchange_directions__")
+    '''
+    return Q(**{f'{prefix}expires_at__isnull': True})\
+            | Q(**{f'{prefix}expires_at__gt': timezone.now()})
+
+
+def renew_directions_lease(exchange_ids: list[int]) -> int:
+    '''
+    Продление срока активных направлений обменников, XML файлы
+    которых не изменились (направления в этом случае не переписываются).
+    Возвращает количество продлённых направлений
+    '''
+    if not exchange_ids:
+        return 0
+
+    expires_at, renew_before = get_direction_lease()
+
+    renew_count = 0
+
+    for model in EXPIRING_DIRECTION_MODELS:
+        renew_count += model.objects.filter(exchange_id__in=exchange_ids,
+                                            is_active=True,
+                                            expires_at__lt=renew_before)\
+                                    .update(expires_at=expires_at)
+
+    return renew_count
+
+
+def deactivate_by_chunks(queryset: QuerySet,
+                         chunk_size: int = DIRECTION_COMPACT_CHUNK_SIZE,
+                         pause: float = DIRECTION_COMPACT_PAUSE) -> list[int]:
+    '''
+    Выставляет is_active=False записям queryset пачками по pk
+    с паузой между пачками, чтобы не держать долгие блокировки.
+    Условия queryset перепроверяются при обновлении каждой пачки
+    (направление могло получить новый срок после выборки).
+    Возвращает pk выбранных записей
+    '''
+    queryset = queryset.filter(is_active=True).order_by()
+
+    deactivated_pks = []
+
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+
+        if not pks:
+            break
+
+        with transaction.atomic():
+            queryset.filter(pk__in=pks).update(is_active=False)
+
+        deactivated_pks.extend(pks)
+
+        if len(pks) < chunk_size:
+            break
+
+        sleep(pause)
+
+    return deactivated_pks
+
+
+def compact_expired_directions() -> dict[str, int]:
+    '''
+    Деактивация направлений с истёкшим сроком.
+    Возвращает {таблица: количество деактивированных}
+    '''
+    now = timezone.now()
+
+    return {
+        model._meta.db_table: len(deactivate_by_chunks(model.objects.filter(expires_at__lte=now)))
+        for model in EXPIRING_DIRECTION_MODELS
+    }
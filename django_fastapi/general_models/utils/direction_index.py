@@ -0,0 +1,88 @@
+from time import time
+
+from django.core.cache import cache
+
+import cash.models as cash_models
+import no_cash.models as no_cash_models
+
+from .cache import get_directions_version
+
+
+# страховочное время жизни индекса на случай изменений
+# справочника в обход сигналов (bulk_create, raw SQL)
+DIRECTION_INDEX_TIMEOUT = 60 * 60
+
+# индекс текущего процесса воркера, переиспользуется всеми задачами парсинга
+_direction_index = {
+    'version': None,
+    'created_at': 0,
+    'index': None,
+}
+
+
+def get_direction_index_key(version: int):
+    return f'direction_index_{version}'
+
+
+def build_direction_index() -> dict:
+    '''
+    Компактный индекс для парсинга XML файлов обменников:
+    cities - {кодовое имя города: city_id} (только is_parse=True),
+    CASH - {(valute_from, valute_to): direction_id} наличных направлений,
+    NOCASH - {(valute_from, valute_to): direction_id} безналичных направлений.
+    Города и направления хранятся отдельно, без декартова произведения
+    '''
+    cities = {}
+
+    for city_id, city_code_name in cash_models.City.objects\
+                                            .filter(is_parse=True)\
+                                            .values_list('pk',
+                                                         'code_name'):
+        cities.setdefault(city_code_name, city_id)
+
+    cash_directions = {}
+
+    for direction_id, valute_from, valute_to in cash_models.NewDirection.objects\
+                                                            .values_list('pk',
+                                                                         'valute_from__code_name',
+                                                                         'valute_to__code_name'):
+        cash_directions.setdefault((valute_from, valute_to), direction_id)
+
+    no_cash_directions = {}
+
+    for direction_id, valute_from, valute_to in no_cash_models.NewDirection.objects\
+                                                                .values_list('pk',
+                                                                             'valute_from',
+                                                                             'valute_to'):
+        no_cash_directions[(valute_from, valute_to)] = direction_id
+
+    return {
+        'cities': cities,
+        'CASH': cash_directions,
+        'NOCASH': no_cash_directions,
+    }
+
+
+def get_direction_index() -> dict:
+    '''
+    Индекс направлений для текущей версии справочника.
+    Строится один раз на версию (общий через кэш),
+    в процессе воркера хранится до смены версии
+    '''
+    version = get_directions_version()
+
+    if _direction_index['version'] == version\
+        and time() - _direction_index['created_at'] < DIRECTION_INDEX_TIMEOUT:
+        return _direction_index['index']
+
+    key = get_direction_index_key(version)
+
+    if (index := cache.get(key)) is None:
+        index = build_direction_index()
+        cache.set(key, index, DIRECTION_INDEX_TIMEOUT)
+
+    _direction_index.update(version=version,
+                            created_at=time(),
+                            index=index)
+
+    return index
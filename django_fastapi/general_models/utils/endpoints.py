@@ -63,6 +63,7 @@ from general_models.schemas import (NewSpecialDirectionMultiWithAmlModel,
                                     InfoSchema,
                                     NewExchangeLinkCountSchema)
 from general_models.utils.base import annotate_string_field
+from general_models.utils.direction_expiry import get_not_expired_filter
 from general_models.utils.http_exc import comment_exception_json, review_exception_json
 
 from partners.utils.endpoints import generate_partner_direction_country_level
@@ -994,14 +995,14 @@ def new_get_exchange_directions_count_dict(exchange_list: list[Exchanger],
 
     no_cash_exchange_directions =  no_cash_models.NewExchangeDirection.objects\
         .select_related('exchange')\
-        .filter(is_active=True, exchange__is_active=True)\
+        .filter(get_not_expired_filter(), is_active=True, exchange__is_active=True)\
         .values("exchange_id")\
         .annotate(total=Count("id"))\
         .values_list("exchange_id", "total")
 
     cash_exchange_directions = cash_models.NewExchangeDirection.objects\
         .select_related('exchange')\
-        .filter(is_active=True, exchange__is_active=True)\
+        .filter(get_not_expired_filter(), is_active=True, exchange__is_active=True)\
         .values("exchange_id")\
         .annotate(total=Count("id"))\
         .values_list("exchange_id", "total")\
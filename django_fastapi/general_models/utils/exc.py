@@ -11,4 +11,15 @@ class RobotCheckError(Exception):
 
 
 class TimeoutError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class XmlNotModified(Exception):
+    pass
+
+
+class InvalidXmlFile(Exception):
+    pass
+
+
+class XmlTooLarge(Exception):
+    pass
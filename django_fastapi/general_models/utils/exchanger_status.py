@@ -0,0 +1,148 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, When, Value, BooleanField, CharField
+from django.utils import timezone
+
+from general_models.models import Exchanger, ExchangerStatusHistory
+
+
+# статусы, выставленные вручную, обход XML файлов не перезаписывает
+MANUAL_ACTIVE_STATUSES = ('disabled', 'scam', 'skip')
+
+
+def write_exchanger_statuses(exchangers: dict[int, Exchanger],
+                             statuses: dict[int, tuple[bool, str]],
+                             source: str) -> int:
+    '''
+    Запись статусов обменников: в БД попадают только изменившиеся статусы
+    (сравнение с загруженными объектами exchangers), одним UPDATE с CASE.
+    Обменники с ручным статусом (disabled, scam, skip) не изменяются,
+    каждый переход пишется в историю статусов ExchangerStatusHistory.
+    Объекты exchangers получают новые значения, возвращает число переходов
+    '''
+    transitions = {exchange_id: status for exchange_id, status in statuses.items()
+                   if status != (exchangers[exchange_id].is_active,
+                                 exchangers[exchange_id].active_status)}
+
+    if not transitions:
+        return 0
+
+    with transaction.atomic():
+        # ручной статус мог быть выставлен в админке после загрузки объектов
+        skip_ids = set(Exchanger.objects.filter(pk__in=transitions.keys(),
+                                                active_status__in=MANUAL_ACTIVE_STATUSES)\
+                                        .values_list('pk', flat=True))
+
+        transitions = {exchange_id: status for exchange_id, status in transitions.items()
+                       if exchange_id not in skip_ids}
+
+        if not transitions:
+            return 0
+
+        Exchanger.objects.filter(pk__in=transitions.keys())\
+                         .update(is_active=Case(*[When(pk=exchange_id, then=Value(is_active))
+                                                  for exchange_id, (is_active, _) in transitions.items()],
+                                                output_field=BooleanField()),
+                                 active_status=Case(*[When(pk=exchange_id, then=Value(active_status))
+                                                      for exchange_id, (_, active_status) in transitions.items()],
+                                                    output_field=CharField()))
+
+        time_create = timezone.now()
+
+        ExchangerStatusHistory.objects.bulk_create([
+            ExchangerStatusHistory(exchange_id=exchange_id,
+                                   is_active=is_active,
+                                   active_status=active_status,
+                                   prev_is_active=exchangers[exchange_id].is_active,
+                                   prev_active_status=exchangers[exchange_id].active_status,
+                                   source=source,
+                                   time_create=time_create)
+            for exchange_id, (is_active, active_status) in transitions.items()
+        ])
+
+    for exchange_id, (is_active, active_status) in transitions.items():
+        exchangers[exchange_id].is_active = is_active
+        exchangers[exchange_id].active_status = active_status
+
+    return len(transitions)
+
+
+def set_exchanger_status(exchange: Exchanger,
+                         is_active: bool,
+                         active_status: str,
+                         source: str) -> bool:
+    '''
+    Статус одного обменника (см. write_exchanger_statuses),
+    True - статус изменился
+    '''
+    return bool(write_exchanger_statuses({exchange.pk: exchange},
+                                         {exchange.pk: (is_active, active_status)},
+                                         source))
+
+
+def record_exchanger_status(exchange: Exchanger,
+                            prev_is_active: bool,
+                            prev_active_status: str,
+                            source: str):
+    '''
+    Запись в историю статуса, уже сохранённого в обход write_exchanger_statuses
+    (изменение в админке)
+    '''
+    ExchangerStatusHistory.objects.create(exchange=exchange,
+                                          is_active=exchange.is_active,
+                                          active_status=exchange.active_status,
+                                          prev_is_active=prev_is_active,
+                                          prev_active_status=prev_active_status,
+                                          source=source)
+
+
+def get_exchangers_uptime(exchange_ids: list[int],
+                          days: int = 7) -> dict[int, float]:
+    '''
+    Доля времени за последние days дней, когда обменник был активен.
+    Считается только по переходам за период: статус на начало периода -
+    предыдущий статус первого перехода, без переходов - текущий статус
+    '''
+    now = timezone.now()
+    since = now - timedelta(days=days)
+
+    transitions = {}
+
+    history = ExchangerStatusHistory.objects.filter(exchange_id__in=exchange_ids,
+                                                    time_create__gte=since)\
+                                            .order_by('exchange_id', 'time_create')\
+                                            .values_list('exchange_id',
+                                                         'time_create',
+                                                         'is_active',
+                                                         'prev_is_active')
+
+    for exchange_id, time_create, is_active, prev_is_active in history:
+        transitions.setdefault(exchange_id, []).append((time_create, is_active, prev_is_active))
+
+    current = dict(Exchanger.objects.filter(pk__in=exchange_ids)\
+                                    .values_list('pk', 'is_active'))
+
+    uptime = {}
+
+    for exchange_id, current_is_active in current.items():
+        exchange_transitions = transitions.get(exchange_id, [])
+
+        is_active = exchange_transitions[0][2] if exchange_transitions else current_is_active
+
+        active_seconds = 0
+        start = since
+
+        for time_create, next_is_active, _prev_is_active in exchange_transitions:
+            if is_active:
+                active_seconds += (time_create - start).total_seconds()
+
+            start = time_create
+            is_active = next_is_active
+
+        if is_active:
+            active_seconds += (now - start).total_seconds()
+
+        uptime[exchange_id] = active_seconds / (now - since).total_seconds()
+
+    return uptime
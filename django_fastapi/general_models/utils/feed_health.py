@@ -0,0 +1,225 @@
+from bisect import bisect_left
+from time import time
+
+from django.core.cache import cache
+
+from config import FEED_HEALTH_RING_SIZE, FEED_HEALTH_HOURS
+
+
+# Здоровье XML файлов обменников без записи в БД:
+# по каждому обменнику в кэше хранятся кольцевые буферы фиксированного размера -
+# последние FEED_HEALTH_RING_SIZE опросов (samples) и почасовые агрегаты
+# за FEED_HEALTH_HOURS часов (hours) с гистограммой времени получения.
+# Обход пишет буферы всех опрошенных обменников одним set_many за цикл
+
+# верхние границы корзин гистограммы времени получения XML (сек)
+FEED_HEALTH_LATENCY_BINS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, float('inf'))
+
+# окна статистики (сек)
+FEED_HEALTH_WINDOWS = {
+    '1h': 60 * 60,
+    '24h': 60 * 60 * 24,
+    '7d': 60 * 60 * 24 * 7,
+}
+
+FEED_HEALTH_TIMEOUT = 60 * 60 * (FEED_HEALTH_HOURS + 24)
+
+
+def get_feed_health_key(exchange_id: int):
+    return f'feed_health_{exchange_id}'
+
+
+def new_feed_health() -> dict:
+    return {
+        # [время, сек, байт, items, исход опроса, статус]
+        'samples': [],
+        'hours': [],
+        'last_status': None,
+    }
+
+
+def new_feed_health_hour(hour: int) -> dict:
+    return {
+        'hour': hour,
+        'count': 0,
+        'up': 0,
+        'changes': 0,
+        'errors': 0,
+        'bytes': 0,
+        'byte_polls': 0,
+        'items': 0,
+        'item_polls': 0,
+        'latency': [0] * len(FEED_HEALTH_LATENCY_BINS),
+    }
+
+
+def add_feed_health_sample(health: dict,
+                           sample: dict):
+    '''
+    Добавление опроса в кольцевые буферы обменника
+    (sample - ts, latency, bytes, items, outcome, status)
+    '''
+    is_changed = health['last_status'] is not None\
+        and health['last_status'] != sample['status']
+
+    health['last_status'] = sample['status']
+
+    health['samples'].append([sample['ts'],
+                              sample['latency'],
+                              sample['bytes'],
+                              sample['items'],
+                              sample['outcome'],
+                              sample['status']])
+    del health['samples'][:-FEED_HEALTH_RING_SIZE]
+
+    hour = int(sample['ts'] // 3600)
+
+    if not health['hours'] or health['hours'][-1]['hour'] != hour:
+        health['hours'].append(new_feed_health_hour(hour))
+        del health['hours'][:-FEED_HEALTH_HOURS]
+
+    bucket = health['hours'][-1]
+
+    bucket['count'] += 1
+    bucket['up'] += sample['status'] == 'active'
+    bucket['changes'] += is_changed
+    bucket['errors'] += sample['outcome'] == 'error'
+
+    if sample['bytes']:
+        bucket['bytes'] += sample['bytes']
+        bucket['byte_polls'] += 1
+
+    if sample['items']:
+        bucket['items'] += sample['items']
+        bucket['item_polls'] += 1
+
+    bucket['latency'][bisect_left(FEED_HEALTH_LATENCY_BINS, sample['latency'])] += 1
+
+
+def record_feed_health(samples: list[dict]):
+    '''
+    Запись опросов за цикл обхода: одно чтение и одна запись в кэш
+    '''
+    if not samples:
+        return
+
+    keys = {get_feed_health_key(sample['exchange_id']): sample for sample in samples}
+
+    healths = cache.get_many(keys)
+
+    for key, sample in keys.items():
+        add_feed_health_sample(healths.setdefault(key, new_feed_health()),
+                               sample)
+
+    cache.set_many(healths, FEED_HEALTH_TIMEOUT)
+
+
+def get_percentile(values: list[float],
+                   percentile: float) -> float | None:
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return round(values[min(len(values) - 1, int(len(values) * percentile / 100))], 3)
+
+
+def get_histogram_percentile(histogram: list[int],
+                             percentile: float) -> float | None:
+    '''
+    Перцентиль по гистограмме - верхняя граница корзины
+    (последняя корзина - граница предпоследней)
+    '''
+    total = sum(histogram)
+
+    if not total:
+        return None
+
+    rank = total * percentile / 100
+    count = 0
+
+    for i, bin_count in enumerate(histogram):
+        count += bin_count
+
+        if count >= rank and bin_count:
+            return FEED_HEALTH_LATENCY_BINS[min(i, len(FEED_HEALTH_LATENCY_BINS) - 2)]
+
+
+def get_feed_health_window(health: dict,
+                           window: int,
+                           now: float) -> dict:
+    '''
+    Статистика окна: окна не длиннее часа считаются по последним опросам
+    (точные перцентили), длинные - по почасовым агрегатам
+    '''
+    since = now - window
+
+    if window <= 3600:
+        samples = [sample for sample in health['samples'] if sample[0] >= since]
+
+        latencies = [sample[1] for sample in samples]
+        statuses = [sample[5] for sample in samples]
+
+        count = len(samples)
+        up = sum(status == 'active' for status in statuses)
+        changes = sum(prev != status for prev, status in zip(statuses, statuses[1:]))
+        errors = sum(sample[4] == 'error' for sample in samples)
+        byte_counts = [sample[2] for sample in samples if sample[2]]
+        item_counts = [sample[3] for sample in samples if sample[3]]
+
+        percentiles = {f'p{p}': get_percentile(latencies, p) for p in (50, 95, 99)}
+        avg_bytes = sum(byte_counts) / len(byte_counts) if byte_counts else None
+        avg_items = sum(item_counts) / len(item_counts) if item_counts else None
+    else:
+        hours = [bucket for bucket in health['hours'] if bucket['hour'] >= since // 3600]
+
+        histogram = [sum(counts) for counts in zip(*[bucket['latency'] for bucket in hours])]
+
+        count = sum(bucket['count'] for bucket in hours)
+        up = sum(bucket['up'] for bucket in hours)
+        changes = sum(bucket['changes'] for bucket in hours)
+        errors = sum(bucket['errors'] for bucket in hours)
+
+        percentiles = {f'p{p}': get_histogram_percentile(histogram, p) for p in (50, 95, 99)}
+        byte_polls = sum(bucket['byte_polls'] for bucket in hours)
+        item_polls = sum(bucket['item_polls'] for bucket in hours)
+
+        avg_bytes = sum(bucket['bytes'] for bucket in hours) / byte_polls if byte_polls else None
+        avg_items = sum(bucket['items'] for bucket in hours) / item_polls if item_polls else None
+
+    return {
+        'polls': count,
+        'errors': errors,
+        'uptime': round(up / count * 100, 2) if count else None,
+        'changes': changes,
+        'changes_per_hour': round(changes / (window / 3600), 2),
+        'avg_bytes': round(avg_bytes) if avg_bytes is not None else None,
+        'avg_items': round(avg_items) if avg_items is not None else None,
+        **percentiles,
+    }
+
+
+def get_feed_health(exchange_ids: list[int]) -> dict[int, dict]:
+    '''
+    Статистика XML файлов обменников по окнам 1h/24h/7d
+    '''
+    now = time()
+
+    healths = cache.get_many([get_feed_health_key(exchange_id)
+                              for exchange_id in exchange_ids])
+
+    result = {}
+
+    for exchange_id in exchange_ids:
+        health = healths.get(get_feed_health_key(exchange_id))
+
+        if health is None:
+            continue
+
+        result[exchange_id] = {
+            'status': health['last_status'],
+            'windows': {name: get_feed_health_window(health, window, now)
+                        for name, window in FEED_HEALTH_WINDOWS.items()},
+        }
+
+    return result
@@ -0,0 +1,95 @@
+from django.db import transaction
+
+from config import FEED_REJECTION_KEEP, FEED_REJECTION_SAMPLE_SIZE
+
+from general_models.models import FeedRejectionStat
+
+
+# Причины, по которым элементы XML файла обменника не попадают в направления.
+# Счётчики ведутся по элементам <item>, дубли - по направлениям
+# (наличное предложение раскладывается на направления по городам)
+FEED_REJECTION_REASONS = (
+    'missing_pair',     # нет <from> или <to>
+    'unknown_pair',     # пары валют нет в справочнике направлений
+    'unknown_city',     # ни одного известного города из <city>
+    'missing_fields',   # нет курса или лимитов
+    'invalid_min_max',  # лимиты не прошли check_valid_min_max_amount
+    'normalize_error',  # курс, комиссия или лимиты не разбираются
+    'duble',            # повтор направления
+    'item_error',       # прочие ошибки разбора элемента
+)
+
+
+def new_feed_rejections() -> dict:
+    return {
+        'counts': {},
+        'samples': {},
+    }
+
+
+def add_feed_rejection(rejections: dict | None,
+                       reason: str,
+                       key: str | None = None):
+    '''
+    Учёт отклонённого элемента, для каждой причины хранится
+    не больше FEED_REJECTION_SAMPLE_SIZE примеров ключей
+    '''
+    if rejections is None:
+        return
+
+    rejections['counts'][reason] = rejections['counts'].get(reason, 0) + 1
+
+    if key is not None:
+        samples = rejections['samples'].setdefault(reason, [])
+
+        if len(samples) < FEED_REJECTION_SAMPLE_SIZE and key not in samples:
+            samples.append(key)
+
+
+def save_feed_rejections(exchange_id: int,
+                         rejections: dict | None,
+                         item_count: int):
+    '''
+    Запись счётчиков одного цикла парсинга обменника,
+    у обменника остаются последние FEED_REJECTION_KEEP записей
+    '''
+    if not rejections or not rejections['counts']:
+        return
+
+    with transaction.atomic():
+        FeedRejectionStat.objects.create(exchange_id=exchange_id,
+                                         item_count=item_count,
+                                         samples=rejections['samples'],
+                                         **{reason: rejections['counts'].get(reason, 0)
+                                            for reason in FEED_REJECTION_REASONS})
+
+        old_ids = FeedRejectionStat.objects.filter(exchange_id=exchange_id)\
+                                           .order_by('-time_create', '-pk')\
+                                           .values_list('pk', flat=True)[FEED_REJECTION_KEEP:]
+
+        FeedRejectionStat.objects.filter(pk__in=list(old_ids)).delete()
+
+
+def get_feed_rejections(exchange_id: int | None = None,
+                        limit: int = 100) -> list[dict]:
+    '''
+    Последние циклы с отклонёнными элементами (по обменнику или по всем)
+    '''
+    queryset = FeedRejectionStat.objects.select_related('exchange')\
+                                        .order_by('-time_create', '-pk')
+
+    if exchange_id is not None:
+        queryset = queryset.filter(exchange_id=exchange_id)
+
+    return [
+        {
+            'exchange_id': stat.exchange_id,
+            'exchange_name': stat.exchange.name,
+            'time_create': stat.time_create,
+            'item_count': stat.item_count,
+            'rejected_count': stat.rejected_count,
+            'counts': {reason: getattr(stat, reason) for reason in FEED_REJECTION_REASONS},
+            'samples': stat.samples,
+        }
+        for stat in queryset[:limit]
+    ]
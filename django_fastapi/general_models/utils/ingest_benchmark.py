@@ -0,0 +1,312 @@
+import io
+import os
+import json
+import resource
+
+from contextlib import redirect_stdout, nullcontext
+from pathlib import Path
+from time import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from general_models.models import Exchanger, NewValute
+
+import cash.models as cash_models
+import no_cash.models as no_cash_models
+
+from .direction_index import build_direction_index
+from .parsers import parse_xml_and_create_or_update_directions
+from .xml_stream import iter_xml_items
+from .xml_snapshots import open_xml_file, find_xml_snapshot
+
+
+# префикс синтетических записей справочника и обменников бенчмарка
+BENCHMARK_PREFIX = 'benchmark'
+
+# метрики сводки: (ключ, больше - лучше)
+BENCHMARK_SUMMARY_METRICS = (
+    ('items_per_sec', True),
+    ('parse_time', False),
+    ('db_time', False),
+    ('peak_rss_mb', False),
+)
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss в Linux - в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_xml_paths(xml_dir: str) -> dict[str, Path]:
+    '''
+    XML файлы каталога по exchange_id: последняя версия из хранилища
+    (<xml_dir>/<exchange_id>/<digest>.xml.gz, см. xml_snapshots)
+    или обычный файл <exchange_id>.xml.
+    Ключ - exchange_id, а не имя файла: digest меняется с каждой версией,
+    а сравнение с сохранённым прогоном идёт по обменникам
+    '''
+    if not os.path.isdir(xml_dir):
+        return {}
+
+    paths = {path.stem: path for path in Path(xml_dir).glob('*.xml')
+             if path.is_file()}
+
+    for snapshot_dir in Path(xml_dir).iterdir():
+        if not (snapshot_dir.is_dir() and snapshot_dir.name.isdigit()):
+            continue
+
+        snapshot = find_xml_snapshot(int(snapshot_dir.name),
+                                     snapshot_dir=xml_dir)
+
+        if snapshot is not None:
+            paths[snapshot_dir.name] = Path(snapshot['path'])
+
+    return dict(sorted(paths.items()))
+
+
+def collect_xml_catalogue(paths: list[Path]) -> dict:
+    '''
+    Валюты, направления и города, встречающиеся в XML файлах.
+    Коды длиннее поля code_name пропускаются
+    '''
+    max_code_length = NewValute._meta.get_field('code_name').max_length
+    max_city_length = cash_models.City._meta.get_field('code_name').max_length
+
+    catalogue = {
+        'valutes': set(),
+        'cash': set(),
+        'no_cash': set(),
+        'cities': set(),
+    }
+
+    for path in paths:
+        try:
+            with open_xml_file(path) as xml_file:
+                for element in iter_xml_items(xml_file):
+                    valute_from = element.findtext('from')
+                    valute_to = element.findtext('to')
+
+                    if not (valute_from and valute_to)\
+                        or max(len(valute_from), len(valute_to)) > max_code_length:
+                        continue
+
+                    catalogue['valutes'].update((valute_from, valute_to))
+
+                    if city := element.findtext('city'):
+                        catalogue['cash'].add((valute_from, valute_to))
+                        catalogue['cities'].update(c.strip() for c in city.upper().split(',')
+                                                   if 0 < len(c.strip()) <= max_city_length)
+                    else:
+                        catalogue['no_cash'].add((valute_from, valute_to))
+        except Exception as ex:
+            print('ошибка чтения xml', path.name, ex)
+
+    return catalogue
+
+
+def create_synthetic_catalogue(catalogue: dict):
+    '''
+    Недостающие валюты, направления и города справочника
+    (вызывается внутри откатываемой транзакции бенчмарка)
+    '''
+    exists_valutes = set(NewValute.objects.filter(code_name__in=catalogue['valutes'])\
+                                            .values_list('code_name', flat=True))
+
+    NewValute.objects.bulk_create([NewValute(name=f'{BENCHMARK_PREFIX} {code_name}',
+                                             code_name=code_name,
+                                             type_valute='Криптовалюта',
+                                             icon_url='')
+                                   for code_name in catalogue['valutes'] - exists_valutes])
+
+    cash_models.NewDirection.objects.bulk_create([cash_models.NewDirection(valute_from_id=valute_from,
+                                                                           valute_to_id=valute_to)
+                                                  for valute_from, valute_to in catalogue['cash']],
+                                                 ignore_conflicts=True)
+    no_cash_models.NewDirection.objects.bulk_create([no_cash_models.NewDirection(valute_from_id=valute_from,
+                                                                                 valute_to_id=valute_to)
+                                                     for valute_from, valute_to in catalogue['no_cash']],
+                                                    ignore_conflicts=True)
+
+    country, _ = cash_models.Country.objects.get_or_create(name=BENCHMARK_PREFIX,
+                                                           defaults={'en_name': BENCHMARK_PREFIX})
+
+    exists_cities = set(cash_models.City.objects.filter(code_name__in=catalogue['cities'])\
+                                                .values_list('code_name', flat=True))
+
+    cash_models.City.objects.filter(code_name__in=exists_cities)\
+                            .update(is_parse=True)
+    cash_models.City.objects.bulk_create([cash_models.City(name=f'{BENCHMARK_PREFIX} {code_name}',
+                                                           en_name=f'{BENCHMARK_PREFIX} {code_name}',
+                                                           code_name=code_name,
+                                                           country=country,
+                                                           is_parse=True)
+                                          for code_name in catalogue['cities'] - exists_cities])
+
+
+def run_ingest_benchmark(xml_dir: str,
+                         rounds: int = 2,
+                         verbose: bool = False) -> dict:
+    '''
+    Прогон XML файлов каталога через parse_xml_and_create_or_update_directions.
+    Справочник и обменники (по одному на файл) создаются синтетически,
+    вся работа выполняется в одной транзакции, которая откатывается в конце.
+    Первый проход - запись с нуля, следующие - повторная запись тех же файлов
+    '''
+    paths = get_xml_paths(xml_dir)
+
+    if not paths:
+        raise ValueError(f'в каталоге {xml_dir} нет XML файлов')
+
+    start_rss = get_peak_rss_mb()
+
+    results = {
+        'xml_dir': os.path.abspath(xml_dir),
+        'files': len(paths),
+        'rounds': rounds,
+        'exchangers': {},
+    }
+
+    with transaction.atomic():
+        start_time = time()
+
+        create_synthetic_catalogue(collect_xml_catalogue(list(paths.values())))
+
+        direction_index = build_direction_index()
+
+        exchangers = {
+            key: Exchanger.objects.create(name=f'{BENCHMARK_PREFIX} {key}',
+                                          partner_link=BENCHMARK_PREFIX,
+                                          is_parse=False,
+                                          time_create=timezone.now())
+            for key in paths
+        }
+
+        results['catalogue_time'] = time() - start_time
+
+        for _round in range(rounds):
+            for key, path in paths.items():
+                stats = {}
+
+                try:
+                    # вывод парсера скрывается, чтобы не смешивался с отчётом
+                    with nullcontext() if verbose else redirect_stdout(io.StringIO()):
+                        with open_xml_file(path) as xml_file:
+                            is_success = parse_xml_and_create_or_update_directions(exchangers[key],
+                                                                                   xml_file,
+                                                                                   direction_index,
+                                                                                   stats)
+                except Exception as ex:
+                    print('ошибка парсинга xml', key, path.name, ex)
+                    is_success = False
+
+                exchanger_result = results['exchangers'].setdefault(key, {
+                    'size_mb': path.stat().st_size / 1024 / 1024,
+                    'items': 0,
+                    'parse_time': 0,
+                    'db_time': 0,
+                    'rows': {},
+                    'errors': 0,
+                })
+
+                exchanger_result['items'] += stats.get('item_count', 0)
+                exchanger_result['parse_time'] += stats.get('parse_time', 0)
+                exchanger_result['db_time'] += stats.get('db_time', 0)
+                exchanger_result['errors'] += not is_success
+
+                for direction_rows in stats.get('rows', {}).values():
+                    for action, count in direction_rows.items():
+                        exchanger_result['rows'][action] = exchanger_result['rows'].get(action, 0) + count
+
+        # синтетический справочник, обменники и записанные направления не сохраняются
+        transaction.set_rollback(True)
+
+    for exchanger_result in results['exchangers'].values():
+        exchanger_result['items_per_sec'] = exchanger_result['items']\
+              / max(exchanger_result['parse_time'] + exchanger_result['db_time'], 1e-6)
+
+    exchanger_results = results['exchangers'].values()
+
+    results['items'] = sum(r['items'] for r in exchanger_results)
+    results['parse_time'] = sum(r['parse_time'] for r in exchanger_results)
+    results['db_time'] = sum(r['db_time'] for r in exchanger_results)
+    results['items_per_sec'] = results['items'] / max(results['parse_time'] + results['db_time'], 1e-6)
+    results['peak_rss_mb'] = get_peak_rss_mb()
+    results['rss_growth_mb'] = results['peak_rss_mb'] - start_rss
+
+    return results
+
+
+def format_benchmark_results(results: dict) -> list[str]:
+    lines = [
+        f'файлов {results["files"]}, проходов {results["rounds"]}, '
+        f'справочник {results["catalogue_time"]:.2f} sec',
+        f'{"обменник":<30} {"MB":>8} {"items":>10} {"parse s":>9} {"db s":>9} '
+        f'{"items/sec":>11} {"created":>9} {"updated":>9} {"deactiv.":>9} {"errors":>7}',
+    ]
+
+    for name, r in results['exchangers'].items():
+        lines.append(f'{name:<30} {r["size_mb"]:>8.2f} {r["items"]:>10} {r["parse_time"]:>9.3f} '
+                     f'{r["db_time"]:>9.3f} {r["items_per_sec"]:>11.0f} '
+                     f'{r["rows"].get("created", 0):>9} {r["rows"].get("updated", 0):>9} '
+                     f'{r["rows"].get("deactivated", 0):>9} {r["errors"]:>7}')
+
+    lines.append(f'ИТОГО: items {results["items"]}, парсинг {results["parse_time"]:.2f} sec, '
+                 f'запись в бд {results["db_time"]:.2f} sec, {results["items_per_sec"]:.0f} items/sec, '
+                 f'peak RSS {results["peak_rss_mb"]:.1f} MB (+{results["rss_growth_mb"]:.1f} MB)')
+
+    return lines
+
+
+def compare_with_baseline(results: dict,
+                          baseline: dict,
+                          threshold: float) -> tuple[list[str], list[str]]:
+    '''
+    Сравнение с сохранённым прогоном.
+    threshold - допустимое ухудшение метрики сводки в процентах
+    (метрики отдельных обменников только выводятся - на маленьких файлах они шумные).
+    Возвращает (строки отчёта, ухудшившиеся метрики)
+    '''
+    lines = []
+    regressions = []
+
+    def compare(name: str,
+                new_value: float,
+                old_value: float,
+                higher_is_better: bool,
+                is_checked: bool = True):
+        change = (new_value - old_value) / old_value * 100 if old_value else 0
+        worse = -change if higher_is_better else change
+
+        mark = ''
+        if is_checked and worse > threshold:
+            mark = ' РЕГРЕССИЯ'
+            regressions.append(name)
+
+        lines.append(f'{name:<45} {old_value:>12.3f} -> {new_value:>12.3f} ({change:+.1f}%){mark}')
+
+    for key, higher_is_better in BENCHMARK_SUMMARY_METRICS:
+        compare(key, results[key], baseline[key], higher_is_better)
+
+    for name, r in results['exchangers'].items():
+        if (old_r := baseline['exchangers'].get(name)) is not None:
+            compare(f'{name} items_per_sec',
+                    r['items_per_sec'],
+                    old_r['items_per_sec'],
+                    True,
+                    is_checked=False)
+
+    return (
+        lines,
+        regressions,
+    )
+
+
+def save_benchmark_results(results: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def load_benchmark_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.db.models import Sum
+
+from config import XML_PRIORITY_TRAFFIC_TOP
+
+import cash.models as cash_models
+import no_cash.models as no_cash_models
+
+
+# Полосы парсинга XML файлов обменников.
+# VIP обменники (выше в выдаче /directions) и обменники с наибольшим
+# числом переходов парсятся в отдельной очереди со своими воркерами,
+# поэтому очередь обычных обменников не задерживает их курсы.
+# Очереди объявлены в project/celery.py, воркеры - в docker-compose
+INGEST_LANE_QUEUES = {
+    'priority': 'cpu_priority_queue',
+    'default': 'cpu_queue',
+}
+
+# порядок постановки задач и опроса: сначала приоритетная полоса
+INGEST_LANE_ORDER = ('priority', 'default')
+
+# как часто пересчитывается список обменников с наибольшим числом переходов
+HIGH_TRAFFIC_TIMEOUT = 60 * 60
+
+
+def get_high_traffic_exchanger_ids() -> set[int]:
+    '''
+    XML_PRIORITY_TRAFFIC_TOP обменников с наибольшим числом переходов
+    по ссылкам (наличные и безналичные направления), кэшируется на час
+    '''
+    if (exchanger_ids := cache.get('xml_high_traffic_exchangers')) is None:
+        link_counts = {}
+
+        for model in (cash_models.NewExchangeLinkCount,
+                      no_cash_models.NewExchangeLinkCount):
+            rows = model.objects.filter(exchange_id__isnull=False)\
+                                .values('exchange_id')\
+                                .annotate(link_count=Sum('count'))\
+                                .order_by()\
+                                .values_list('exchange_id', 'link_count')
+
+            for exchange_id, link_count in rows:
+                link_counts[exchange_id] = link_counts.get(exchange_id, 0) + (link_count or 0)
+
+        exchanger_ids = sorted(link_counts,
+                               key=lambda exchange_id: link_counts[exchange_id],
+                               reverse=True)[:XML_PRIORITY_TRAFFIC_TOP]
+
+        cache.set('xml_high_traffic_exchangers', exchanger_ids, HIGH_TRAFFIC_TIMEOUT)
+
+    return set(exchanger_ids)
+
+
+def get_ingest_lane(exchange,
+                    high_traffic_ids: set[int]) -> str:
+    if exchange.is_vip or exchange.pk in high_traffic_ids:
+        return 'priority'
+
+    return 'default'
+
+
+def get_ingest_queue(lane: str) -> str:
+    return INGEST_LANE_QUEUES[lane]
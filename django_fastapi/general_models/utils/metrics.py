@@ -0,0 +1,289 @@
+import os
+import glob
+import resource
+
+import redis
+
+from prometheus_client import (Counter,
+                               Histogram,
+                               CollectorRegistry,
+                               REGISTRY,
+                               CONTENT_TYPE_LATEST,
+                               generate_latest)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from config import PROMETHEUS_METRICS_DIR, REDIS_URL
+
+from .ingest_lanes import INGEST_LANE_QUEUES
+
+
+# Метрики получения и парсинга XML файлов обменников.
+# Каждый сервис (API, воркеры Celery, run_xml_fetcher) пишет метрики
+# в свой каталог PROMETHEUS_MULTIPROC_DIR внутри общего тома PROMETHEUS_METRICS_DIR,
+# эндпоинт /metrics в API собирает их из всех каталогов
+
+# границы корзин для времени (сек) и размера XML файлов (байт)
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+BYTES_BUCKETS = (10_000, 100_000, 500_000, 1_000_000, 5_000_000,
+                 10_000_000, 25_000_000, 50_000_000, 100_000_000)
+# границы корзин для отставания данных от получения XML файла (сек)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+# границы корзин для памяти процесса (байт)
+RSS_BUCKETS = (1_000_000, 10_000_000, 50_000_000, 100_000_000, 250_000_000,
+               500_000_000, 1_000_000_000, 2_000_000_000, 4_000_000_000)
+# границы корзин для пропускной способности пакетного парсинга (элементов в секунду)
+ITEMS_RATE_BUCKETS = (1_000, 5_000, 10_000, 25_000, 50_000, 100_000,
+                      250_000, 500_000, 1_000_000)
+
+
+XML_FETCH_SECONDS = Histogram('xml_fetch_seconds',
+                              'Время получения XML файла обменника',
+                              ['exchanger', 'outcome'],
+                              buckets=SECONDS_BUCKETS)
+
+XML_FETCH_BYTES = Histogram('xml_fetch_bytes',
+                            'Размер полученного XML файла обменника',
+                            ['exchanger'],
+                            buckets=BYTES_BUCKETS)
+
+XML_PARSE_SECONDS = Histogram('xml_parse_seconds',
+                              'Время парсинга XML файла обменника',
+                              ['exchanger'],
+                              buckets=SECONDS_BUCKETS)
+
+XML_PARSE_ITEMS = Counter('xml_parse_items',
+                          'Количество элементов <item> в XML файлах обменника',
+                          ['exchanger'])
+
+XML_PARSE_DIRECTIONS = Counter('xml_parse_directions',
+                               'Распарсенные направления обменника: '
+                               'accepted - прошли нормализацию, '
+                               'invalid - отброшены нормализацией, duble - дубли',
+                               ['exchanger', 'direction_type', 'result'])
+
+XML_DB_SECONDS = Histogram('xml_db_seconds',
+                           'Время записи направлений обменника в БД',
+                           ['exchanger'],
+                           buckets=SECONDS_BUCKETS)
+
+XML_DB_ROWS = Counter('xml_db_rows',
+                      'Изменённые строки направлений обменника в БД',
+                      ['exchanger', 'direction_type', 'action'])
+
+XML_INGEST_QUEUE_SECONDS = Histogram('xml_ingest_queue_seconds',
+                                     'Время от получения XML файла до начала парсинга '
+                                     '(ожидание в очереди полосы)',
+                                     ['lane'],
+                                     buckets=LAG_BUCKETS)
+
+XML_INGEST_LAG_SECONDS = Histogram('xml_ingest_lag_seconds',
+                                   'Время от получения XML файла до записи направлений в БД '
+                                   '(свежесть курсов полосы)',
+                                   ['lane'],
+                                   buckets=LAG_BUCKETS)
+
+
+XML_TASK_PEAK_RSS_BYTES = Histogram('xml_task_peak_rss_bytes',
+                                    'Пиковая память процесса (RSS) за этап '
+                                    'обработки XML файлов: fetch - цикл обхода, parse - задача парсинга',
+                                    ['stage'],
+                                    buckets=RSS_BUCKETS)
+
+XML_TASK_RSS_GROWTH_BYTES = Histogram('xml_task_rss_growth_bytes',
+                                      'Рост памяти процесса (RSS) за этап обработки XML файлов '
+                                      'относительно памяти на начало этапа',
+                                      ['stage'],
+                                      buckets=RSS_BUCKETS)
+
+XML_BATCH_ITEMS_PER_SECOND = Histogram('xml_batch_items_per_second',
+                                       'Пропускная способность пакетной обработки XML файлов '
+                                       '(элементов <item> в секунду): parse - параллельный парсинг, '
+                                       'total - парсинг и запись в БД; workers - число процессов парсинга',
+                                       ['stage', 'workers'],
+                                       buckets=ITEMS_RATE_BUCKETS)
+
+
+class SharedMultiProcessCollector(MultiProcessCollector):
+    '''
+    Сборщик метрик из каталогов всех сервисов (path/<сервис>/*.db)
+    '''
+
+    def collect(self):
+        files = glob.glob(os.path.join(self._path, '*', '*.db'))
+
+        return self.merge(files, accumulate=True)
+
+
+class IngestQueueCollector:
+    '''
+    Длина очередей полос парсинга в брокере (Redis) на момент сбора метрик
+    '''
+
+    def collect(self):
+        gauge = GaugeMetricFamily('xml_ingest_queue_length',
+                                  'Задачи парсинга XML файлов, ожидающие в очереди полосы',
+                                  labels=['lane'])
+
+        try:
+            client = redis.Redis.from_url(REDIS_URL)
+
+            for lane, queue in INGEST_LANE_QUEUES.items():
+                gauge.add_metric([lane], client.llen(queue))
+        except redis.RedisError as ex:
+            print('ошибка получения длины очередей', ex)
+
+        yield gauge
+
+
+def get_metrics_registry():
+    if PROMETHEUS_METRICS_DIR and os.path.isdir(PROMETHEUS_METRICS_DIR):
+        registry = CollectorRegistry()
+        SharedMultiProcessCollector(registry, path=PROMETHEUS_METRICS_DIR)
+        registry.register(IngestQueueCollector())
+
+        return registry
+
+    # без общего каталога - метрики только текущего процесса
+    return REGISTRY
+
+
+def get_metrics() -> tuple[bytes, str]:
+    '''
+    Метрики в текстовом формате Prometheus и их Content-Type
+    '''
+    return (
+        generate_latest(get_metrics_registry()),
+        CONTENT_TYPE_LATEST,
+    )
+
+
+def observe_xml_fetch(exchanger_name: str,
+                      outcome: str,
+                      fetch_time: float,
+                      byte_count: int | None = None):
+    XML_FETCH_SECONDS.labels(exchanger_name, outcome).observe(fetch_time)
+
+    if byte_count is not None:
+        XML_FETCH_BYTES.labels(exchanger_name).observe(byte_count)
+
+
+def observe_xml_parse(exchanger_name: str,
+                      parse_time: float,
+                      item_count: int,
+                      direction_counts: dict[str, dict[str, int]]):
+    '''
+    direction_counts - {direction_type: {result: количество}}
+    '''
+    XML_PARSE_SECONDS.labels(exchanger_name).observe(parse_time)
+    XML_PARSE_ITEMS.labels(exchanger_name).inc(item_count)
+
+    for direction_type, counts in direction_counts.items():
+        for result, count in counts.items():
+            XML_PARSE_DIRECTIONS.labels(exchanger_name,
+                                        direction_type,
+                                        result).inc(count)
+
+
+def observe_xml_db_write(exchanger_name: str,
+                         direction_type: str,
+                         create_count: int,
+                         update_count: int,
+                         deactivate_count: int):
+    for action, count in (('created', create_count),
+                          ('updated', update_count),
+                          ('deactivated', deactivate_count)):
+        XML_DB_ROWS.labels(exchanger_name,
+                           direction_type,
+                           action).inc(count)
+
+
+def observe_xml_db_time(exchanger_name: str,
+                        db_time: float):
+    XML_DB_SECONDS.labels(exchanger_name).observe(db_time)
+
+
+def observe_xml_ingest_queue(lane: str,
+                             feed_state: dict | None,
+                             now: float):
+    if feed_state and (fetched_at := feed_state.get('fetched_at')):
+        XML_INGEST_QUEUE_SECONDS.labels(lane).observe(max(now - fetched_at, 0))
+
+
+def observe_xml_ingest_lag(lane: str,
+                           feed_state: dict | None,
+                           now: float):
+    if feed_state and (fetched_at := feed_state.get('fetched_at')):
+        XML_INGEST_LAG_SECONDS.labels(lane).observe(max(now - fetched_at, 0))
+
+
+def observe_xml_batch_throughput(item_count: int,
+                                 parse_time: float,
+                                 total_time: float,
+                                 workers: int):
+    if not item_count:
+        return
+
+    XML_BATCH_ITEMS_PER_SECOND.labels('parse', workers).observe(item_count / max(parse_time, 1e-6))
+    XML_BATCH_ITEMS_PER_SECOND.labels('total', workers).observe(item_count / max(total_time, 1e-6))
+
+
+def read_proc_status_bytes(field: str) -> int | None:
+    '''
+    Значение памяти из /proc/self/status (VmRSS, VmHWM) в байтах
+    или None, если /proc недоступен
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_peak_rss() -> int:
+    '''
+    Пиковая память процесса (RSS) в байтах с последнего reset_peak_rss.
+    Без /proc - ru_maxrss, пик за всё время жизни процесса (в Linux - в КБ)
+    '''
+    if (peak_rss := read_proc_status_bytes('VmHWM')) is not None:
+        return peak_rss
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak_rss() -> int:
+    '''
+    Сбрасывает пик памяти процесса перед этапом (запись 5 в /proc/self/clear_refs
+    сбрасывает VmHWM до текущего RSS): воркеры Celery и run_xml_fetcher живут долго,
+    и без сброса пик показывал бы самую большую задачу за всё время процесса.
+    Возвращает память процесса на начало этапа в байтах
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        # сброс недоступен - рост считается от пика процесса
+        return get_peak_rss()
+
+    if (rss := read_proc_status_bytes('VmRSS')) is not None:
+        return rss
+
+    return get_peak_rss()
+
+
+def observe_task_rss(stage: str,
+                     start_rss: int) -> tuple[int, int]:
+    '''
+    Пиковая память процесса за этап (после reset_peak_rss) и её рост
+    относительно памяти на начало этапа.
+    Возвращает (peak_rss, growth)
+    '''
+    peak_rss = get_peak_rss()
+    growth = max(peak_rss - start_rss, 0)
+
+    XML_TASK_PEAK_RSS_BYTES.labels(stage).observe(peak_rss)
+    XML_TASK_RSS_GROWTH_BYTES.labels(stage).observe(growth)
+
+    return (peak_rss, growth)
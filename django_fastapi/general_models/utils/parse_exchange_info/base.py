@@ -1,8 +1,9 @@
 import random
 import requests
 import json
+import asyncio
 
-from time import sleep
+from time import sleep, time
 
 from bs4 import BeautifulSoup
 
@@ -13,9 +14,13 @@ from selenium.webdriver.support.wait import WebDriverWait
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.support import expected_conditions as EC
 
-from config import SELENIUM_DRIVER
+from config import SELENIUM_DRIVER, EXCHANGE_INFO_CONCURRENCY, EXCHANGE_INFO_CACHE_TTL
 
-from .queries import add_to_json_dict
+from general_models.models import Exchanger
+
+from ..cache import get_exchange_infos, set_exchange_infos
+from .fetch import fetch_exchanges_info, collect_exchange_info, get_exchange_info_url
+from .queries import add_to_json_dict, update_exchangers_info
 
 
 
@@ -254,3 +259,85 @@ def parse_exchange_info(exchange_list: list[tuple[int, str]]):
 #     finally:
 #         rnd_count = random.randint(3, 6)
 #         sleep(rnd_count)
+
+
+def selenium_parse_exchanges_info(en_names: list[str]) -> dict[str, dict | None]:
+    '''
+    Сбор информации обменников через Selenium (страницы, которым нужен JS),
+    одна сессия браузера на все страницы
+    '''
+    infos = {}
+
+    driver = webdriver.Remote(f'http://{SELENIUM_DRIVER}:4444', options=Options())
+
+    try:
+        for en_name in en_names:
+            try:
+                driver.get(get_exchange_info_url(en_name))
+                table = WebDriverWait(driver, timeout=40)\
+                                    .until(EC.presence_of_element_located((By.CLASS_NAME,
+                                                                           'exch_info_table')))
+
+                rows = [[td.text for td in row.find_elements(By.TAG_NAME, 'td')]
+                        for row in table.find_elements(By.TAG_NAME, 'tr')]
+
+                infos[en_name] = collect_exchange_info(rows) or None
+            except (TimeoutException, NoSuchElementException) as ex:
+                print(f'EXCHANGE INFO SELENIUM {en_name}', ex)
+                infos[en_name] = None
+    finally:
+        driver.quit()
+
+    return infos
+
+
+def new_parse_exchange_info(exchangers: list[Exchanger]) -> dict:
+    '''
+    Сбор информации обменников (курсы, резерв, возраст, страна):
+    страницы запрашиваются параллельно по HTTP, через Selenium - только
+    страницы без таблицы в HTML. Собранное хранится в кэше
+    EXCHANGE_INFO_CACHE_TTL секунд (такие обменники не запрашиваются)
+    и пишется в Exchanger одним bulk_update.
+    Возвращает статистику сбора
+    '''
+    start_time = time()
+
+    cached_infos = get_exchange_infos([exchange.pk for exchange in exchangers])
+
+    # без en_name страницу обменника на bestchange не найти
+    exchangers = [exchange for exchange in exchangers
+                  if exchange.pk not in cached_infos and exchange.en_name]
+
+    en_names = [exchange.en_name for exchange in exchangers]
+
+    http_infos = asyncio.run(fetch_exchanges_info(en_names,
+                                                  EXCHANGE_INFO_CONCURRENCY))
+
+    js_en_names = [en_name for en_name, info in http_infos.items() if info is None]
+
+    selenium_infos = {}
+
+    if js_en_names:
+        try:
+            selenium_infos = selenium_parse_exchanges_info(js_en_names)
+        except Exception as ex:
+            print('EXCHANGE INFO SELENIUM ERROR', ex)
+
+    infos = {}
+
+    for exchange in exchangers:
+        if info := http_infos.get(exchange.en_name) or selenium_infos.get(exchange.en_name):
+            infos[exchange.pk] = info
+
+    update_count = update_exchangers_info(exchangers, infos)
+
+    set_exchange_infos(infos, EXCHANGE_INFO_CACHE_TTL)
+
+    return {
+        'cached': len(cached_infos),
+        'http': sum(info is not None for info in http_infos.values()),
+        'selenium': sum(info is not None for info in selenium_infos.values()),
+        'failed': len(exchangers) - len(infos),
+        'updated': update_count,
+        'seconds': round(time() - start_time, 2),
+    }
@@ -0,0 +1,118 @@
+import asyncio
+
+import aiohttp
+
+from lxml import html
+from lxml.etree import ParserError
+
+
+# Быстрый путь сбора информации обменников: страницы bestchange
+# запрашиваются параллельно обычным HTTP и разбираются lxml.
+# Страница без таблицы exch_info_table (проверка браузера, отрисовка JS)
+# возвращается как None и собирается через Selenium
+
+# подписи строк таблицы -> поля Exchanger
+EXCHANGE_INFO_FIELDS = {
+    'Курсов обмена': 'course_count',
+    'Сумма резервов': 'reserve_amount',
+    'Возраст': 'age',
+    'Страна': 'country',
+}
+
+EXCHANGE_INFO_TIMEOUT = 15
+
+
+def get_exchange_info_url(en_name: str) -> str:
+    return f'https://www.bestchange.ru/{en_name.lower()}-exchanger.html'
+
+
+def collect_exchange_info(rows: list[list[str]]) -> dict:
+    '''
+    Поля обменника из строк таблицы (тексты ячеек строки),
+    у страны значение в третьей ячейке (во второй - флаг)
+    '''
+    info = {}
+
+    for cells in rows:
+        if not cells:
+            continue
+
+        for label, field in EXCHANGE_INFO_FIELDS.items():
+            if cells[0].startswith(label):
+                idx = 2 if field == 'country' else 1
+
+                if len(cells) > idx:
+                    info[field] = cells[idx].strip()
+                break
+
+    return info
+
+
+def parse_exchange_info_page(content: bytes) -> dict | None:
+    '''
+    Информация обменника из HTML страницы
+    или None, если таблицы на странице нет
+    '''
+    try:
+        document = html.document_fromstring(content)
+    except ParserError:
+        return None
+
+    tables = document.xpath('//table[contains(concat(" ", normalize-space(@class), " "), " exch_info_table ")]')
+
+    if not tables:
+        return None
+
+    rows = [[td.text_content().strip() for td in tr.xpath('./td')]
+            for tr in tables[0].xpath('.//tr')]
+
+    return collect_exchange_info(rows) or None
+
+
+async def fetch_exchange_info(session: aiohttp.ClientSession,
+                              sem: asyncio.Semaphore,
+                              en_name: str) -> dict | None:
+    async with sem:
+        try:
+            async with session.get(get_exchange_info_url(en_name)) as response:
+                if response.status != 200:
+                    print(f'EXCHANGE INFO {en_name}: статус {response.status}')
+                    return None
+
+                content = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            print(f'EXCHANGE INFO {en_name}: ошибка запроса', ex)
+            return None
+        except Exception as ex:
+            # ошибка одной страницы не останавливает сбор остальных
+            print(f'EXCHANGE INFO {en_name}: ошибка', ex)
+            return None
+
+    try:
+        return parse_exchange_info_page(content)
+    except Exception as ex:
+        print(f'EXCHANGE INFO {en_name}: ошибка разбора страницы', ex)
+        return None
+
+
+async def fetch_exchanges_info(en_names: list[str],
+                               concurrency: int) -> dict[str, dict | None]:
+    '''
+    Параллельный сбор информации обменников (не больше concurrency запросов),
+    возвращает {en_name: информация или None}
+    '''
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+                    'AppleWebKit/537.36 (KHTML, like Gecko) '
+                    'Chrome/127.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
+    }
+    timeout = aiohttp.ClientTimeout(total=EXCHANGE_INFO_TIMEOUT)
+    sem = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession(headers=headers,
+                                     timeout=timeout) as session:
+        infos = await asyncio.gather(*[fetch_exchange_info(session, sem, en_name)
+                                       for en_name in en_names])
+
+    return dict(zip(en_names, infos))
@@ -1,5 +1,11 @@
+import re
+
 from typing import Any
 
+from dateutil.relativedelta import relativedelta
+
+from django.utils import timezone
+
 from general_models.models import Exchanger
 # import no_cash.models as no_cash_models
 
@@ -57,4 +63,55 @@ def add_to_json_dict(filename: str, key: str, value: str):
     with tempfile.NamedTemporaryFile("w", delete=False, dir=dirn, encoding="utf-8") as tmp:
         json.dump(data, tmp, ensure_ascii=False, indent=2)
         tmpname = tmp.name
-    os.replace(tmpname, filename)
\ No newline at end of file
+    os.replace(tmpname, filename)
+
+
+def parse_relative_date(text: str):
+    """
+    Преобразует строку вроде '1 год 3 месяца', '3 месяца', '2 года'
+    в datetime.
+    """
+    years, months = 0, 0
+
+    # ищем годы
+    match_years = re.search(r"(\d+)\s*(год|года|лет)", text)
+    if match_years:
+        years = int(match_years.group(1))
+
+    # ищем месяцы
+    match_months = re.search(r"(\d+)\s*(месяц|месяца|месяцев)", text)
+    if match_months:
+        months = int(match_months.group(1))
+
+    return timezone.now() - relativedelta(years=years, months=months)
+
+
+def update_exchangers_info(exchangers: list[Exchanger],
+                           infos: dict[int, dict]) -> int:
+    '''
+    Запись собранной информации обменников одним bulk_update,
+    возраст ("2 года 3 месяца") переводится в дату открытия
+    '''
+    update_fields = [
+        'course_count',
+        'reserve_amount',
+        'age',
+        'country',
+    ]
+    update_list = []
+
+    for exchanger in exchangers:
+        if (info := infos.get(exchanger.pk)) is None:
+            continue
+
+        exchanger.course_count = info.get('course_count', exchanger.course_count)
+        exchanger.reserve_amount = info.get('reserve_amount', exchanger.reserve_amount)
+        exchanger.country = info.get('country', exchanger.country)
+
+        if info.get('age'):
+            exchanger.age = parse_relative_date(info['age']).date()
+
+        update_list.append(exchanger)
+
+    return Exchanger.objects.bulk_update(update_list,
+                                         update_fields)
@@ -1,6 +1,14 @@
+from datetime import datetime
+
+from django.db.models import Max
+
 from no_cash import models as no_cash_models
 from cash import models as cash_models
 
+from general_models.models import Exchanger, Review, Comment
+
+from ..cache import get_review_cursors
+
 
 def add_review_to_db(exchange_name: str, data: dict, marker: str):
     match marker:
@@ -70,4 +78,60 @@ def add_comment_to_db(review, data: dict, marker: str):
                             status='Опубликован',
                             moderation=True)
     except Exception:
-        pass
\ No newline at end of file
+        pass
+
+
+def new_add_review_to_exchanger(exchange: Exchanger, data: dict) -> tuple[Review, bool]:
+    '''
+    Отзыв обменника (новая модель Review), повторно собранный отзыв
+    не дублируется. Возвращает (отзыв, создан ли)
+    '''
+    defaults = {
+        'text': data['text'],
+        'status': 'Опубликован',
+        'review_from': data['review_from'],
+        'moderation': True,
+    }
+
+    if data.get('grade') is not None:
+        defaults['grade'] = data['grade']
+
+    return Review.objects.get_or_create(exchange=exchange,
+                                        username=data['name'],
+                                        time_create=data['date'],
+                                        defaults=defaults)
+
+
+def new_add_comment_to_review(review: Review, data: dict) -> tuple[Comment, bool]:
+    return Comment.objects.get_or_create(review=review,
+                                         username=data['name'],
+                                         time_create=data['date'],
+                                         defaults={
+                                             'text': data['text'],
+                                             'status': 'Опубликован',
+                                             'review_from': data['review_from'],
+                                             'moderation': True,
+                                         })
+
+
+def get_bestchange_review_cursors(exchange_ids: list[int]) -> dict[int, datetime]:
+    '''
+    Время последнего собранного отзыва обменников: из кэша,
+    для обменников без курса - последний отзыв с bestchange в БД
+    '''
+    cursors = get_review_cursors(exchange_ids)
+
+    missing_ids = [exchange_id for exchange_id in exchange_ids
+                   if exchange_id not in cursors]
+
+    if missing_ids:
+        last_reviews = Review.objects.filter(exchange_id__in=missing_ids,
+                                             review_from='bestchange')\
+                                     .values('exchange_id')\
+                                     .annotate(last_time=Max('time_create'))
+
+        cursors.update({review['exchange_id']: review['last_time']
+                        for review in last_reviews
+                        if review['last_time'] is not None})
+
+    return cursors
@@ -1,10 +1,28 @@
 import random
+import threading
+
 from datetime import datetime
+from queue import Queue, Empty
+from time import time
 
+from selenium import webdriver
+from selenium.common.exceptions import InvalidSessionIdException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.webdriver import WebDriver
 
-from .base import add_comment_to_db, new_add_review_to_db
+from django.db import connection
+from django.utils import timezone
+
+from config import SELENIUM_DRIVER
+
+from general_models.models import Exchanger
+
+from ..cache import set_review_cursors
+from .base import (add_comment_to_db,
+                   new_add_review_to_db,
+                   new_add_review_to_exchanger,
+                   new_add_comment_to_review)
 
 
 def collect_data(review, indicator: str):
@@ -94,4 +112,196 @@ def parse_reviews(driver: WebDriver,
         print(ex)
     except BaseException as ex:
         print(ex)
-        return
\ No newline at end of file
+        return
+
+
+def create_driver() -> WebDriver:
+    return webdriver.Remote(f'http://{SELENIUM_DRIVER}:4444', options=Options())
+
+
+def new_parse_reviews(driver: WebDriver,
+                      exchange: Exchanger,
+                      cursor: datetime | None = None,
+                      limit: int = 30) -> dict:
+    '''
+    Отзывы обменника с bestchange в новую модель Review.
+    Отзывы на странице идут от новых к старым, разбор останавливается
+    на первом отзыве не новее cursor (уже собранном).
+    Новые комментарии к уже собранным отзывам не собираются.
+    Возвращает количество новых отзывов и новый курсор
+    '''
+    link = f'https://www.bestchange.net/{exchange.en_name.lower()}-exchanger.html'
+
+    driver.get(link)
+
+    rows = driver.find_element(By.ID, 'content_reviews')\
+                    .find_element(By.CLASS_NAME, 'inner')\
+                    .find_elements(By.XPATH, '//div[starts-with(@class, "review_block")]')
+
+    new_cursor = cursor
+    review_count = 0
+
+    for row in rows[:limit]:
+        try:
+            data = collect_data(row, 'review')
+        except ValueError as ex:
+            print(ex)
+            continue
+
+        # время на странице - московское (TIME_ZONE проекта)
+        data['date'] = timezone.make_aware(data['date'])
+
+        if cursor is not None and data['date'] <= cursor:
+            break
+
+        review, is_created = new_add_review_to_exchanger(exchange, data)
+        review_count += is_created
+
+        if new_cursor is None or data['date'] > new_cursor:
+            new_cursor = data['date']
+
+        comments = row.find_element(By.CLASS_NAME, 'review_comment_expand')
+
+        if comments.is_displayed():
+            comments.click()
+
+            for comment in row.find_elements(By.CLASS_NAME, 'review_comment'):
+                try:
+                    data = collect_data(comment, 'comment')
+                except ValueError:
+                    continue
+
+                data['date'] = timezone.make_aware(data['date'])
+                new_add_comment_to_review(review, data)
+
+    return {
+        'reviews': review_count,
+        'cursor': new_cursor,
+    }
+
+
+def quit_driver(driver: WebDriver):
+    # quit закрытой сессии (таймаут, падение браузера) сам может упасть
+    try:
+        driver.quit()
+    except Exception as ex:
+        print('SELENIUM QUIT ERROR', ex)
+
+
+def _parse_reviews_worker(exchangers: Queue,
+                          cursors: dict[int, datetime],
+                          stats: dict,
+                          lock: threading.Lock):
+    '''
+    Одна сессия браузера разбирает обменники из общей очереди,
+    курсор обменника сохраняется сразу после его разбора.
+    Если сессия закрыта, открывается новая и обменник повторяется один раз;
+    не удалось открыть новую сессию - поток завершается, оставшиеся
+    обменники разбирают другие потоки
+    '''
+    driver = None
+
+    try:
+        driver = create_driver()
+
+        while True:
+            try:
+                exchange = exchangers.get_nowait()
+            except Empty:
+                break
+
+            result = None
+
+            for attempt in range(2):
+                try:
+                    result = new_parse_reviews(driver,
+                                               exchange,
+                                               cursors.get(exchange.pk))
+                except InvalidSessionIdException as ex:
+                    print('SELENIUM SESSION ERROR', exchange.name, ex)
+                    quit_driver(driver)
+                    driver = None
+
+                    try:
+                        driver = create_driver()
+                    except Exception as ex:
+                        print('SELENIUM ERROR', ex)
+                        break
+
+                    continue
+                except Exception as ex:
+                    print('SELENIUM ERROR', exchange.name, ex)
+
+                break
+
+            if result is not None and result['cursor'] != cursors.get(exchange.pk):
+                set_review_cursors({exchange.pk: result['cursor']})
+
+            with lock:
+                stats['pages'] += 1
+
+                if result is None:
+                    stats['errors'] += 1
+                else:
+                    stats['reviews'] += result['reviews']
+
+            if driver is None:
+                break
+    except Exception as ex:
+        print('SELENIUM ERROR', ex)
+    finally:
+        if driver is not None:
+            quit_driver(driver)
+
+        # у каждого потока своё соединение с БД
+        connection.close()
+
+
+def parse_reviews_concurrently(exchangers: list[Exchanger],
+                               cursors: dict[int, datetime],
+                               sessions: int) -> dict:
+    '''
+    Сбор отзывов обменников пулом из sessions сессий браузера
+    (каждая сессия - свой поток со своим webdriver.Remote).
+    Возвращает статистику: страницы, новые отзывы, ошибки, страниц в минуту.
+    Обменники без en_name (нет страницы на bestchange) пропускаются,
+    не разобранные из-за недоступного браузера считаются ошибками
+    '''
+    exchangers = [exchange for exchange in exchangers if exchange.en_name]
+
+    queue = Queue()
+
+    for exchange in exchangers:
+        queue.put(exchange)
+
+    stats = {
+        'pages': 0,
+        'reviews': 0,
+        'errors': 0,
+    }
+    lock = threading.Lock()
+
+    start_time = time()
+
+    workers = [threading.Thread(target=_parse_reviews_worker,
+                                args=(queue, cursors, stats, lock))
+               for _ in range(max(min(sessions, len(exchangers)), 1))]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    # все потоки завершились, не открыв сессию браузера
+    if skipped := queue.qsize():
+        print(f'SELENIUM ERROR: не разобрано обменников {skipped}')
+        stats['errors'] += skipped
+
+    total_time = time() - start_time
+
+    stats['sessions'] = len(workers)
+    stats['seconds'] = round(total_time, 2)
+    stats['pages_per_minute'] = round(stats['pages'] / max(total_time, 1e-6) * 60, 2)
+
+    return stats
@@ -1,13 +1,12 @@
 from xml.etree import ElementTree as ET
 from xml.etree.ElementTree import Element
 
-from io import BytesIO
+from typing import IO, Iterable
 from time import time
 
 from lxml import etree
 
 from django.db import transaction
-from django.db.models import Q
 from django.utils import timezone
 
 from general_models.models import Exchanger
@@ -18,19 +17,33 @@ import no_cash.models as no_cash_models
 # from cash.utils.parsers import new_parse_create_direction_by_city
 
 from .base import check_valid_min_max_amount
-from .exc import NoFoundXmlElement
-from .tasks import make_valid_values_for_dict
-
-
-
-def parse_cash_direction_by_city(dict_for_parse: dict,
-                                 element: Element,
-                                 city: str,
-                                 exchange: Exchanger,
-                                 cash_bulk_create_list: list,
-                                 cash_set: set,
-                                 cash_duble_list: list,
-                                 time_action: timezone):
+from .exc import NoFoundXmlElement, TechServiceWork, InvalidXmlFile, XmlTooLarge
+from .tasks import make_valid_values_for_dicts
+from .direction_diff import (BASE_DIFF_VALUE_FIELDS,
+                             CASH_DIFF_VALUE_FIELDS,
+                             NO_CASH_DIFF_KEY_FIELDS,
+                             CASH_DIFF_KEY_FIELDS,
+                             write_exchange_directions)
+from .xml_stream import XmlItemStream, iter_xml_items
+from .direction_expiry import get_direction_lease
+from .feed_rejections import new_feed_rejections, add_feed_rejection
+from .xml_limits import get_xml_item_limit
+from .metrics import observe_xml_parse, observe_xml_db_write, observe_xml_db_time
+
+
+
+def parse_cash_direction_by_cities(dict_for_parse: dict,
+                                   element: Element,
+                                   cities: list[str],
+                                   exchange: Exchanger,
+                                   cash_bulk_create_list: list,
+                                   time_action: timezone,
+                                   rejections: dict | None = None):
+    '''
+    Элемент <item> разбирается один раз в предложение со списком city_ids
+    всех известных городов из <city>, на направления по городам
+    предложение раскладывается после нормализации курса (fan_out_cash_directions)
+    '''
     # min_amount = element.findtext('minamount') or element.findtext('minAmount')
     # valute_from = element.xpath('./from/text()')element.findtext('from')
     # valute_to = element.xpath('./to/text()')element.findtext('to')
@@ -44,9 +57,13 @@ def parse_cash_direction_by_city(dict_for_parse: dict,
         inner_key = (valute_from, valute_to)
 
 
-        if dict_for_parse.get(city, None) is not None:
-            if dict_for_parse[city].get(inner_key):
-                city_id, direction_id = dict_for_parse[city].get(inner_key)
+        city_ids = [city_id for city in cities
+                    if (city_id := dict_for_parse['cities'].get(city)) is not None]
+
+        rejection_key = f'{valute_from}->{valute_to} {",".join(cities)}'
+
+        if city_ids:
+            if direction_id := dict_for_parse['CASH'].get(inner_key):
 
                 # fromfee = element.xpath('./fromfee/text()')
                 # param = element.xpath('./param/text()')
@@ -76,9 +93,13 @@ def parse_cash_direction_by_city(dict_for_parse: dict,
                 out_count = element.findtext('out')
 
                 try:
-                    if not (min_amount and max_amount) or\
-                        not check_valid_min_max_amount(min_amount,
-                                                    max_amount):
+                    if not (min_amount and max_amount):
+                        add_feed_rejection(rejections, 'missing_fields', rejection_key)
+                        return
+
+                    if not check_valid_min_max_amount(min_amount,
+                                                      max_amount):
+                        add_feed_rejection(rejections, 'invalid_min_max', rejection_key)
                         return
                     
                     d = {
@@ -91,31 +112,23 @@ def parse_cash_direction_by_city(dict_for_parse: dict,
                         'fromfee': fromfee,
                         'params': param,
                         'is_active': True,
-                        'city_id': city_id,
+                        'city_ids': city_ids,
                         'direction_id': direction_id,
                         'exchange_id': exchange.pk,
                         'time_action': time_action,
                     }
-                
-                    make_valid_values_for_dict(d)
                 except Exception as ex:
                     # print(f'{ex} | {exchange.name} direction_id {direction_id}')
-                    pass
+                    add_feed_rejection(rejections, 'normalize_error', rejection_key)
                 else:
-                    unique_key = (exchange.pk, direction_id, city_id)
-
-                    if unique_key not in cash_set:
-                        cash_set.add(unique_key)
-                        try:
-                            cash_bulk_create_list.append(cash_models.NewExchangeDirection(**d))
-                            
-                            # dict_for_parse[city].pop(inner_key)
-
-                        except Exception as ex:
-                            # print('тут ошибка 2')
-                            print(ex)
-                    else:
-                        cash_duble_list.append(unique_key)
+                    # курс нормализуется пакетно после разбора всего файла
+                    cash_bulk_create_list.append(d)
+            else:
+                add_feed_rejection(rejections, 'unknown_pair', rejection_key)
+        else:
+            add_feed_rejection(rejections, 'unknown_city', rejection_key)
+    else:
+        add_feed_rejection(rejections, 'missing_pair')
 
 
 
@@ -123,9 +136,9 @@ def parse_no_cash_direction(dict_for_parse: dict,
                             element: Element,
                             exchange: Exchanger,
                             no_cash_bulk_create_list: list,
-                            no_cash_set: set,
-                            no_cash_duble_list: list,
-                            time_action: timezone):
+                            no_cash_seen_keys: set,
+                            time_action: timezone,
+                            rejections: dict | None = None):
     no_cash_dict_key = 'NOCASH'
 
     # valute_from = element.xpath('./from/text()')
@@ -138,8 +151,15 @@ def parse_no_cash_direction(dict_for_parse: dict,
         # key = (valute_from[0], valute_to[0])
         key = (valute_from, valute_to)
 
-        if dict_for_parse[no_cash_dict_key].get(key):
-            direction_id = dict_for_parse[no_cash_dict_key].pop(key)
+        rejection_key = f'{valute_from}->{valute_to}'
+
+        # учитывается только первый item с такой парой валют
+        if key in no_cash_seen_keys:
+            add_feed_rejection(rejections, 'duble', rejection_key)
+        elif not (direction_id := dict_for_parse[no_cash_dict_key].get(key)):
+            add_feed_rejection(rejections, 'unknown_pair', rejection_key)
+        else:
+            no_cash_seen_keys.add(key)
 
             # if not (min_amount := element.xpath('./minamount/text()')):
             #     min_amount = element.xpath('./minAmount/text()')
@@ -161,10 +181,14 @@ def parse_no_cash_direction(dict_for_parse: dict,
             has_required_fields = bool(in_count and out_count and max_amount and min_amount)
 
             try:
-                if not has_required_fields or\
-                    not check_valid_min_max_amount(min_amount,
-                                                   max_amount):
+                if not has_required_fields:
                     # print('ERROR WITH REQURED FILEDS', has_required_fields, d)
+                    add_feed_rejection(rejections, 'missing_fields', rejection_key)
+                    return
+
+                if not check_valid_min_max_amount(min_amount,
+                                                  max_amount):
+                    add_feed_rejection(rejections, 'invalid_min_max', rejection_key)
                     return
                 
                 d = {
@@ -181,46 +205,117 @@ def parse_no_cash_direction(dict_for_parse: dict,
                     'exchange_id': exchange.pk,
                     'time_action': time_action,
                 }
-            
-                make_valid_values_for_dict(d)
             except Exception as ex:
-                pass
                 # print(f'{ex} || {exchange.name}')
                 # continue
+                add_feed_rejection(rejections, 'normalize_error', rejection_key)
 
             else:
-                unique_key = (exchange.pk, direction_id)
-                if unique_key not in no_cash_set:
-                    no_cash_set.add(unique_key)
-                    try:
-                        no_cash_bulk_create_list.append(no_cash_models.NewExchangeDirection(**d))
-
-                    except Exception as ex:
-                        print(ex)
-                        # continue
-                else:
-                    no_cash_duble_list.append(unique_key)    
+                # курс нормализуется пакетно после разбора всего файла
+                no_cash_bulk_create_list.append(d)
+    else:
+        add_feed_rejection(rejections, 'missing_pair')
+
+
+def fan_out_cash_directions(offer_list: list[dict]):
+    '''
+    Раскладывает наличные предложения (один <item> на несколько городов)
+    на направления по городам в порядке городов в <item>
+    '''
+    direction_list = []
+
+    for offer in offer_list:
+        city_ids = offer.pop('city_ids')
+
+        for city_id in city_ids:
+            direction_list.append({**offer, 'city_id': city_id})
+
+    return direction_list
+
+
+def make_valid_parsed_directions(direction_list: list[dict],
+                                 unique_fields: tuple,
+                                 fan_out=None,
+                                 rejections: dict | None = None):
+    '''
+    Пакетная нормализация курсов распарсенных направлений и отбор уникальных
+    (остаётся первое направление, прошедшее нормализацию).
+    fan_out - раскладка нормализованных предложений на направления
+    (курс предложения на несколько городов нормализуется один раз).
+    Возвращает (уникальные направления, дубли)
+    '''
+    accepted_list, rejected = make_valid_values_for_dicts(direction_list)
+
+    if rejections is not None:
+        for direction, is_rejected in zip(direction_list, rejected):
+            if is_rejected:
+                add_feed_rejection(rejections,
+                                   'normalize_error',
+                                   f'direction_id {direction["direction_id"]}')
+
+    if fan_out is not None:
+        accepted_list = fan_out(accepted_list)
+
+    unique_list = []
+    unique_set = set()
+    duble_list = []
+
+    for direction in accepted_list:
+        unique_key = tuple(direction[field] for field in unique_fields)
+
+        if unique_key not in unique_set:
+            unique_set.add(unique_key)
+            unique_list.append(direction)
+        else:
+            duble_list.append(unique_key)
+            add_feed_rejection(rejections,
+                               'duble',
+                               ' '.join(f'{field} {value}' for field, value in zip(unique_fields, unique_key)
+                                        if field != 'exchange_id'))
+
+    return (
+        unique_list,
+        duble_list,
+    )
+
+
+def parse_xml_directions(exchange: Exchanger,
+                         xml_file: str | bytes | IO[bytes] | Iterable[bytes],
+                         dict_for_parse: dict,
+                         time_action: timezone = None) -> dict:
+    '''
+    Парсинг XML файла обменника в готовые направления без обращений к БД.
+    XML может быть строкой, байтами, открытым файлом или потоком кусков,
+    элементы <item> разбираются по одному без загрузки всего документа.
+    dict_for_parse - индекс направлений из get_direction_index (не изменяется).
+    Корректность документа и тех обслуживание проверяются за этот же проход:
+    TechServiceWork, InvalidXmlFile или XmlTooLarge (элементов больше лимита)
+    вызываются до любой записи в БД, поэтому недоразобранный XML
+    не деактивирует направления обменника
+    '''
+    cash_bulk_create_list = []
 
+    no_cash_bulk_create_list = []
+    no_cash_seen_keys = set()
 
-def parse_xml_and_create_or_update_directions(exchange: Exchanger,
-                                              xml_file: str,
-                                              dict_for_parse: dict):
-    xml_file = xml_file.encode()
+    # отклонённые элементы по причинам (utils/feed_rejections.py)
+    rejections = new_feed_rejections()
 
-    cash_bulk_create_list = []
-    cash_set = set()
-    cash_duble_list = []
+    if time_action is None:
+        time_action = timezone.now()
 
-    no_cash_bulk_create_list = []
-    no_cash_set = set()
-    no_cash_duble_list = []
+    stream = XmlItemStream()
 
-    time_action = timezone.now()
+    max_items = get_xml_item_limit(exchange)
 
     start_parse_time = time()
 
-    for event, element in etree.iterparse(BytesIO(xml_file), events=('end',), tag='item'):
+    try:
+        for element in iter_xml_items(xml_file, stream):
         # if any(v for v in dict_for_parse.values()):
+            if max_items is not None and stream.item_count > max_items:
+                raise XmlTooLarge(f'{exchange.name} в XML больше {max_items} элементов')
+
             try:
                 city = element.xpath('./city/text()')
                 
@@ -228,43 +323,95 @@ def parse_xml_and_create_or_update_directions(exchange: Exchanger,
                     city = city[0].upper()
 
                     if city.find(',') == -1:
-                        parse_cash_direction_by_city(dict_for_parse,
-                                                     element,
-                                                     city,
-                                                     exchange,
-                                                     cash_bulk_create_list,
-                                                     cash_set=cash_set,
-                                                     cash_duble_list=cash_duble_list,
-                                                     time_action=time_action)
+                        cities = [city]
                     else:
                         cities = [c.strip() for c in city.split(',')]
-                        
-                        for city in cities:
-                            parse_cash_direction_by_city(dict_for_parse,
-                                                        element,
-                                                        city,
-                                                        exchange,
-                                                        cash_bulk_create_list,
-                                                        cash_set=cash_set,
-                                                        cash_duble_list=cash_duble_list,
-                                                        time_action=time_action)
+
+                    # элемент разбирается один раз для всех городов
+                    parse_cash_direction_by_cities(dict_for_parse,
+                                                   element,
+                                                   cities,
+                                                   exchange,
+                                                   cash_bulk_create_list,
+                                                   time_action=time_action,
+                                                   rejections=rejections)
                 else:
                     parse_no_cash_direction(dict_for_parse,
                                             element,
                                             exchange,
                                             no_cash_bulk_create_list,
-                                            no_cash_set=no_cash_set,
-                                            no_cash_duble_list=no_cash_duble_list,
-                                            time_action=time_action)
+                                            no_cash_seen_keys=no_cash_seen_keys,
+                                            time_action=time_action,
+                                            rejections=rejections)
 
             except Exception as ex:
                 print('ошибка парсинга направления', ex)
+                add_feed_rejection(rejections, 'item_error')
                 continue
             finally:
                 element.clear()
+    except etree.XMLSyntaxError as ex:
+        raise InvalidXmlFile(f'{exchange.name} некорректный XML: {ex}')
     
-    print(f'время парсинга xml {exchange.name} - {time() - start_parse_time} sec')
+    if stream.is_tech_service():
+        raise TechServiceWork(f'{exchange.name} на тех обслуживании')
     
+    if stream.root is None:
+        raise InvalidXmlFile(f'{exchange.name} пустой XML')
+
+    # наличные направления считаются по городам, а не по предложениям
+    cash_count = sum(len(offer['city_ids']) for offer in cash_bulk_create_list)
+    no_cash_count = len(no_cash_bulk_create_list)
+
+    cash_bulk_create_list, cash_duble_list = make_valid_parsed_directions(cash_bulk_create_list,
+                                                                          ('exchange_id', 'direction_id', 'city_id'),
+                                                                          fan_out=fan_out_cash_directions,
+                                                                          rejections=rejections)
+    
+    no_cash_bulk_create_list, no_cash_duble_list = make_valid_parsed_directions(no_cash_bulk_create_list,
+                                                                                ('exchange_id', 'direction_id'),
+                                                                                rejections=rejections)
+
+    parse_time = time() - start_parse_time
+
+    print(f'время парсинга xml {exchange.name} - {parse_time} sec')
+
+    observe_xml_parse(exchange.name,
+                      parse_time,
+                      stream.item_count,
+                      {
+                          'cash': {
+                              'accepted': len(cash_bulk_create_list),
+                              'invalid': cash_count - len(cash_bulk_create_list) - len(cash_duble_list),
+                              'duble': len(cash_duble_list),
+                          },
+                          'no_cash': {
+                              'accepted': len(no_cash_bulk_create_list),
+                              'invalid': no_cash_count - len(no_cash_bulk_create_list) - len(no_cash_duble_list),
+                              'duble': len(no_cash_duble_list),
+                          },
+                      })
+
+    return {
+        'cash': cash_bulk_create_list,
+        'cash_dubles': cash_duble_list,
+        'no_cash': no_cash_bulk_create_list,
+        'no_cash_dubles': no_cash_duble_list,
+        'rejections': rejections,
+        'item_count': stream.item_count,
+        'parse_time': parse_time,
+    }
+
+
+def write_parsed_directions(exchange: Exchanger,
+                            parsed: dict,
+                            stats: dict | None = None) -> bool:
+    '''
+    Запись распарсенных направлений обменника в БД.
+    Возвращает True, если запись прошла без ошибок.
+    stats - словарь для времени записи и количества изменённых строк
+    ({'db_time': ..., 'rows': {'cash': {'created': ...}, 'no_cash': ...}})
+    '''
     update_fields = [
         'in_count',
         'out_count',
@@ -272,6 +419,7 @@ def parse_xml_and_create_or_update_directions(exchange: Exchanger,
         'max_amount',
         'is_active',
         'time_action',
+        'expires_at',
     ]
     unique_fields = [
         'exchange_id',
@@ -289,41 +437,116 @@ def parse_xml_and_create_or_update_directions(exchange: Exchanger,
 
     batch_size = 400
 
+    is_success = True
+
+    # вместо деактивации по времени каждый цикл направления получают срок жизни,
+    # не изменившимся направлениям срок продлевается раз в DIRECTION_TTL / 2
+    expires_at, renew_before = get_direction_lease()
+
+    # в БД пишутся только отличия от текущих направлений обменника:
+    # новые направления, изменившиеся курсы/лимиты и пропавшие из XML направления
+    # (на PostgreSQL - через COPY во временную таблицу и слияние на стороне БД)
+
     # NO CASH CREATE/UPDATE
-    with transaction.atomic():
-        try:
-            no_cash_models.NewExchangeDirection.objects.bulk_create(no_cash_bulk_create_list,
-                                                                    update_conflicts=True,
-                                                                    update_fields=update_fields,
-                                                                    unique_fields=unique_fields,
-                                                                    batch_size=batch_size)
+    try:
+        with transaction.atomic():
+            create_count, update_count, deactivate_count = write_exchange_directions(no_cash_models.NewExchangeDirection,
+                                                                                     exchange.pk,
+                                                                                     parsed['no_cash'],
+                                                                                     NO_CASH_DIFF_KEY_FIELDS,
+                                                                                     BASE_DIFF_VALUE_FIELDS,
+                                                                                     update_fields=update_fields,
+                                                                                     unique_fields=unique_fields,
+                                                                                     batch_size=batch_size,
+                                                                                     expires_at=expires_at,
+                                                                                     renew_before=renew_before)
             
-            no_cash_models.NewExchangeDirection.objects.filter(Q(exchange_id=exchange.pk,
-                                                                 is_active=True) \
-                                                                & ~Q(time_action=time_action))\
-                                                        .update(is_active=False)
-        except Exception as ex:
-            print('CREATE/UPDATE NO CASH ERROR')
-            print(ex)
-            print('DUBLES', no_cash_duble_list)
+            print(f'NO CASH {exchange.name}: создано {create_count}, обновлено {update_count}, деактивировано {deactivate_count}')
+
+        observe_xml_db_write(exchange.name,
+                             'no_cash',
+                             create_count,
+                             update_count,
+                             deactivate_count)
+
+        if stats is not None:
+            stats.setdefault('rows', {})['no_cash'] = {
+                'created': create_count,
+                'updated': update_count,
+                'deactivated': deactivate_count,
+            }
+    except Exception as ex:
+        is_success = False
+        print('CREATE/UPDATE NO CASH ERROR')
+        print(ex)
+        print('DUBLES', parsed['no_cash_dubles'])
 
     # CASH CREATE/UPDATE
-    with transaction.atomic():
-        try:
-            cash_models.NewExchangeDirection.objects.bulk_create(cash_bulk_create_list,
-                                                                 update_conflicts=True,
-                                                                 update_fields=update_fields + additional_cash_update_fields,
-                                                                 unique_fields=unique_fields + additional_cash_unique_fields,
-                                                                 batch_size=batch_size)
+    try:
+        with transaction.atomic():
+            create_count, update_count, deactivate_count = write_exchange_directions(cash_models.NewExchangeDirection,
+                                                                                     exchange.pk,
+                                                                                     parsed['cash'],
+                                                                                     CASH_DIFF_KEY_FIELDS,
+                                                                                     CASH_DIFF_VALUE_FIELDS,
+                                                                                     update_fields=update_fields + additional_cash_update_fields,
+                                                                                     unique_fields=unique_fields + additional_cash_unique_fields,
+                                                                                     batch_size=batch_size,
+                                                                                     expires_at=expires_at,
+                                                                                     renew_before=renew_before)
             
-            cash_models.NewExchangeDirection.objects.filter(Q(exchange_id=exchange.pk,
-                                                              is_active=True) \
-                                                            & ~Q(time_action=time_action))\
-                                                    .update(is_active=False)
+            print(f'CASH {exchange.name}: создано {create_count}, обновлено {update_count}, деактивировано {deactivate_count}')
+
+        observe_xml_db_write(exchange.name,
+                             'cash',
+                             create_count,
+                             update_count,
+                             deactivate_count)
+
+        if stats is not None:
+            stats.setdefault('rows', {})['cash'] = {
+                'created': create_count,
+                'updated': update_count,
+                'deactivated': deactivate_count,
+            }
+    except Exception as ex:
+        is_success = False
+        print('CREATE/UPDATE CASH ERROR')
+        print(ex)
+        print('DUBLES', parsed['cash_dubles'])
+
+    db_time = time() - start_db_time
+
+    print(f'время обновления в бд {exchange.name} - {db_time} sec')
 
-        except Exception as ex:
-            print('CREATE/UPDATE CASH ERROR')
-            print(ex)
-            print('DUBLES', cash_duble_list)
+    observe_xml_db_time(exchange.name,
+                        db_time)
 
-    print(f'время обновления в бд {exchange.name} - {time() - start_db_time} sec')
+    if stats is not None:
+        stats['db_time'] = db_time
+
+    return is_success
+
+
+def parse_xml_and_create_or_update_directions(exchange: Exchanger,
+                                              xml_file: str | bytes | IO[bytes] | Iterable[bytes],
+                                              dict_for_parse: dict,
+                                              stats: dict | None = None):
+    '''
+    Парсинг XML файла обменника и создание/обновление готовых направлений.
+    Возвращает True, если запись в БД прошла без ошибок.
+    stats - словарь для статистики парсинга и записи (см. write_parsed_directions),
+    отклонённые элементы - в stats['rejections'] (utils/feed_rejections.py)
+    '''
+    parsed = parse_xml_directions(exchange,
+                                  xml_file,
+                                  dict_for_parse)
+
+    if stats is not None:
+        stats['item_count'] = parsed['item_count']
+        stats['parse_time'] = parsed['parse_time']
+        stats['rejections'] = parsed['rejections']
+
+    return write_parsed_directions(exchange,
+                                   parsed,
+                                   stats)
@@ -0,0 +1,431 @@
+import json
+
+from time import time
+
+from django.db import connection, transaction
+from django.db.models import Model
+
+import cash.models as cash_models
+import no_cash.models as no_cash_models
+
+
+# Секционирование таблиц готовых направлений (только PostgreSQL).
+# Таблица пересоздаётся как PARTITION BY HASH (exchange_id):
+# направления одного обменника лежат в одной секции, поэтому запись
+# и деактивация направлений обменника (direction_diff) затрагивают одну секцию,
+# autovacuum работает по секциям, индексы каждой секции небольшие.
+# Ограничения PostgreSQL для секционированных таблиц:
+# - уникальные ограничения должны содержать ключ секционирования -
+#   unique_together направлений содержит exchange, а первичный ключ по id
+#   заменяется обычным индексом (id по-прежнему выдаётся последовательностью);
+# - на секционированную таблицу нельзя сослаться внешним ключом по id,
+#   поэтому счётчики переходов ссылаются на направления без ограничения в БД
+#   (db_constraint=False, SET_NULL выполняет Django).
+# Старая таблица остаётся резервной копией (<таблица>_unpartitioned)
+# до явного удаления, пока она есть - возможен откат.
+# Внешние ключи резервной таблицы удаляются (CASCADE/SET_NULL Django
+# затрагивают только рабочую таблицу, и строки копии мешали бы удалять
+# обменники, города и направления), их определения сохраняются
+# в комментарии таблицы и восстанавливаются при откате
+
+PARTITIONED_DIRECTION_MODELS = {
+    'no_cash': no_cash_models.NewExchangeDirection,
+    'cash': cash_models.NewExchangeDirection,
+}
+
+PARTITION_KEY = 'exchange_id'
+
+DEFAULT_PARTITION_COUNT = 16
+
+BACKUP_SUFFIX = '_unpartitioned'
+
+
+def qn(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def check_postgresql():
+    if connection.vendor != 'postgresql':
+        raise ValueError('секционирование поддерживается только на PostgreSQL')
+
+
+def get_backup_table(table: str) -> str:
+    return f'{table}{BACKUP_SUFFIX}'
+
+
+def get_relkind(cursor, table: str) -> str | None:
+    '''
+    Тип таблицы: r - обычная, p - секционированная, None - таблицы нет
+    '''
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+                   [table])
+
+    if (row := cursor.fetchone()) is not None:
+        return row[0]
+
+
+def get_table_partitions(table: str) -> list[dict] | None:
+    '''
+    Секции таблицы с примерным числом строк и размером (с индексами)
+    или None, если таблица не секционирована
+    '''
+    check_postgresql()
+
+    with connection.cursor() as cursor:
+        if get_relkind(cursor, table) != 'p':
+            return None
+
+        cursor.execute(
+            'SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), '
+            'child.reltuples::bigint, pg_total_relation_size(child.oid) '
+            'FROM pg_inherits i JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s) '
+            'ORDER BY child.oid',
+            [table]
+        )
+
+        return [
+            {
+                'name': name,
+                'bound': bound,
+                'rows': max(rows, 0),
+                'size': size,
+            } for name, bound, rows, size in cursor.fetchall()
+        ]
+
+
+def get_table_schema_objects(cursor, table: str) -> tuple[list, list]:
+    '''
+    Ограничения (кроме первичного ключа) и индексы таблицы,
+    не связанные с ограничениями: ([(имя, определение)], [(имя, определение)])
+    '''
+    cursor.execute(
+        'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+        "WHERE conrelid = to_regclass(%s) AND contype IN ('u', 'f', 'c') "
+        'ORDER BY conname',
+        [table]
+    )
+    constraints = cursor.fetchall()
+
+    cursor.execute(
+        'SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x '
+        'JOIN pg_class i ON i.oid = x.indexrelid '
+        'WHERE x.indrelid = to_regclass(%s) AND NOT EXISTS '
+        '(SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid) '
+        'ORDER BY i.relname',
+        [table]
+    )
+    indexes = cursor.fetchall()
+
+    return (
+        constraints,
+        indexes,
+    )
+
+
+def get_referencing_constraints(cursor, table: str) -> list[str]:
+    '''
+    Внешние ключи других таблиц на таблицу
+    '''
+    cursor.execute(
+        'SELECT conrelid::regclass::text || \'.\' || conname FROM pg_constraint '
+        "WHERE confrelid = to_regclass(%s) AND contype = 'f' AND conrelid <> confrelid",
+        [table]
+    )
+
+    return [row[0] for row in cursor.fetchall()]
+
+
+def partition_table(model: type[Model],
+                    partition_count: int = DEFAULT_PARTITION_COUNT) -> dict:
+    '''
+    Пересоздаёт таблицу модели как PARTITION BY HASH (exchange_id)
+    с partition_count секциями и переносит данные.
+    Всё выполняется в одной транзакции: на время копирования запись
+    в таблицу блокируется (чтение продолжает работать), затем таблицы
+    меняются местами. Возвращает {'rows': ..., 'time': ...}
+    '''
+    check_postgresql()
+
+    table = model._meta.db_table
+    new_table = f'tmp_{table}'
+    backup_table = get_backup_table(table)
+    sequence = f'{table}_partitioned_id_seq'
+
+    start_time = time()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if get_relkind(cursor, table) != 'r':
+            raise ValueError(f'таблица {table} уже секционирована или не найдена')
+
+        if get_relkind(cursor, backup_table) is not None:
+            raise ValueError(f'резервная таблица {backup_table} уже существует')
+
+        if referencing := get_referencing_constraints(cursor, table):
+            raise ValueError(f'на таблицу {table} ссылаются внешние ключи {referencing}, '
+                             f'сначала примените миграции (db_constraint=False)')
+
+        cursor.execute('SET LOCAL statement_timeout = 0')
+
+        # запись блокируется до конца переноса, чтение - нет
+        cursor.execute(f'LOCK TABLE {qn(table)} IN EXCLUSIVE MODE')
+
+        constraints, indexes = get_table_schema_objects(cursor, table)
+
+        # столбцы, NOT NULL и значения по умолчанию; id без identity старой таблицы
+        cursor.execute(f'CREATE TABLE {qn(new_table)} (LIKE {qn(table)} INCLUDING DEFAULTS) '
+                       f'PARTITION BY HASH ({qn(PARTITION_KEY)})')
+
+        for remainder in range(partition_count):
+            cursor.execute(f'CREATE TABLE {qn(f"{table}_p{remainder}")} '
+                           f'PARTITION OF {qn(new_table)} '
+                           f'FOR VALUES WITH (MODULUS {partition_count}, REMAINDER {remainder})')
+
+        cursor.execute(f'CREATE SEQUENCE {qn(sequence)} AS bigint '
+                       f'OWNED BY {qn(new_table)}.{qn("id")}')
+        cursor.execute(f'ALTER TABLE {qn(new_table)} ALTER COLUMN {qn("id")} '
+                       f"SET DEFAULT nextval('{sequence}')")
+
+        # данные переносятся до создания индексов - так быстрее
+        cursor.execute(f'INSERT INTO {qn(new_table)} SELECT * FROM {qn(table)}')
+        row_count = cursor.rowcount
+
+        cursor.execute(f"SELECT setval('{sequence}', "
+                       f'COALESCE((SELECT MAX({qn("id")}) FROM {qn(new_table)}), 0) + 1, false)')
+
+        # первичный ключ без exchange_id невозможен - обычный индекс по id
+        cursor.execute(f'CREATE INDEX {qn(f"{table}_id_idx")} ON {qn(new_table)} ({qn("id")})')
+
+        # ограничения и индексы создаются с временными именами,
+        # после переноса имена старой таблицы переходят к новой
+        renames = []
+
+        for i, (name, definition) in enumerate(constraints):
+            tmp_name = f'tmp_{table}_c{i}'
+            cursor.execute(f'ALTER TABLE {qn(new_table)} ADD CONSTRAINT {qn(tmp_name)} {definition}')
+            renames.append(('constraint', name, tmp_name))
+
+        for i, (name, definition) in enumerate(indexes):
+            tmp_name = f'tmp_{table}_i{i}'
+            # CREATE [UNIQUE] INDEX имя ON таблица USING ...
+            unique = 'UNIQUE ' if definition.startswith('CREATE UNIQUE') else ''
+            cursor.execute(f'CREATE {unique}INDEX {qn(tmp_name)} ON {qn(new_table)}'
+                           f'{definition[definition.index(" USING "):]}')
+            renames.append(('index', name, tmp_name))
+
+        # старая таблица и её имена уходят в резервную копию,
+        # соответствие имён и внешние ключи сохраняются в комментарии для отката
+        backup_names = []
+        foreign_keys = [(name, definition) for name, definition in constraints
+                        if definition.startswith('FOREIGN KEY')]
+        foreign_key_names = {name for name, _ in foreign_keys}
+
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(backup_table)}')
+
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(backup_table)} DROP CONSTRAINT {qn(name)}')
+
+        for i, (kind, name, tmp_name) in enumerate(renames):
+            if kind == 'constraint' and name in foreign_key_names:
+                rename_schema_object(cursor, kind, new_table, tmp_name, name)
+                continue
+
+            backup_name = f'{table[:40]}_bak{i}'
+            rename_schema_object(cursor, kind, backup_table, name, backup_name)
+            rename_schema_object(cursor, kind, new_table, tmp_name, name)
+            backup_names.append((kind, backup_name, name))
+
+        cursor.execute(f'ALTER TABLE {qn(new_table)} RENAME TO {qn(table)}')
+
+        cursor.execute(f'COMMENT ON TABLE {qn(backup_table)} IS %s',
+                       [json.dumps({
+                           'names': backup_names,
+                           'foreign_keys': foreign_keys,
+                       })])
+
+    return {
+        'rows': row_count,
+        'time': time() - start_time,
+    }
+
+
+def rename_schema_object(cursor,
+                         kind: str,
+                         table: str,
+                         name: str,
+                         new_name: str):
+    if kind == 'constraint':
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME CONSTRAINT {qn(name)} TO {qn(new_name)}')
+    else:
+        cursor.execute(f'ALTER INDEX {qn(name)} RENAME TO {qn(new_name)}')
+
+
+def unpartition_table(model: type[Model]) -> dict:
+    '''
+    Откат: текущие строки секционированной таблицы переносятся в резервную
+    (обычную) таблицу, она возвращается на место, секционированная удаляется.
+    Возвращает {'rows': ..., 'time': ...}
+    '''
+    check_postgresql()
+
+    table = model._meta.db_table
+    backup_table = get_backup_table(table)
+
+    start_time = time()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if get_relkind(cursor, table) != 'p':
+            raise ValueError(f'таблица {table} не секционирована')
+
+        if get_relkind(cursor, backup_table) != 'r':
+            raise ValueError(f'резервной таблицы {backup_table} нет, откат невозможен')
+
+        cursor.execute('SET LOCAL statement_timeout = 0')
+        cursor.execute(f'LOCK TABLE {qn(table)} IN EXCLUSIVE MODE')
+
+        cursor.execute('SELECT obj_description(to_regclass(%s), %s)',
+                       [backup_table, 'pg_class'])
+        backup_info = json.loads(cursor.fetchone()[0] or '{}')
+
+        # копии, созданные до удаления внешних ключей, хранят только имена
+        if isinstance(backup_info, list):
+            backup_info = {'names': backup_info}
+
+        cursor.execute(f'TRUNCATE {qn(backup_table)}')
+        cursor.execute(f'INSERT INTO {qn(backup_table)} SELECT * FROM {qn(table)}')
+        row_count = cursor.rowcount
+
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{backup_table}', 'id'), "
+                       f'COALESCE((SELECT MAX({qn("id")}) FROM {qn(backup_table)}), 0) + 1, false)')
+
+        cursor.execute(f'DROP TABLE {qn(table)}')
+        cursor.execute(f'ALTER TABLE {qn(backup_table)} RENAME TO {qn(table)}')
+
+        for kind, backup_name, name in backup_info.get('names', ()):
+            rename_schema_object(cursor, kind, table, backup_name, name)
+
+        # имена внешних ключей освободились вместе с секционированной таблицей
+        for name, definition in backup_info.get('foreign_keys', ()):
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+        cursor.execute(f'COMMENT ON TABLE {qn(table)} IS NULL')
+
+    return {
+        'rows': row_count,
+        'time': time() - start_time,
+    }
+
+
+def drop_backup_table(model: type[Model]) -> bool:
+    check_postgresql()
+
+    backup_table = get_backup_table(model._meta.db_table)
+
+    with connection.cursor() as cursor:
+        if get_relkind(cursor, backup_table) is None:
+            return False
+
+        cursor.execute(f'DROP TABLE {qn(backup_table)}')
+
+    return True
+
+
+def get_plan_relations(plan: dict) -> set[str]:
+    relations = set()
+
+    if 'Relation Name' in plan:
+        relations.add(plan['Relation Name'])
+
+    for sub_plan in plan.get('Plans', ()):
+        relations |= get_plan_relations(sub_plan)
+
+    return relations
+
+
+def explain_exchange_queries(model: type[Model],
+                             exchange_id: int,
+                             rounds: int = 20,
+                             table: str | None = None) -> list[dict]:
+    '''
+    Планы и время запросов записи направлений одного обменника (снимок
+    направлений, деактивация пропавших, продление срока): какие таблицы/секции
+    затрагивает каждый запрос и среднее время выполнения.
+    table - другая таблица с теми же столбцами (резервная копия для сравнения).
+    Изменяющие запросы выполняются в транзакции с откатом, данные не меняются
+    '''
+    check_postgresql()
+
+    table = qn(table or model._meta.db_table)
+
+    queries = (
+        ('snapshot',
+         f'SELECT * FROM {table} WHERE {qn(PARTITION_KEY)} = %s'),
+        ('deactivate',
+         f'UPDATE {table} SET {qn("is_active")} = false '
+         f'WHERE {qn(PARTITION_KEY)} = %s AND {qn("is_active")}'),
+        ('renew_lease',
+         f'UPDATE {table} SET {qn("expires_at")} = now() '
+         f'WHERE {qn(PARTITION_KEY)} = %s AND {qn("is_active")} AND {qn("expires_at")} < now()'),
+    )
+
+    results = []
+
+    with connection.cursor() as cursor:
+        for name, sql in queries:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', [exchange_id])
+
+            plan = cursor.fetchone()[0]
+
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            total_time = 0
+
+            for _ in range(rounds):
+                with transaction.atomic():
+                    start_time = time()
+
+                    cursor.execute(sql, [exchange_id])
+
+                    if cursor.description is not None:
+                        cursor.fetchall()
+
+                    total_time += time() - start_time
+
+                    transaction.set_rollback(True)
+
+            results.append({
+                'query': name,
+                'relations': sorted(get_plan_relations(plan[0]['Plan'])),
+                'avg_ms': total_time / rounds * 1000,
+            })
+
+    return results
+
+
+def compare_exchange_queries(model: type[Model],
+                             exchange_id: int,
+                             rounds: int = 20) -> dict[str, list[dict]]:
+    '''
+    Время запросов записи направлений обменника на текущей таблице
+    и на резервной копии (обычной таблице до секционирования), если она есть
+    '''
+    check_postgresql()
+
+    table = model._meta.db_table
+    backup_table = get_backup_table(table)
+
+    results = {
+        table: explain_exchange_queries(model, exchange_id, rounds=rounds),
+    }
+
+    with connection.cursor() as cursor:
+        has_backup = get_relkind(cursor, backup_table) is not None
+
+    if has_backup:
+        results[backup_table] = explain_exchange_queries(model,
+                                                         exchange_id,
+                                                         rounds=rounds,
+                                                         table=backup_table)
+
+    return results
@@ -1,11 +1,20 @@
+import os
 import re
+import hashlib
 import requests
 import ssl
 import asyncio
 
+from contextlib import nullcontext
+from time import time
+from urllib.parse import urlsplit
+
 import aiohttp
+import aiofiles
 import httpx
 
+from lxml import etree
+
 from httpx import AsyncClient
 
 from asgiref.sync import async_to_sync, sync_to_async
@@ -16,7 +25,17 @@ from django_celery_beat.models import IntervalSchedule
 
 from general_models.models import BaseExchange, Exchanger
 
-from .exc import RobotCheckError, TimeoutError, TechServiceWork
+from .exc import (RobotCheckError,
+                  TimeoutError,
+                  TechServiceWork,
+                  InvalidXmlFile,
+                  XmlNotModified,
+                  XmlTooLarge)
+from .xml_stream import XmlItemStream, iter_xml_items, XML_CHUNK_SIZE
+from .xml_snapshots import get_snapshot_compressor, XML_SNAPSHOT_SUFFIX
+from .circuit_breaker import CIRCUIT_PROBE_TIMEOUT
+from .exchanger_status import set_exchanger_status
+from .xml_limits import get_xml_size_limit
 
 
 def get_or_create_schedule(interval: int, period: str):
@@ -30,64 +49,108 @@ def get_or_create_schedule(interval: int, period: str):
     return schedule
    
 
+def set_xml_check_status(exchange: BaseExchange | Exchanger,
+                         is_active: bool,
+                         active_status: str):
+    '''
+    Статус обменника после запроса XML файла, пишется только при изменении.
+    Переходы Exchanger попадают в историю статусов,
+    старые модели обменников (cash, no_cash) сохраняют только эти поля
+    '''
+    if isinstance(exchange, Exchanger):
+        set_exchanger_status(exchange, is_active, active_status, source='xml_check')
+    elif (exchange.is_active, exchange.active_status) != (is_active, active_status):
+        exchange.is_active = is_active
+        exchange.active_status = active_status
+        exchange.save(update_fields=['is_active', 'active_status'])
+
+
 def try_get_xml_file(exchange: BaseExchange) -> str | None:
     '''
     Возвращает XML файл в формате строки или None
     '''
     
+    # в БД пишется только изменившийся статус (utils/exchanger_status.py)
     try:
         is_active, xml_file = async_to_sync(request_to_xml_file)(exchange.xml_url,
-                                                                 exchange.timeout)
+                                                                 exchange.timeout,
+                                                                 get_xml_size_limit(exchange))
     except RobotCheckError as ex:
         print('Robot check error', ex)
-        exchange.is_active = False
-        exchange.active_status = 'robot check error'
-        exchange.save()
+        set_xml_check_status(exchange, False, 'robot check error')
         # print(exchange.__dict__)
     except TimeoutError as ex:
         print('Timeout error', ex)
-        exchange.is_active = False
-        exchange.active_status = 'timeout error'
-        exchange.save()
+        set_xml_check_status(exchange, False, 'timeout error')
         # print(exchange.__dict__)
-    except TechServiceWork as ex:
+    except XmlTooLarge as ex:
         print(ex)
-        exchange.is_active = False
-        exchange.active_status = 'inactive'
-        exchange.save()
+        set_xml_check_status(exchange, False, 'too large')
+    except (TechServiceWork, InvalidXmlFile) as ex:
+        print(ex)
+        set_xml_check_status(exchange, False, 'inactive')
         # print(exchange.__dict__)
     except Exception as ex:
         print(f'CHECK ACTIVE EXCEPTION!!! {exchange.name}', ex)
         # if exchange.is_active:
-        exchange.is_active = False
-        exchange.active_status = 'inactive'
-        exchange.save()
+        set_xml_check_status(exchange, False, 'inactive')
         # print(exchange.__dict__)
     else:
         # if exchange.period_for_update != 0:
             # if exchange.is_active != is_active:
-        exchange.is_active = is_active
-        exchange.active_status = 'active'
+        set_xml_check_status(exchange, is_active, 'active')
         # else:
         #     exchange.is_active = False
         #     exchange.active_status = 'unactive'
 
-        exchange.save()
             # print(exchange.__dict__)
 
         return xml_file
 
 
 async def new_try_get_xml_file(exchange: BaseExchange,
-                               session: aiohttp.ClientSession) -> str | None:
+                               session: aiohttp.ClientSession,
+                               snapshot_dir: str,
+                               feed_state: dict | None = None,
+                               http2_session: httpx.AsyncClient | None = None,
+                               http2_hosts: dict | None = None,
+                               is_probe: bool = False) -> tuple:
     '''
-    Возвращает XML файл в формате строки или None
+    Потоково сохраняет XML файл обменника сжатой версией в каталог snapshot_dir.
+    Возвращает (is_active, active_status) при ошибке или
+    (is_active, active_status, путь к версии, feed_state) при успешном получении файла.
+    Если файл не изменился с последней обработки, путь и feed_state - None,
+    а статус берётся из результата его парсинга (тех обслуживание, битый XML).
+    У изменившегося файла статус - предварительный (результат парсинга
+    прошлой версии): итоговый статус записывает задача парсинга.
+    is_probe - пробный запрос предохранителя (half_open):
+    короткий таймаут и без повтора через httpx
     '''
+    timeout = exchange.timeout
+
+    if is_probe:
+        timeout = min(timeout if timeout and timeout > 0 else DEFAULT_XML_TIMEOUT,
+                      CIRCUIT_PROBE_TIMEOUT)
     
     try:
-        is_active, xml_file = await new_request_to_xml_file(exchange.xml_url,
-                                                            session,
-                                                            exchange.timeout)
+        is_active, xml_file, new_feed_state = await new_request_to_xml_file(exchange.xml_url,
+                                                                            session,
+                                                                            snapshot_dir,
+                                                                            timeout,
+                                                                            feed_state,
+                                                                            http2_session,
+                                                                            http2_hosts,
+                                                                            http2_fallback=not is_probe,
+                                                                            max_size=get_xml_size_limit(exchange))
+    except XmlNotModified:
+        _active_status = (feed_state or {}).get('active_status', 'active')
+
+        return (
+            _active_status == 'active',
+            _active_status,
+            None,
+            None,
+        )
     except RobotCheckError as ex:
         print('Robot check error', ex)
         # exchange.is_active = False
@@ -118,6 +181,15 @@ async def new_try_get_xml_file(exchange: BaseExchange,
 
         # await sync_to_async(exchange.save, thread_sensitive=True)()
         # print(exchange.__dict__)
+    except XmlTooLarge as ex:
+        print(ex)
+        _is_active = False
+        _active_status = 'too large'
+
+        return(
+            _is_active,
+            _active_status,
+        )
     except TechServiceWork as ex:
         print(ex)
         # exchange.is_active = False
@@ -152,8 +224,10 @@ async def new_try_get_xml_file(exchange: BaseExchange,
             # if exchange.is_active != is_active:
         # exchange.is_active = is_active
         # exchange.active_status = 'active'
-        _is_active = is_active
-        _active_status = 'active'
+        # тех обслуживание и некорректный XML станут известны только
+        # после парсинга, до него статус - как у прошлой версии файла
+        _active_status = (feed_state or {}).get('active_status', 'active')
+        _is_active = is_active and _active_status == 'active'
 
         # else:
         #     exchange.is_active = False
@@ -167,6 +241,7 @@ async def new_try_get_xml_file(exchange: BaseExchange,
             _is_active,
             _active_status,
             xml_file,
+            new_feed_state,
         )
 
 
@@ -195,7 +270,8 @@ async def new_try_get_xml_file(exchange: BaseExchange,
 
 
 async def request_to_xml_file(xml_url: str,
-                              timeout: int = None):
+                              timeout: int = None,
+                              max_size: int | None = None):
     DEFAULT_TIMEOUT = 5
     # headers = {
     #     # 'User-Agent': 'My User Agent 1.0',
@@ -232,90 +308,322 @@ async def request_to_xml_file(xml_url: str,
 
                     raise RobotCheckError(f'{xml_url} требует проверку на робота')
                 else:
-                    xml_file = await response.text()
-                    root = ET.fromstring(xml_file)
+                    check_xml_content_length(response.headers, xml_url, max_size)
+
+                    content = bytearray()
+
+                    async for chunk in response.content.iter_chunked(XML_CHUNK_SIZE):
+                        content += chunk
+                        check_xml_size(len(content), xml_url, max_size)
+
+                    # старые задачи (cash, no_cash) разбирают xml_file сами,
+                    # тех обслуживание и некорректный XML проверяются здесь
+                    encoding = check_xml_document(bytes(content), xml_url)
+
+                    # тело прочитано кусками (get_encoding() работает только
+                    # с прочитанным телом): кодировка из заголовка,
+                    # иначе из XML декларации
+                    xml_file = content.decode(response.charset or encoding)
                     is_active = True
-                    if root.text == 'Техническое обслуживание':
-                        raise TechServiceWork(f'{xml_url} на тех обслуживании')
-                        # is_active = False
                     return (is_active, xml_file)
     except asyncio.TimeoutError as ex:
         raise TimeoutError(f'{xml_url} не вернул ответ за {_timeout} секунд')
 
 
 
-async def new_request_to_xml_file(xml_url: str,
-                              session: aiohttp.ClientSession,
-                              timeout: int = None):
-    DEFAULT_TIMEOUT = 10 # временно для теста на сервере
+def check_xml_document(content: bytes,
+                       xml_url: str) -> str:
+    '''
+    Потоковая проверка XML файла без сохранения элементов:
+    InvalidXmlFile - некорректный или пустой XML,
+    TechServiceWork - заглушка тех обслуживания.
+    Возвращает кодировку документа (по умолчанию utf-8)
+    '''
+    stream = XmlItemStream()
+
+    try:
+        for _element in iter_xml_items(content, stream):
+            pass
+    except etree.XMLSyntaxError as ex:
+        raise InvalidXmlFile(f'{xml_url} некорректный XML: {ex}')
+
+    if stream.is_tech_service():
+        raise TechServiceWork(f'{xml_url} на тех обслуживании')
+
+    if stream.root is None:
+        raise InvalidXmlFile(f'{xml_url} пустой XML')
+
+    return stream.root.getroottree().docinfo.encoding or 'utf-8'
+
+
+def get_conditional_headers(feed_state: dict | None) -> dict:
+    '''
+    Заголовки условного GET запроса по ETag/Last-Modified
+    последнего обработанного XML файла
+    '''
+    headers = {}
+
+    if feed_state:
+        if etag := feed_state.get('etag'):
+            headers['If-None-Match'] = etag
+        if last_modified := feed_state.get('last_modified'):
+            headers['If-Modified-Since'] = last_modified
+
+    return headers
+
+
+def check_xml_size(size: int,
+                   xml_url: str,
+                   max_size: int | None):
+    if max_size is not None and size > max_size:
+        raise XmlTooLarge(f'{xml_url} XML файл больше {max_size} байт')
+
+
+def check_xml_content_length(headers,
+                             xml_url: str,
+                             max_size: int | None):
+    '''
+    Слишком большой файл по заголовку Content-Length
+    отклоняется без чтения тела ответа
+    '''
+    content_length = headers.get('Content-Length')
+
+    if content_length and content_length.isdigit():
+        check_xml_size(int(content_length), xml_url, max_size)
+
+
+async def stream_xml_to_file(chunks,
+                             snapshot_dir: str,
+                             xml_url: str,
+                             feed_state: dict | None = None,
+                             max_size: int | None = None):
+    '''
+    Потоково пишет XML на диск без разбора: корректность документа
+    и тех обслуживание проверяются в задаче парсинга за тот же единственный проход.
+    Файл сжимается на лету и сохраняется версией snapshot_dir/<digest>.xml.gz
+    (см. xml_snapshots). Сначала пишется во временный .part и атомарно
+    переименовывается, чтобы задача парсинга никогда не читала недописанный XML.
+    Если digest содержимого совпал с последним обработанным,
+    версия не сохраняется и вызывается XmlNotModified.
+    Если несжатый XML больше max_size байт, чтение прерывается (XmlTooLarge).
+    Возвращает (True, путь к версии, digest, размер несжатого XML)
+    '''
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    tmp_path = os.path.join(snapshot_dir, 'download.part')
+    digest = hashlib.blake2b(digest_size=16)
+    compressor = get_snapshot_compressor()
+    size = 0
+
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            async for chunk in chunks:
+                await f.write(compressor.compress(chunk))
+                digest.update(chunk)
+                size += len(chunk)
+
+                check_xml_size(size, xml_url, max_size)
+
+            await f.write(compressor.flush())
+        
+        digest = digest.hexdigest()
+
+        if feed_state and feed_state.get('digest') == digest:
+            raise XmlNotModified(f'{xml_url} не изменился')
+
+        # та же версия, полученная раньше, просто подменяется
+        # и становится последней
+        path = os.path.join(snapshot_dir, f'{digest}{XML_SNAPSHOT_SUFFIX}')
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return (True, path, digest, size)
+
+
+# общий SSL контекст процесса: сертификаты загружаются один раз,
+# TLS сессии переиспользуются между запросами
+SSL_CONTEXT = ssl.create_default_context()
+
+DEFAULT_XML_TIMEOUT = 10 # временно для теста на сервере
+
+# через сколько секунд хост, запомненный как требующий HTTP/2,
+# снова пробуется через aiohttp
+HTTP2_HOST_TTL = 60 * 60 * 6
+
+
+def get_xml_request_headers(feed_state: dict | None) -> dict:
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
                     'AppleWebKit/537.36 (KHTML, like Gecko) '
                     'Chrome/127.0.0.0 Safari/537.36',
         'Accept': 'application/xml, text/xml;q=0.9, */*;q=0.8',
     }
-
-    ssl_context = ssl.create_default_context()
-
-    _timeout = timeout if timeout and timeout > 0 else DEFAULT_TIMEOUT
-
-    timeout = aiohttp.ClientTimeout(connect=_timeout,
-                                    sock_connect=_timeout,
-                                    sock_read=_timeout)
-
-    try:
-        async with session.get(xml_url,
-                            headers=headers,
-                            ssl=ssl_context,
-                            timeout=timeout) as response:
-        # response = await session.get(xml_url,
-        #                              headers=headers,
-        #                              timeout=_timeout)
-            content_type = response.headers.get('Content-Type', '').lower()
-            # content_type = await response.headers.get('Content-Type', '').lower()
-
-                # if not re.match(r'^[a-zA-Z]+\/xml?', content_type):
-            if 'xml' not in content_type:
-
-                # if xml_url == 'https://loderunner.exchange/request-exportxml.xml?hcron=lk2882HdHrtvM':
-                #     print('test22', content_type, response.text, sep='***')
-
-                raise RobotCheckError(f'{xml_url} требует проверку на робота')
-            else:
-                xml_file = await response.text()
-                root = ET.fromstring(xml_file)
-                is_active = True
-                
-                if root.text == 'Техническое обслуживание':
-                    raise TechServiceWork(f'{xml_url} на тех обслуживании')
-                    # is_active = False
-                return (is_active, xml_file)
-            
-    except asyncio.TimeoutError as ex:
-        raise TimeoutError(f'{xml_url} не вернул ответ за 10 секунд')
-    
-    except Exception as ex:
-        print(ex)
-        print('TRY HTTPX/2 CONNECTION...')
-        async with httpx.AsyncClient(http2=True) as _session:
-            response = await _session.get(xml_url,
-                                         headers=headers,
-                                         timeout=_timeout)
-            content_type = response.headers.get('Content-Type', '').lower()
-
-            if 'xml' not in content_type:
-                raise RobotCheckError(f'{xml_url} требует проверку на робота')
-            else:
-                xml_file = response.text
-                root = ET.fromstring(xml_file)
-                is_active = True
-                
-                if root.text == 'Техническое обслуживание':
-                    raise TechServiceWork(f'{xml_url} на тех обслуживании')
-                    # is_active = False
-                return (is_active, xml_file)
+    headers.update(get_conditional_headers(feed_state))
+
+    return headers
+
+
+async def aiohttp_request_to_xml_file(xml_url: str,
+                                      session: aiohttp.ClientSession,
+                                      snapshot_dir: str,
+                                      headers: dict,
+                                      timeout: int,
+                                      feed_state: dict | None = None,
+                                      max_size: int | None = None):
+    timeout = aiohttp.ClientTimeout(connect=timeout,
+                                    sock_connect=timeout,
+                                    sock_read=timeout)
+
+    async with session.get(xml_url,
+                           headers=headers,
+                           ssl=SSL_CONTEXT,
+                           timeout=timeout) as response:
+        if response.status == 304:
+            raise XmlNotModified(f'{xml_url} не изменился')
+
+        content_type = response.headers.get('Content-Type', '').lower()
+
+        if 'xml' not in content_type:
+            raise RobotCheckError(f'{xml_url} требует проверку на робота')
+        else:
+            check_xml_content_length(response.headers, xml_url, max_size)
+
+            # XML не собирается целиком в строку,
+            # куски из сокета сразу сжимаются и уходят на диск
+            is_active, xml_file, digest, size = await stream_xml_to_file(response.content.iter_chunked(XML_CHUNK_SIZE),
+                                                                         snapshot_dir,
+                                                                         xml_url,
+                                                                         feed_state,
+                                                                         max_size)
+            return (
+                is_active,
+                xml_file,
+                {
+                    'digest': digest,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'size': size,
+                },
+            )
+
+
+async def httpx_request_to_xml_file(xml_url: str,
+                                    http2_session: httpx.AsyncClient,
+                                    snapshot_dir: str,
+                                    headers: dict,
+                                    timeout: int,
+                                    feed_state: dict | None = None,
+                                    max_size: int | None = None):
+    async with http2_session.stream('GET',
+                                    xml_url,
+                                    headers=headers,
+                                    timeout=timeout) as response:
+        if response.status_code == 304:
+            raise XmlNotModified(f'{xml_url} не изменился')
+
+        content_type = response.headers.get('Content-Type', '').lower()
+
+        if 'xml' not in content_type:
+            raise RobotCheckError(f'{xml_url} требует проверку на робота')
+        else:
+            check_xml_content_length(response.headers, xml_url, max_size)
+
+            is_active, xml_file, digest, size = await stream_xml_to_file(response.aiter_bytes(XML_CHUNK_SIZE),
+                                                                         snapshot_dir,
+                                                                         xml_url,
+                                                                         feed_state,
+                                                                         max_size)
+            return (
+                is_active,
+                xml_file,
+                {
+                    'digest': digest,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'size': size,
+                },
+            )
 
 
+async def new_request_to_xml_file(xml_url: str,
+                              session: aiohttp.ClientSession,
+                              snapshot_dir: str,
+                              timeout: int = None,
+                              feed_state: dict | None = None,
+                              http2_session: httpx.AsyncClient | None = None,
+                              http2_hosts: dict | None = None,
+                              http2_fallback: bool = True,
+                              max_size: int | None = None):
+    '''
+    Запрос XML файла через aiohttp с запасным вариантом через httpx (HTTP/2).
+    http2_session - общий клиент httpx (иначе создаётся на один запрос),
+    http2_hosts - {хост: время истечения} хостов, которые отвечают только
+    через httpx: для них попытка через aiohttp пропускается,
+    http2_fallback - повторять ли неудачный запрос через httpx,
+    max_size - лимит размера несжатого XML в байтах
+    (слишком большой файл через httpx не повторяется)
+    '''
+    headers = get_xml_request_headers(feed_state)
+
+    _timeout = timeout if timeout and timeout > 0 else DEFAULT_XML_TIMEOUT
+
+    host = urlsplit(xml_url).netloc
+
+    if http2_hosts is None or http2_hosts.get(host, 0) < time():
+        try:
+            return await aiohttp_request_to_xml_file(xml_url,
+                                                     session,
+                                                     snapshot_dir,
+                                                     headers,
+                                                     _timeout,
+                                                     feed_state,
+                                                     max_size)
+        except (XmlNotModified, XmlTooLarge):
+            raise
+
+        except asyncio.TimeoutError as ex:
+            raise TimeoutError(f'{xml_url} не вернул ответ за {_timeout} секунд')
+        
+        except Exception as ex:
+            print(ex)
+
+            if not http2_fallback:
+                raise
+
+            print('TRY HTTPX/2 CONNECTION...')
+
+    if http2_session is None:
+        http2_session = httpx.AsyncClient(http2=True,
+                                          verify=SSL_CONTEXT)
+    else:
+        http2_session = nullcontext(http2_session)
+
+    is_answered = False
+
+    async with http2_session as _session:
+        try:
+            result = await httpx_request_to_xml_file(xml_url,
+                                                     _session,
+                                                     snapshot_dir,
+                                                     headers,
+                                                     _timeout,
+                                                     feed_state,
+                                                     max_size)
+            is_answered = True
+        except (XmlNotModified, XmlTooLarge):
+            is_answered = True
+            raise
+        except httpx.TimeoutException as ex:
+            raise TimeoutError(f'{xml_url} не вернул ответ за {_timeout} секунд')
+        finally:
+            # хост ответил через httpx - следующие запросы сразу идут через него
+            if is_answered and http2_hosts is not None:
+                http2_hosts[host] = time() + HTTP2_HOST_TTL
+
+    return result
 
 
 def request_to_bot_swift_sepa(data: dict):
@@ -0,0 +1,119 @@
+import random
+
+from config import DIRECTION_TTL
+
+from general_models.models import Exchanger
+
+
+# как часто запускается общий обход get_xml_file_for_exchangers (сек),
+# каждый запуск опрашивает только обменники, у которых подошло время
+POLL_SWEEP_INTERVAL = 15
+
+# интервал по умолчанию, если у обменника не задан period_for_create
+POLL_DEFAULT_INTERVAL = 90
+# нижняя граница интервала опроса для любого обменника
+POLL_MIN_INTERVAL = 30
+
+# множители интервала: XML изменился - чаще, не изменился - реже
+POLL_CHANGED_FACTOR = 0.5
+POLL_NOT_MODIFIED_FACTOR = 1.5
+
+# границы интервала относительно period_for_create (обычный, VIP)
+POLL_MIN_FACTOR = 0.5
+POLL_MAX_FACTOR = 8
+POLL_VIP_MIN_FACTOR = 0.25
+POLL_VIP_MAX_FACTOR = 2
+
+# интервал не меньше времени получения XML, умноженного на этот множитель
+POLL_FETCH_TIME_FACTOR = 4
+
+# разброс следующего опроса, чтобы запросы не собирались в один тик
+POLL_JITTER = 0.1
+
+# срок направлений продлевается при опросе, когда до истечения
+# остаётся меньше DIRECTION_TTL / 2 (см. direction_expiry), поэтому
+# интервал опроса вместе с разбросом должен быть меньше половины срока,
+# иначе направления не изменившихся XML истекают между опросами
+POLL_MAX_LEASE_INTERVAL = DIRECTION_TTL / 2 / (1 + POLL_JITTER)
+
+
+def get_poll_interval_bounds(exchange: Exchanger):
+    '''
+    Базовый интервал (period_for_create) и границы интервала опроса обменника
+    '''
+    base_interval = exchange.period_for_create or POLL_DEFAULT_INTERVAL
+
+    if exchange.is_vip:
+        min_factor, max_factor = POLL_VIP_MIN_FACTOR, POLL_VIP_MAX_FACTOR
+    else:
+        min_factor, max_factor = POLL_MIN_FACTOR, POLL_MAX_FACTOR
+
+    max_interval = min(max(POLL_MIN_INTERVAL, base_interval * max_factor),
+                       POLL_MAX_LEASE_INTERVAL)
+    min_interval = min(max(POLL_MIN_INTERVAL, base_interval * min_factor),
+                       max_interval)
+
+    return (
+        min(base_interval, max_interval),
+        min_interval,
+        max_interval,
+    )
+
+
+def is_poll_due(poll_state: dict | None,
+                now: float) -> bool:
+    return poll_state is None or poll_state['next_poll_at'] <= now
+
+
+def get_next_poll_state(exchange: Exchanger,
+                        poll_state: dict | None,
+                        outcome: str,
+                        active_status: str,
+                        fetch_time: float,
+                        now: float) -> dict:
+    '''
+    Следующее состояние планировщика после опроса обменника.
+    outcome: changed - XML изменился, not_modified - не изменился,
+    error - ошибка получения (класс ошибки в active_status).
+    XML меняется - интервал сокращается, не меняется - растёт.
+    При ошибках интервал не меняется: отсрочку опроса недоступных
+    обменников задаёт предохранитель (circuit_breaker)
+    '''
+    base_interval, min_interval, max_interval = get_poll_interval_bounds(exchange)
+
+    if poll_state is None:
+        poll_state = {
+            'interval': base_interval,
+            'failures': 0,
+        }
+
+    interval = poll_state['interval']
+    failures = poll_state['failures']
+
+    if outcome == 'error':
+        failures += 1
+        delay = interval
+    else:
+        failures = 0
+
+        if outcome == 'changed':
+            interval *= POLL_CHANGED_FACTOR
+        else:
+            interval *= POLL_NOT_MODIFIED_FACTOR
+
+        interval = min(max(interval, min_interval), max_interval)
+        # медленный XML не опрашивается чаще, чем успевает отдаваться
+        interval = max(interval, fetch_time * POLL_FETCH_TIME_FACTOR)
+        interval = min(interval, POLL_MAX_LEASE_INTERVAL)
+
+        delay = interval
+
+    delay *= random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    return {
+        'interval': interval,
+        'failures': failures,
+        'fetch_time': fetch_time,
+        'outcome': outcome,
+        'next_poll_at': now + delay,
+    }
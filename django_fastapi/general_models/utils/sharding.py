@@ -0,0 +1,94 @@
+from bisect import bisect
+from hashlib import md5
+
+from django.core.cache import cache
+
+from config import XML_SHARD_VNODES, XML_SHARD_PARSE_AFFINITY
+
+
+# Шардирование опроса XML файлов между несколькими run_xml_fetcher.
+# Каждый сервис запускается со своим именем шарда и отмечается в кэше,
+# обменники распределяются по живым шардам консистентным хешированием
+# exchange_id: при добавлении или остановке шарда переезжает только
+# ~1/N обменников, остальные остаются на своём шарде (соединения,
+# HTTP/2 хосты и индекс направлений воркеров шарда остаются прогретыми).
+# Состояния планировщика, предохранителя и XML файлов общие (кэш),
+# поэтому переехавший обменник продолжает опрашиваться по расписанию
+
+# шард считается остановленным, если не отмечался дольше (сек)
+XML_SHARD_HEARTBEAT_TIMEOUT = 60 * 2
+
+
+def get_shard_heartbeat_key(shard: str):
+    return f'xml_shard_heartbeat_{shard}'
+
+
+def set_shard_heartbeat(shard: str):
+    cache.set(get_shard_heartbeat_key(shard), True, XML_SHARD_HEARTBEAT_TIMEOUT)
+
+    # список имён только пополняется, живые шарды определяются по отметкам
+    shards = cache.get('xml_shards', [])
+
+    if shard not in shards:
+        cache.set('xml_shards', sorted({*shards, shard}), None)
+
+
+def get_live_shards() -> list[str]:
+    shards = cache.get('xml_shards', [])
+
+    keys = {get_shard_heartbeat_key(shard): shard for shard in shards}
+
+    return sorted(keys[key] for key in cache.get_many(keys))
+
+
+def _get_hash(value: str) -> int:
+    return int.from_bytes(md5(value.encode()).digest()[:8], 'big')
+
+
+def build_hash_ring(shards: list[str]) -> tuple[list[int], list[str]]:
+    '''
+    Кольцо консистентного хеширования: XML_SHARD_VNODES точек на шард,
+    возвращает отсортированные хеши точек и соответствующие им шарды
+    '''
+    points = sorted((_get_hash(f'{shard}#{i}'), shard)
+                    for shard in shards
+                    for i in range(XML_SHARD_VNODES))
+
+    return [point for point, _ in points], [shard for _, shard in points]
+
+
+def get_exchanger_shard(ring: tuple[list[int], list[str]],
+                        exchange_id: int) -> str | None:
+    points, shards = ring
+
+    if not points:
+        return None
+
+    # первая точка кольца по часовой стрелке от хеша обменника
+    i = bisect(points, _get_hash(str(exchange_id))) % len(points)
+
+    return shards[i]
+
+
+def filter_shard_exchangers(exchangers: list,
+                            shard: str) -> list:
+    '''
+    Обменники, закреплённые за шардом (текущий шард всегда в кольце,
+    даже если его отметка ещё не видна в кэше)
+    '''
+    ring = build_hash_ring(sorted({*get_live_shards(), shard}))
+
+    return [exchange for exchange in exchangers
+            if get_exchanger_shard(ring, exchange.pk) == shard]
+
+
+def get_shard_queue(queue: str,
+                    shard: str | None) -> str:
+    '''
+    Очередь парсинга шарда (cpu_queue.<шард>), если включена привязка
+    парсинга к шарду - её слушают воркеры того же узла
+    '''
+    if shard is None or not XML_SHARD_PARSE_AFFINITY:
+        return queue
+
+    return f'{queue}.{shard}'
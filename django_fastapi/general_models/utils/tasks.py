@@ -2,6 +2,8 @@ import functools
 from typing import Union
 from decimal import Decimal, ROUND_HALF_UP
 
+import numpy as np
+
 from django.core.cache import cache
 from django.db.models import Prefetch, Subquery, OuterRef, Q
 from django.db import connection
@@ -58,6 +60,173 @@ def make_valid_values_for_dict(dict_for_exchange_direction: dict):
     dict_for_exchange_direction['out_count'] = out_count
 
 
+# верхняя граница значений для векторного округления, выше - скалярный путь
+# (x * 10^5 должно считаться в float64 с запасом точности)
+VECTOR_QUANTIZE_MAX_VALUE = 10 ** 9
+
+
+def _to_float_column(values: list):
+    '''
+    float() по колонке, неприводимые значения - NaN и флаг в маске
+    '''
+    try:
+        return (
+            np.array(list(map(float, values)), dtype=np.float64),
+            np.zeros(len(values), dtype=bool),
+        )
+    except Exception:
+        pass
+
+    column = []
+    invalid = []
+
+    for value in values:
+        try:
+            column.append(float(value))
+        except Exception:
+            column.append(np.nan)
+            invalid.append(True)
+        else:
+            invalid.append(False)
+
+    return (
+        np.array(column, dtype=np.float64),
+        np.array(invalid, dtype=bool),
+    )
+
+
+def _quantize_column(values: np.ndarray):
+    '''
+    Векторный аналог Decimal(x).quantize(Decimal('0.00001'), ROUND_HALF_UP)
+    для неотрицательных значений. Возвращает (целое число стотысячных,
+    маска значений, которые нельзя надёжно округлить в float64)
+    '''
+    scaled = values * 100000
+    floor = np.floor(scaled)
+
+    # значения около середины между соседними стотысячными
+    # и слишком большие значения округляются через Decimal
+    unsafe = np.abs(scaled - floor - 0.5) <= np.spacing(scaled) * 4
+    unsafe |= values > VECTOR_QUANTIZE_MAX_VALUE
+
+    return np.where(scaled - floor >= 0.5, floor + 1, floor), unsafe
+
+
+def make_valid_values_for_columns(in_counts: list,
+                                  out_counts: list,
+                                  fromfees: list):
+    '''
+    Пакетный вариант make_valid_values_for_dict для всех направлений XML файла:
+    нормализация курса, учёт fromfee, округление и проверка переполнения
+    выполняются на NumPy массивах. Строки, для которых float64 не гарантирует
+    совпадение со скалярной функцией (ошибки, деление на ноль, inf/nan,
+    отрицательные, граничные и очень большие значения), считаются скалярно.
+    Возвращает (in_count, out_count, маска отклонённых строк),
+    для отклонённых строк значения курса - None
+    '''
+    size = len(in_counts)
+
+    in_count, in_invalid = _to_float_column(in_counts)
+    out_count, out_invalid = _to_float_column(out_counts)
+
+    fee = np.zeros(size, dtype=np.float64)
+    fee_invalid = np.zeros(size, dtype=bool)
+
+    for i, fromfee in enumerate(fromfees):
+        if not fromfee:
+            continue
+        # строковый fromfee скалярная функция отклоняет (TypeError)
+        if type(fromfee) is float:
+            fee[i] = fromfee
+        else:
+            fee_invalid[i] = True
+
+    with np.errstate(all='ignore'):
+        in_count = np.abs(in_count)
+        out_count = np.abs(out_count)
+
+        scalar = in_invalid | out_invalid | fee_invalid
+
+        mask = in_count != 1
+        scalar |= mask & (in_count == 0)
+        out_count = np.where(mask, out_count / in_count, out_count)
+        in_count = np.where(mask, 1.0, in_count)
+
+        mask = out_count < 1
+        scalar |= mask & (out_count == 0)
+        in_count = np.where(mask, 1 / out_count, in_count)
+        out_count = np.where(mask, 1.0, out_count)
+
+        has_fee = fee != 0
+        mask = has_fee & (in_count == 1)
+        out_count = np.where(mask, out_count - out_count / 100 * fee, out_count)
+        mask = has_fee & (in_count != 1)
+        in_count = np.where(mask, in_count - in_count / 100 * fee, in_count)
+
+        scalar |= ~(np.isfinite(in_count) & np.isfinite(out_count))
+        scalar |= np.signbit(in_count) | np.signbit(out_count)
+
+        in_quantized, in_unsafe = _quantize_column(in_count)
+        out_quantized, out_unsafe = _quantize_column(out_count)
+
+    scalar |= in_unsafe | out_unsafe
+
+    in_quantized = np.where(scalar, 0, in_quantized).astype(np.int64).tolist()
+    out_quantized = np.where(scalar, 0, out_quantized).astype(np.int64).tolist()
+
+    exp = Decimal('0.00001')
+
+    # значения не больше VECTOR_QUANTIZE_MAX_VALUE,
+    # переполнение DecimalField(max_digits=20) здесь невозможно
+    result_in_count = [Decimal(value) * exp for value in in_quantized]
+    result_out_count = [Decimal(value) * exp for value in out_quantized]
+    rejected = np.zeros(size, dtype=bool)
+
+    for i in np.flatnonzero(scalar).tolist():
+        d = {
+            'in_count': in_counts[i],
+            'out_count': out_counts[i],
+            'fromfee': fromfees[i],
+        }
+        try:
+            make_valid_values_for_dict(d)
+        except Exception:
+            rejected[i] = True
+            result_in_count[i] = result_out_count[i] = None
+        else:
+            result_in_count[i] = d['in_count']
+            result_out_count[i] = d['out_count']
+
+    return (
+        result_in_count,
+        result_out_count,
+        rejected,
+    )
+
+
+def make_valid_values_for_dicts(dict_list: list[dict]):
+    '''
+    make_valid_values_for_dict для списка словарей направлений одним пакетом.
+    Возвращает (принятые словари с нормализованным курсом, маска отклонённых)
+    '''
+    in_counts, out_counts, rejected = make_valid_values_for_columns([d['in_count'] for d in dict_list],
+                                                                    [d['out_count'] for d in dict_list],
+                                                                    [d.get('fromfee') for d in dict_list])
+
+    accepted_list = []
+
+    for d, in_count, out_count, is_rejected in zip(dict_list, in_counts, out_counts, rejected):
+        if not is_rejected:
+            d['in_count'] = in_count
+            d['out_count'] = out_count
+            accepted_list.append(d)
+
+    return (
+        accepted_list,
+        rejected,
+    )
+
+
 def make_valid_partner_values_for_dict(dict_for_exchange_direction: dict):
     in_count = abs(float(dict_for_exchange_direction['in_count']))
     out_count = abs(float(dict_for_exchange_direction['out_count']))
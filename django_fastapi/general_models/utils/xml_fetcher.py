@@ -0,0 +1,74 @@
+from time import time
+
+import aiohttp
+import httpx
+
+from asgiref.sync import sync_to_async
+
+from .cache import get_http2_hosts, set_http2_hosts
+from .periodic_tasks import SSL_CONTEXT
+
+
+# максимум одновременных соединений к обменникам
+XML_FETCHER_CONNECTION_LIMIT = 50
+# время кэширования DNS ответов (сек)
+XML_FETCHER_DNS_CACHE_TTL = 60 * 10
+# сколько держать простаивающее keep-alive соединение (сек),
+# больше интервала между опросами, чтобы соединение доживало до следующего цикла
+XML_FETCHER_KEEPALIVE_TIMEOUT = 60 * 5
+
+
+class XmlFetcher:
+    '''
+    Клиенты для получения XML файлов обменников:
+    aiohttp сессия с общим SSL контекстом, кэшем DNS и keep-alive соединениями,
+    общий httpx клиент (HTTP/2) для запасных запросов
+    и память хостов, которые отвечают только через httpx.
+
+    В сервисе run_xml_fetcher живёт всё время работы процесса,
+    в задаче get_xml_file_for_exchangers - один цикл опроса
+    '''
+
+    def __init__(self, limit: int = XML_FETCHER_CONNECTION_LIMIT):
+        self.limit = limit
+        self.session = None
+        self.http2_session = None
+        self.http2_hosts = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.limit,
+                                         ttl_dns_cache=XML_FETCHER_DNS_CACHE_TTL,
+                                         keepalive_timeout=XML_FETCHER_KEEPALIVE_TIMEOUT,
+                                         ssl=SSL_CONTEXT)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+        limits = httpx.Limits(max_connections=self.limit,
+                              max_keepalive_connections=self.limit,
+                              keepalive_expiry=XML_FETCHER_KEEPALIVE_TIMEOUT)
+        self.http2_session = httpx.AsyncClient(http2=True,
+                                               verify=SSL_CONTEXT,
+                                               limits=limits)
+
+        self.http2_hosts = await sync_to_async(get_http2_hosts,
+                                               thread_sensitive=True)()
+
+        return self
+
+    async def __aexit__(self, *args):
+        try:
+            await self.save_http2_hosts()
+        finally:
+            await self.session.close()
+            await self.http2_session.aclose()
+
+    async def save_http2_hosts(self):
+        '''
+        Сохраняет актуальные HTTP/2 хосты в кэш (общие для всех процессов)
+        '''
+        now = time()
+
+        self.http2_hosts = {host: expires_at for host, expires_at in self.http2_hosts.items()
+                            if expires_at > now}
+
+        await sync_to_async(set_http2_hosts,
+                            thread_sensitive=True)(self.http2_hosts)
@@ -0,0 +1,32 @@
+from config import XML_MAX_SIZE, XML_MAX_ITEMS
+
+
+# Ограничения XML файла обменника: слишком большой файл не дочитывается
+# и не разбирается целиком (обрезанный файл дал бы неполные направления),
+# обменник получает статус 'too large'.
+# Лимит обменника (xml_max_size, xml_max_items) важнее общего из config,
+# 0 - без ограничения. У старых моделей обменников своих лимитов нет
+
+
+def get_xml_size_limit(exchange) -> int | None:
+    '''
+    Лимит размера несжатого XML файла в байтах или None
+    '''
+    max_size = getattr(exchange, 'xml_max_size', None)
+
+    if max_size is None:
+        return XML_MAX_SIZE or None
+
+    return max_size * 1024 * 1024 or None
+
+
+def get_xml_item_limit(exchange) -> int | None:
+    '''
+    Лимит количества элементов <item> XML файла или None
+    '''
+    max_items = getattr(exchange, 'xml_max_items', None)
+
+    if max_items is None:
+        return XML_MAX_ITEMS or None
+
+    return max_items or None
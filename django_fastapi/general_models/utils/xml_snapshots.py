@@ -0,0 +1,133 @@
+import os
+import gzip
+import zlib
+
+from pathlib import Path
+from time import time
+
+from config import (XML_SNAPSHOT_DIR,
+                    XML_SNAPSHOT_KEEP,
+                    XML_SNAPSHOT_MAX_AGE)
+
+
+# Хранилище версий XML файлов обменников:
+# XML_SNAPSHOT_DIR/<exchange_id>/<digest>.xml.gz.
+# Имя файла - digest содержимого, поэтому одинаковые версии хранятся один раз,
+# у каждого обменника остаются последние XML_SNAPSHOT_KEEP версий
+# не старше XML_SNAPSHOT_MAX_AGE (последняя версия хранится всегда)
+
+XML_SNAPSHOT_SUFFIX = '.xml.gz'
+
+# быстрое сжатие - файл сжимается на лету при получении в event loop
+XML_SNAPSHOT_COMPRESS_LEVEL = 3
+
+
+def get_snapshot_dir(exchange_id: int,
+                     snapshot_dir: str | None = None) -> str:
+    return os.path.join(snapshot_dir or XML_SNAPSHOT_DIR, str(exchange_id))
+
+
+def get_snapshot_path(exchange_id: int,
+                      digest: str) -> str:
+    return os.path.join(get_snapshot_dir(exchange_id), f'{digest}{XML_SNAPSHOT_SUFFIX}')
+
+
+def get_snapshot_compressor():
+    # wbits 31 - формат gzip, читается gzip.open
+    return zlib.compressobj(XML_SNAPSHOT_COMPRESS_LEVEL,
+                            zlib.DEFLATED,
+                            31)
+
+
+def open_xml_file(path: str):
+    '''
+    Открывает XML файл для потокового парсинга (версия .xml.gz или обычный .xml)
+    '''
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rb')
+
+    return open(path, 'rb')
+
+
+def list_xml_snapshots(exchange_id: int,
+                       snapshot_dir: str | None = None) -> list[dict]:
+    '''
+    Версии XML файла обменника, от новой к старой
+    (snapshot_dir - другое хранилище вместо XML_SNAPSHOT_DIR)
+    '''
+    snapshot_dir = Path(get_snapshot_dir(exchange_id, snapshot_dir))
+
+    if not snapshot_dir.is_dir():
+        return []
+
+    snapshots = []
+
+    for path in snapshot_dir.glob(f'*{XML_SNAPSHOT_SUFFIX}'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+
+        snapshots.append({
+            'digest': path.name[:-len(XML_SNAPSHOT_SUFFIX)],
+            'path': str(path),
+            'size': stat.st_size,
+            'saved_at': stat.st_mtime,
+        })
+
+    snapshots.sort(key=lambda snapshot: snapshot['saved_at'],
+                   reverse=True)
+
+    return snapshots
+
+
+def prune_xml_snapshots(exchange_id: int,
+                        keep: int = XML_SNAPSHOT_KEEP,
+                        max_age: int = XML_SNAPSHOT_MAX_AGE) -> int:
+    '''
+    Удаляет версии сверх keep последних и старше max_age секунд
+    (последняя версия не удаляется). Возвращает количество удалённых
+    '''
+    min_saved_at = time() - max_age
+
+    deleted_count = 0
+
+    for i, snapshot in enumerate(list_xml_snapshots(exchange_id)):
+        if i == 0 or (i < keep and snapshot['saved_at'] >= min_saved_at):
+            continue
+
+        try:
+            os.remove(snapshot['path'])
+            deleted_count += 1
+        except FileNotFoundError:
+            pass
+
+    return deleted_count
+
+
+def find_xml_snapshot(exchange_id: int,
+                      digest: str | None = None,
+                      snapshot_dir: str | None = None) -> dict | None:
+    '''
+    Версия по digest (можно начало digest) или последняя версия
+    '''
+    snapshots = list_xml_snapshots(exchange_id, snapshot_dir)
+
+    if digest is None:
+        return snapshots[0] if snapshots else None
+
+    for snapshot in snapshots:
+        if snapshot['digest'].startswith(digest):
+            return snapshot
+
+
+def get_feed_snapshot_path(exchange_id: int,
+                           feed_state: dict | None) -> str | None:
+    '''
+    Версия, полученная вместе с feed_state (без него - последняя версия)
+    '''
+    if feed_state and feed_state.get('digest'):
+        return get_snapshot_path(exchange_id, feed_state['digest'])
+
+    if (snapshot := find_xml_snapshot(exchange_id)) is not None:
+        return snapshot['path']
@@ -0,0 +1,106 @@
+from typing import IO, Iterable, Iterator
+
+from lxml import etree
+
+
+# размер куска при потоковом чтении XML (из сокета или с диска)
+XML_CHUNK_SIZE = 64 * 1024
+
+# текст корневого элемента XML файла обменника на тех обслуживании
+TECH_SERVICE_TEXT = 'Техническое обслуживание'
+
+
+class XmlItemStream:
+    '''
+    Инкрементальный разбор XML файла обменника.
+
+    Куски файла подаются через feed() по мере поступления,
+    готовые элементы <item> отдаются сразу же. Уже обработанные
+    элементы удаляются из дерева, поэтому потребление памяти
+    не зависит от размера файла
+    '''
+
+    def __init__(self, tag: str = 'item'):
+        self._parser = etree.XMLPullParser(events=('end',),
+                                           tag=tag)
+        self.root = None
+        self.item_count = 0
+        self.byte_count = 0
+
+    def _read_items(self) -> Iterator[etree._Element]:
+        for _event, element in self._parser.read_events():
+            if self.root is None:
+                self.root = element.getroottree().getroot()
+
+            self.item_count += 1
+
+            yield element
+
+            # очищаем элемент и уже обработанных соседей,
+            # иначе корень копит пустые <item> до конца файла
+            element.clear()
+            parent = element.getparent()
+
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    def feed(self, chunk: bytes) -> Iterator[etree._Element]:
+        self.byte_count += len(chunk)
+        self._parser.feed(chunk)
+
+        return self._read_items()
+
+    def is_tech_service(self) -> bool:
+        '''
+        XML файл - заглушка тех обслуживания (проверяется после close())
+        '''
+        return self.root is not None and self.root.text == TECH_SERVICE_TEXT
+
+    def close(self) -> Iterator[etree._Element]:
+        '''
+        Завершает разбор (ошибка XMLSyntaxError, если документ не полный)
+        и отдаёт оставшиеся элементы
+        '''
+        root = self._parser.close()
+
+        if self.root is None:
+            self.root = root
+
+        return self._read_items()
+
+
+def iter_xml_chunks(xml_file: str | bytes | IO[bytes],
+                    chunk_size: int = XML_CHUNK_SIZE) -> Iterator[bytes]:
+    '''
+    Разбивает XML (строка, байты или открытый в 'rb' файл)
+    на куски для потокового разбора
+    '''
+    if isinstance(xml_file, str):
+        xml_file = xml_file.encode()
+
+    if isinstance(xml_file, (bytes, bytearray)):
+        for start in range(0, len(xml_file), chunk_size):
+            yield xml_file[start:start + chunk_size]
+    else:
+        while chunk := xml_file.read(chunk_size):
+            yield chunk
+
+
+def iter_xml_items(xml_file: str | bytes | IO[bytes] | Iterable[bytes],
+                   stream: XmlItemStream | None = None) -> Iterator[etree._Element]:
+    '''
+    Отдаёт элементы <item> из XML источника по одному
+    '''
+    if stream is None:
+        stream = XmlItemStream()
+
+    if isinstance(xml_file, (str, bytes, bytearray)) or hasattr(xml_file, 'read'):
+        chunks = iter_xml_chunks(xml_file)
+    else:
+        chunks = xml_file
+
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+
+    yield from stream.close()
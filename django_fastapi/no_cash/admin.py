@@ -41,6 +41,7 @@ from general_models.admin import (BaseCommentAdmin,
                                   NewBaseExchangeLinkCountAdmin,
                                   NewBaseDirectionAdmin)
 from general_models.tasks import parse_reviews_for_exchange
+from general_models.utils.cache import bump_directions_version
 
 
 #Отображение комментариев в админ панели
@@ -241,6 +242,8 @@ class NewDirectionAdmin(NewBaseDirectionAdmin):
                 try:
                     NewDirection.objects.bulk_create(create_list,
                                                      ignore_conflicts=True)
+                    # bulk_create не вызывает сигналы
+                    bump_directions_version()
                     self.message_user(request, "Направления успешно созданы")
                 except Exception as ex:
                     print(ex)
@@ -10,6 +10,7 @@ from general_models.utils.endpoints import (new_get_exchange_direction_list_with
                                             new_increase_popular_count_direction,
                                             new_check_valute_on_cash)
 from general_models.utils.base import annotate_string_field
+from general_models.utils.direction_expiry import get_not_expired_filter
 
 from cash.endpoints import (cash_exchange_directions_with_location,
                             test_cash_exchange_directions_with_location)
@@ -113,7 +114,8 @@ def no_cash_valutes(request: Request,
     queries = NewExchangeDirection.objects\
                                 .select_related('exchange',
                                                 'direction')\
-                                .filter(is_active=True,
+                                .filter(get_not_expired_filter(),
+                                        is_active=True,
                                         exchange__is_active=True)
 
     partner_queries = NewNonCashDirection.objects\
@@ -163,7 +165,8 @@ def no_cash_exchange_directions(request: Request,
                                                 'direction__valute_from',
                                                 'direction__valute_to')\
                                 .annotate(direction_marker=annotate_string_field('auto_noncash'))\
-                                .filter(direction__valute_from=valute_from,
+                                .filter(get_not_expired_filter(),
+                                        direction__valute_from=valute_from,
                                         direction__valute_to=valute_to,
                                         is_active=True,
                                         exchange__is_active=True)\
@@ -211,7 +214,8 @@ def test_no_cash_exchange_directions(request: Request,
                                                 'direction__valute_from',
                                                 'direction__valute_to')\
                                 .annotate(direction_marker=annotate_string_field('auto_noncash'))\
-                                .filter(direction__valute_from=valute_from,
+                                .filter(get_not_expired_filter(),
+                                        direction__valute_from=valute_from,
                                         direction__valute_to=valute_to,
                                         is_active=True,
                                         exchange__is_active=True)\
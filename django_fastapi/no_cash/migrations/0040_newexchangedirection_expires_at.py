@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('no_cash', '0039_alter_exchangedirection_max_amount_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newexchangedirection',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True, verbose_name='Активно до'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('no_cash', '0040_newexchangedirection_expires_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newexchangelinkcount',
+            name='exchange_direction',
+            field=models.ForeignKey(db_constraint=False, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exchange_direction_counts', to='no_cash.newexchangedirection', verbose_name='Готовое направление'),
+        ),
+    ]
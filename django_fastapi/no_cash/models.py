@@ -138,7 +138,12 @@ class NewExchangeDirection(BaseExchangeDirection):
                                   blank=True,
                                   null=True,
                                   related_name='exchange_directions')
-    
+    expires_at = models.DateTimeField('Активно до',
+                                      blank=True,
+                                      null=True,
+                                      default=None,
+                                      db_index=True)
+
     class Meta:
         unique_together = (("exchange", "direction"), )
         verbose_name = 'Готовое направление (новое)'
@@ -186,10 +191,13 @@ class NewExchangeLinkCount(NewBaseExchangeLinkCount):
                              on_delete=models.CASCADE,
                              verbose_name='Гостевой пользователь',
                              related_name='new_no_cash_exchange_counts')
+    # без внешнего ключа в БД - таблица направлений может быть
+    # секционирована (partition_exchange_directions), SET_NULL выполняет Django
     exchange_direction = models.ForeignKey(NewExchangeDirection,
                                            on_delete=models.SET_NULL,
                                            verbose_name='Готовое направление',
                                            related_name='exchange_direction_counts',
                                            null=True,
-                                           default=None)
+                                           default=None,
+                                           db_constraint=False)
     
\ No newline at end of file
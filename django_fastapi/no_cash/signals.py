@@ -10,6 +10,7 @@ from django_celery_beat.models import PeriodicTask
 from general_models.models import ExchangeAdmin
 from general_models.utils.endpoints import send_review_notifitation_to_exchange_admin
 from general_models.utils.base import get_actual_datetime
+from general_models.utils.cache import bump_directions_version
 
 from .models import (Exchange,
                      Direction,
@@ -29,6 +30,14 @@ from .periodic_tasks import (manage_periodic_task_for_create,
 #     direction_list.delete()
 
 
+#Сигнал для смены версии справочника направлений,
+#по которому парсятся XML файлы обменников
+@receiver(post_save, sender=NewDirection)
+@receiver(post_delete, sender=NewDirection)
+def change_directions_version(sender, instance, **kwargs):
+    bump_directions_version()
+
+
 #Сигнал для попытке создания обратного направления
 #при создании направления в БД
 @receiver(post_save, sender=Direction)
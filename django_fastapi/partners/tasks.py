@@ -13,6 +13,7 @@ from django.utils import timezone
 from asgiref.sync import async_to_sync
 
 from general_models.utils.base import get_timedelta, get_valid_active_direction_str
+from general_models.utils.direction_expiry import deactivate_by_chunks
 
 from general_models.models import ExchangeAdmin, NewExchangeAdmin, Exchanger
 
@@ -88,24 +89,20 @@ def check_update_time_for_directions():
     
     # new
     check_time = timezone.now() - time_delta
+
+    # деактивируются только ещё активные направления, пачками по pk,
+    # без одного большого UPDATE по всей таблице
+    deactivate_by_chunks(partner_models.NewDirection.objects\
+                                                    .filter(time_update__lt=check_time))
     
-    with transaction.atomic():
-        partner_models.NewDirection.objects\
-                        .filter(time_update__lt=check_time)\
-                        .update(is_active=False)
-        
-        country_directions = partner_models.NewCountryDirection.objects\
-                        .filter(time_update__lt=check_time)\
-                        # .update(is_active=False)
-        country_direction_pks = list(country_directions.values_list('pk', flat=True))
-        country_directions.update(is_active=False)
-        
-        if country_direction_pks:
-            update_related_directions_by_country_directions.delay(country_direction_pks)
-        
-        partner_models.NewNonCashDirection.objects\
-                        .filter(time_update__lt=check_time)\
-                        .update(is_active=False)
+    country_direction_pks = deactivate_by_chunks(partner_models.NewCountryDirection.objects\
+                                                                        .filter(time_update__lt=check_time))
+    
+    if country_direction_pks:
+        update_related_directions_by_country_directions.delay(country_direction_pks)
+    
+    deactivate_by_chunks(partner_models.NewNonCashDirection.objects\
+                                                        .filter(time_update__lt=check_time))
 
 
 # @shared_task(name='exchange_admin_notifications')
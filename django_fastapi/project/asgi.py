@@ -12,7 +12,7 @@ apps.populate(settings.INSTALLED_APPS)
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.wsgi import WSGIMiddleware
 from starlette.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 
 from general_models.endpoints import common_router, review_router, test_router
 
@@ -23,6 +23,7 @@ from partners.endpoints import partner_router, test_partner_router
 
 from general_models.utils.http_exc import (CustomJSONException,
                                            my_json_exception_handle)
+from general_models.utils.metrics import get_metrics
 
 from general_models.api.v1 import api_router as api_v1_router
 from general_models.api.v2 import api_router as api_v2_router
@@ -91,6 +92,14 @@ def get_application() -> FastAPI:
         """
         return HTMLResponse(html)
 
+    # метрики Prometheus API, воркеров Celery и run_xml_fetcher
+    @app.get('/metrics', include_in_schema=False)
+    def metrics():
+        content, content_type = get_metrics()
+
+        return Response(content=content,
+                        media_type=content_type)
+
     app.mount(settings.DJANGO_PREFIX, WSGIMiddleware(get_wsgi_application()))
 
     return app
@@ -3,7 +3,7 @@ import os
 from celery import Celery
 from kombu import Queue
 
-from config import REDIS_URL
+from config import REDIS_URL, XML_SHARD_NAME, XML_SHARD_PARSE_AFFINITY
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
@@ -26,7 +26,28 @@ app.conf.broker_transport_options = {'visibility_timeout': 1800}
 app.autodiscover_tasks()
 
 
-# app.conf.task_queues = (
-#     Queue('cpu_queue'),       # очередь для CPU-задач
-#     Queue('io_queue'),      # очередь для I/O задач
-# )
\ No newline at end of file
+# очереди парсинга XML файлов (полосы, general_models/utils/ingest_lanes.py)
+CPU_QUEUES = (
+    'cpu_queue',            # обычная полоса
+    'cpu_priority_queue',   # приоритетная полоса (VIP и популярные обменники)
+)
+
+# при привязке парсинга к шарду у каждого узла свои очереди полос
+# (<очередь>.<шард>, general_models/utils/sharding.py)
+SHARD_QUEUES = tuple(f'{queue}.{XML_SHARD_NAME}' for queue in CPU_QUEUES)\
+    if XML_SHARD_PARSE_AFFINITY and XML_SHARD_NAME else ()
+
+app.conf.task_queues = (
+    Queue('celery'),        # задачи без очереди
+    *(Queue(queue) for queue in CPU_QUEUES),       # очереди для CPU-задач
+    *(Queue(queue) for queue in SHARD_QUEUES),
+    Queue('io_queue'),      # очередь для I/O задач
+)
+
+# полосу задачи парсинга выбирает обход (apply_async(queue=...)),
+# без явной очереди задачи парсинга идут в обычную полосу
+app.conf.task_routes = {
+    'parse_xml_for_exchanger': {'queue': 'cpu_queue'},
+    'parse_xml_batch_for_exchangers': {'queue': 'cpu_queue'},
+    'get_xml_file_for_exchangers': {'queue': 'io_queue'},
+}